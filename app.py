@@ -1,17 +1,61 @@
 from flask import (
-    Flask, render_template, request, redirect, url_for, session, send_file, jsonify, flash
+    Flask, Request, Response, render_template, request, redirect, url_for, session, send_file,
+    jsonify, flash
 )
-import requests
-from docxtpl import DocxTemplate, InlineImage
-from docx.shared import Mm
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.serving import run_simple
+from jinja2 import Environment
+import click
 from datetime import date, datetime
-from staticmap import StaticMap, CircleMarker
-from github import Github
-import base64
 import os, json
+import threading
+import time
+import uuid
+import math
+import hashlib
+import shutil
+import tempfile
+import gzip
+import bisect
+import csv
+import io
+import zipfile
+import glob
+import re
+import random
+import unicodedata
+import multiprocessing
+try:
+    import fcntl  # travas entre processos (Linux/macOS)
+except ImportError:
+    fcntl = None
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
+from collections import Counter, OrderedDict
+from urllib.parse import urlsplit
 
-# Lista em memória para armazenar alertas emitidos
-alertas_enviados = []
+# ==========================================================
+# IMPORTS SOB DEMANDA
+# ==========================================================
+# docxtpl/python-docx/Pillow (laudo_render.py), staticmap (mapa_estatico.py),
+# PyGithub (github_sync.py), requests (whatsapp.py e as sessões abaixo) e
+# Flask-SQLAlchemy (banco.py) só são importados no primeiro uso: a subida do
+# worker, /login e /home não pagam por eles. "flask medir-inicio" mede a subida e confere o orçamento.
+MODULOS_PESADOS = ("docxtpl", "docx", "PIL", "staticmap", "github", "requests", "flask_sqlalchemy")
+IMPORT_ORCAMENTO_MS = int(os.environ.get("IMPORT_ORCAMENTO_MS", 400))
+
+_sessoes_http = {}
+_sessoes_http_lock = threading.Lock()
+
+def sessao_http(nome, **cabecalhos):
+    """requests.Session por finalidade ("tiles", "downloads"), criada no primeiro uso."""
+    with _sessoes_http_lock:
+        sessao = _sessoes_http.get(nome)
+        if sessao is None:
+            import requests
+            sessao = _sessoes_http[nome] = requests.Session()
+            sessao.headers.update(cabecalhos)
+        return sessao
 
 # ==========================================================
 # CONFIG BÁSICA
@@ -24,6 +68,12 @@ app.secret_key = "DC_g&rad0r"
 WHATSAPP_TOKEN = os.environ.get("WHATSAPP_TOKEN", "SEU_TOKEN_AQUI")
 WHATSAPP_PHONE_NUMBER_ID = os.environ.get("WHATSAPP_PHONE_NUMBER_ID", "SEU_PHONE_NUMBER_ID")
 WHATSAPP_API_VERSION = "v21.0"  # ou a versão que você estiver usando
+# URL do endpoint de mensagens (em teste, apontar para o mock: flask whatsapp-mock)
+WHATSAPP_API_URL = os.environ.get("WHATSAPP_API_URL") or \
+    f"https://graph.facebook.com/{WHATSAPP_API_VERSION}/{WHATSAPP_PHONE_NUMBER_ID}/messages"
+WHATSAPP_CONCORRENCIA = int(os.environ.get("WHATSAPP_CONCORRENCIA", 8))   # envios simultâneos
+WHATSAPP_TAXA = float(os.environ.get("WHATSAPP_TAXA", 20))               # mensagens por segundo
+WHATSAPP_TENTATIVAS = int(os.environ.get("WHATSAPP_TENTATIVAS", 5))      # por destinatário
 
 # Arquivo com a lista de números que receberão os alertas
 DATA_DIR = "data"
@@ -32,13 +82,327 @@ TELEFONES_ALERTA_FILE = os.path.join(DATA_DIR, "telefones_alerta.json")
 
 # Paths efêmeros (Render permite /tmp com escrita)
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-TMP_DIR = "/tmp"
+TMP_DIR = os.environ.get("LAUDOS_TMP_DIR", "/tmp")
 UPLOAD_FOLDER = os.path.join(TMP_DIR, "uploads")
 DATA_DIR = TMP_DIR  # manter o json no /tmp
 DATA_FILE = os.path.join(DATA_DIR, "atendimentos.json")
+DATA_JOURNAL_FILE = os.path.join(DATA_DIR, "atendimentos.journal.jsonl")
+JOURNAL_COMPACTAR_A_CADA = int(os.environ.get("JOURNAL_COMPACTAR_A_CADA", 200))
+EVENTOS_FILE = os.path.join(DATA_DIR, "eventos.json")
+ALERTAS_FILE = os.path.join(DATA_DIR, "alertas.jsonl")  # histórico de alertas (só acrescenta)
+
+# Armazenamento: "json" (snapshot + journal em /tmp) ou "sqlite" (SQLAlchemy)
+ARMAZENAMENTO = os.environ.get("ARMAZENAMENTO", "json").lower()
+USAR_SQLITE = ARMAZENAMENTO == "sqlite"
+DATABASE_URL = os.environ.get("DATABASE_URL", f"sqlite:///{os.path.join(TMP_DIR, 'laudos.db')}")
+
+OUTBOX_DIR = os.path.join(TMP_DIR, "outbox")  # fila de envios pendentes ao GitHub
+TILE_CACHE_DIR = os.path.join(TMP_DIR, "tiles")  # cache de tiles do mapa ({z}/{x}/{y}.png)
+MAPA_CACHE_DIR = os.path.join(TMP_DIR, "mapas")  # mapas já renderizados (PNG por coordenada)
+DOWNLOAD_CACHE_DIR = os.path.join(TMP_DIR, "downloads")  # DOCX baixados do GitHub para servir de novo
+DOWNLOAD_CACHE_MAX_MB = int(os.environ.get("DOWNLOAD_CACHE_MAX_MB", 300))
+JOBS_DIR = os.path.join(TMP_DIR, "jobs")  # status dos laudos em renderização
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+FOTOS_DIR = os.path.join(UPLOAD_FOLDER, "fotos")  # fotos recebidas, uma cópia por conteúdo (sha256)
+UPLOAD_PARTES_DIR = os.path.join(UPLOAD_FOLDER, "partes")  # uploads ainda em recebimento
+UPLOAD_MAX_ARQUIVO_MB = int(os.environ.get("UPLOAD_MAX_ARQUIVO_MB", 15))
+UPLOAD_MAX_REQUISICAO_MB = int(os.environ.get("UPLOAD_MAX_REQUISICAO_MB", 60))
+LOTE_MAX_REQUISICAO_MB = int(os.environ.get("LOTE_MAX_REQUISICAO_MB", 500))  # planilha + fotos de /laudos/lote
+
+# Fotos do laudo: entram no DOCX com 100 mm de largura
+FOTO_LARGURA_MM = 100
+FOTO_DPI = int(os.environ.get("FOTO_DPI", 200))
+FOTO_QUALIDADE = int(os.environ.get("FOTO_QUALIDADE", 82))
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(DATA_DIR, exist_ok=True)
+os.makedirs(OUTBOX_DIR, exist_ok=True)
+os.makedirs(JOBS_DIR, exist_ok=True)
+os.makedirs(FOTOS_DIR, exist_ok=True)
+os.makedirs(UPLOAD_PARTES_DIR, exist_ok=True)
+
+# ==========================================================
+# TRAVAS ENTRE PROCESSOS
+# ==========================================================
+# Com vários workers (gunicorn) cada processo tem a sua memória, mas todos
+# gravam nos mesmos arquivos do /tmp. Toda mutação de store passa por uma
+# TravaProcesso: RLock para as threads + flock num arquivo .lock para os
+# outros processos. O flock é sempre pedido sem bloquear (LOCK_NB) e, se outro
+# processo o tem, a espera é feita com time.sleep: num worker gevent o sleep
+# é cooperativo e os outros greenlets (streams SSE, requisições) seguem
+# rodando, em vez de a thread inteira parar dentro do flock.
+TRAVA_ESPERA_MAX = 0.05  # s entre tentativas de flock (começa em 1 ms e dobra)
+
+class TravaProcesso:
+    """Trava reentrante entre threads e processos (flock em 'caminho')."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._lock = threading.RLock()
+        self._nivel = 0
+        self._fd = None
+
+    def acquire(self, blocking=True):
+        if not self._lock.acquire(blocking):
+            return False
+        if self._nivel == 0 and fcntl is not None:
+            fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o644)
+            espera = 0.001
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if blocking:
+                        time.sleep(espera)
+                        espera = min(espera * 2, TRAVA_ESPERA_MAX)
+                        continue
+                except OSError:
+                    pass
+                os.close(fd)
+                self._lock.release()
+                return False
+            self._fd = fd
+        self._nivel += 1
+        return True
+
+    def release(self):
+        self._nivel -= 1
+        if self._nivel == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+# ==========================================================
+# GRAVAÇÃO ATÔMICA E SNAPSHOTS VERIFICADOS
+# ==========================================================
+# Nenhum store é gravado direto no destino: temp no mesmo diretório + fsync +
+# rename. Os snapshots JSON ganham um "<arquivo>.sha256" com o hash do
+# conteúdo, a quantidade de registros e quantos registros o GitHub tinha na
+# última vez que conferimos (base para recusar um envio que encolhe demais).
+SNAPSHOT_QUEDA_MAX = float(os.environ.get("SNAPSHOT_QUEDA_MAX", 0.2))  # fração tolerada sem exclusões
+
+def gravar_atomico(caminho, dados):
+    """Grava bytes em 'caminho' via arquivo temporário + fsync + rename."""
+    pasta = os.path.dirname(caminho) or "."
+    fd, tmp = tempfile.mkstemp(dir=pasta, prefix=os.path.basename(caminho) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dados)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, caminho)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    try:
+        fd_pasta = os.open(pasta, os.O_RDONLY)
+        try:
+            os.fsync(fd_pasta)  # o rename também precisa chegar ao disco
+        finally:
+            os.close(fd_pasta)
+    except OSError:
+        pass
+
+def anexar_sincronizado(caminho, dados):
+    """Acrescenta bytes ao fim do arquivo e faz fsync. Retorna o offset onde gravou."""
+    with open(caminho, "ab") as f:
+        offset = f.seek(0, os.SEEK_END)
+        f.write(dados)
+        f.flush()
+        os.fsync(f.fileno())
+    return offset
+
+def _ler_checksum(caminho):
+    try:
+        with open(caminho + ".sha256", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return meta if isinstance(meta, dict) else None
+    except (OSError, ValueError):
+        return None
+
+def gravar_json_verificado(caminho, lista, registros_github=None):
+    """
+    Grava a lista como JSON (mesmo formato de sempre) e atualiza o .sha256.
+    O .sha256 vai primeiro e guarda também o hash anterior, então uma queda
+    entre os dois renames deixa o arquivo antigo ainda válido.
+    """
+    dados = json.dumps(lista, ensure_ascii=False, indent=2).encode("utf-8")
+    meta = _ler_checksum(caminho) or {}
+    if registros_github is not None:
+        meta["registros_github"] = registros_github
+    meta.update(
+        anterior=meta.get("sha256"),
+        sha256=hashlib.sha256(dados).hexdigest(),
+        registros=len(lista),
+    )
+    gravar_atomico(caminho + ".sha256", json.dumps(meta).encode("utf-8"))
+    gravar_atomico(caminho, dados)
+
+def ler_json_verificado(caminho):
+    """
+    Lê um JSON gravado por gravar_json_verificado. FileNotFoundError se não
+    existir; ValueError se o conteúdo não bater com o .sha256 ou não for JSON.
+    Arquivos antigos, sem .sha256, são aceitos como estão.
+    """
+    with open(caminho, "rb") as f:
+        dados = f.read()
+    meta = _ler_checksum(caminho)
+    if meta and hashlib.sha256(dados).hexdigest() not in (meta.get("sha256"), meta.get("anterior")):
+        raise ValueError("checksum não confere")
+    return json.loads(dados) if dados.strip() else []
+
+def separar_corrompido(caminho):
+    """Tira o arquivo corrompido do caminho (fica como .corrompido para análise)."""
+    try:
+        os.replace(caminho, f"{caminho}.corrompido")
+    except OSError:
+        pass
+
+def registros_github_conhecidos(caminho):
+    """Quantos registros o GitHub tinha na última sincronização conhecida (ou None)."""
+    return (_ler_checksum(caminho) or {}).get("registros_github")
+
+def registros_no_github(remote_path):
+    """Quantos registros tem o JSON (lista) no GitHub; None se não deu para ler."""
+    texto = ler_github_texto(remote_path)
+    if texto is None:
+        return None
+    try:
+        return len(json.loads(texto)) if texto.strip() else 0
+    except ValueError:
+        return None  # JSON remoto ilegível: tratado como desconhecido
+
+def atualizar_checksum(caminho, **campos):
+    """Atualiza campos do .sha256 sem regravar o arquivo (só se o .sha256 já existir)."""
+    meta = _ler_checksum(caminho)
+    if meta is None:
+        return False
+    meta.update(campos)
+    gravar_atomico(caminho + ".sha256", json.dumps(meta).encode("utf-8"))
+    return True
+
+def queda_suspeita(anterior, novo, removidos=0):
+    """True se 'novo' encolheu além de SNAPSHOT_QUEDA_MAX sem exclusões que expliquem."""
+    if not anterior:
+        return False
+    return novo < (anterior - removidos) * (1 - SNAPSHOT_QUEDA_MAX)
+
+# ==========================================================
+# CONFIG MAPA
+# ==========================================================
+# TILE_SOURCE pode ser um template de URL ({z}/{x}/{y}) ou uma pasta local
+# com a mesma estrutura (ex.: tiles exportados de um servidor próprio).
+TILE_SOURCE = os.environ.get("TILE_SOURCE", "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
+TILE_CACHE_MAX_MB = int(os.environ.get("TILE_CACHE_MAX_MB", 200))
+MAPA_OFFLINE = os.environ.get("MAPA_OFFLINE", "").lower() in ("1", "true", "sim")
+MAPA_ZOOM = 16
+MAPA_LARGURA, MAPA_ALTURA = 600, 400
+MAPA_PRECISAO = int(os.environ.get("MAPA_PRECISAO", 5))  # casas decimais (5 ≈ 1 m)
+MAPA_CACHE_MAX_MB = int(os.environ.get("MAPA_CACHE_MAX_MB", 50))
+# Área urbana de Cuiabá (lon_min, lat_min, lon_max, lat_max) para pré-carga de tiles
+CUIABA_BBOX = (-56.16, -15.70, -55.95, -15.49)
+
+# ==========================================================
+# UPLOAD DE FOTOS (streaming para o disco, com limites e dedup)
+# ==========================================================
+# Uma foto em FOTOS_DIR pode servir a vários jobs ao mesmo tempo (dedup por
+# sha256). Cada job marca a foto com <foto>.<dono>.ref ao guardá-la e só a
+# desmarca na limpeza; a foto sai quando não resta marca. Guardar e limpar
+# rodam sob _fotos_lock para a marca nova nunca chegar depois da remoção.
+_fotos_lock = TravaProcesso(os.path.join(FOTOS_DIR, ".lock"))
+
+def _referenciar_foto(caminho, dono):
+    open(f"{caminho}.{dono}.ref", "a").close()
+
+class ArquivoUploadEmDisco:
+    """
+    Destino de um arquivo do multipart: grava cada bloco direto no disco,
+    calcula o sha256 enquanto grava e corta o upload acima do limite.
+    """
+
+    def __init__(self, diretorio, limite):
+        fd, self.caminho = tempfile.mkstemp(dir=diretorio, suffix=".part")
+        self._f = os.fdopen(fd, "w+b")
+        self._hash = hashlib.sha256()
+        self.tamanho = 0
+        self.limite = limite
+
+    def write(self, dados):
+        self.tamanho += len(dados)
+        if self.tamanho > self.limite:
+            raise RequestEntityTooLarge(
+                f"Foto acima do limite de {self.limite // (1024 * 1024)} MB."
+            )
+        self._hash.update(dados)
+        return self._f.write(dados)
+
+    def __getattr__(self, nome):
+        return getattr(self._f, nome)
+
+    def guardar_deduplicado(self, diretorio, extensao, dono):
+        """
+        Move o upload para <sha256><extensao> (se o conteúdo já existe, descarta
+        a cópia) e marca o arquivo como usado por 'dono'.
+        """
+        self._f.close()
+        destino = os.path.join(diretorio, self._hash.hexdigest() + extensao)
+        with _fotos_lock:
+            if os.path.exists(destino):
+                os.remove(self.caminho)
+            else:
+                os.replace(self.caminho, destino)
+            _referenciar_foto(destino, dono)
+        self.caminho = None
+        return destino
+
+    def guardar_exclusivo(self, diretorio, extensao):
+        """Move o upload para um nome só dele (sem dedup): quem o apagar não afeta outra requisição."""
+        self._f.close()
+        destino = os.path.join(diretorio, f"{self._hash.hexdigest()}.{uuid.uuid4().hex[:8]}{extensao}")
+        os.replace(self.caminho, destino)
+        self.caminho = None
+        return destino
+
+    def close(self):
+        self._f.close()
+        if self.caminho and os.path.exists(self.caminho):
+            os.remove(self.caminho)
+        self.caminho = None
+
+class RequestUploadEmDisco(Request):
+    """Request que recebe os arquivos do formulário direto em UPLOAD_PARTES_DIR."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        arquivo = ArquivoUploadEmDisco(UPLOAD_PARTES_DIR, UPLOAD_MAX_ARQUIVO_MB * 1024 * 1024)
+        if not hasattr(self, "_uploads_em_disco"):
+            self._uploads_em_disco = []
+        self._uploads_em_disco.append(arquivo)
+        return arquivo
+
+    def close(self):
+        super().close()
+        # inclui partes de um upload interrompido (não chegam a request.files)
+        for arquivo in getattr(self, "_uploads_em_disco", []):
+            arquivo.close()
+
+app.request_class = RequestUploadEmDisco
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_REQUISICAO_MB * 1024 * 1024
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_grande_demais(e):
+    return f"⚠️ Envio muito grande: {e.description}", 413
 
 # ==========================================================
 # CONFIG GITHUB
@@ -47,47 +411,97 @@ os.makedirs(DATA_DIR, exist_ok=True)
 GITHUB_REPO = "jpauloasx/gerador-laudos"
 GITHUB_BRANCH = "main"
 GITHUB_UPLOADS_PATH = "uploads"  # pasta no repo para DOCX
-GITHUB_DATA_PATH = "data/atendimentos.json"  # histórico no repo
+GITHUB_DATA_PATH = "data/atendimentos.json"  # histórico no repo (snapshot)
+GITHUB_JOURNAL_PATH = "data/atendimentos.journal.jsonl"  # operações desde o último snapshot
+GITHUB_SYNC_INTERVALO = float(os.environ.get("GITHUB_SYNC_INTERVALO", 5))  # s para acumular envios
+GITHUB_SYNC_LOTE = int(os.environ.get("GITHUB_SYNC_LOTE", 50))  # máx. de pendências por commit
+GITHUB_POOL_SIZE = int(os.environ.get("GITHUB_POOL_SIZE", 4))  # conexões keep-alive do cliente
+REMOTO_VAZIO_TTL = int(os.environ.get("REMOTO_VAZIO_TTL", 600))  # s sem rebuscar um arquivo vazio/inexistente
+GITHUB_RETENTAR_LEITURA = int(os.environ.get("GITHUB_RETENTAR_LEITURA", 30))  # s até reler após falha
+
+# Cliente único por processo: o objeto Github mantém uma sessão HTTP
+# keep-alive, então reaproveitá-lo evita novo handshake e novo get_repo.
+_github_lock = threading.Lock()
+_github_cliente = {"token": None, "repo": None}
+_shas_github = {}  # remote_path -> sha do arquivo no GitHub (branch GITHUB_BRANCH)
+# remote_path -> time.monotonic() da última vez que o GitHub respondeu que o
+# arquivo não existe ou está vazio (falha de rede/token não entra aqui)
+_remoto_vazio = {}
 
 def _get_github():
     token = os.getenv("GITHUB_TOKEN")
     if not token:
         print("⚠️  GITHUB_TOKEN ausente. Subida para GitHub será ignorada.")
         return None
-    try:
-        gh = Github(token)
-        repo = gh.get_repo(GITHUB_REPO)
+    with _github_lock:
+        if _github_cliente["repo"] is not None and _github_cliente["token"] == token:
+            return _github_cliente["repo"]
+        try:
+            import github_sync
+            repo = github_sync.conectar(token, GITHUB_REPO, GITHUB_POOL_SIZE)
+        except Exception as e:
+            print(f"❌ Erro ao autenticar no GitHub: {e}")
+            return None
+        if _github_cliente["token"] is not None:
+            print("🔑 GITHUB_TOKEN alterado, cliente do GitHub recriado.")
+        _github_cliente.update(token=token, repo=repo)
+        _shas_github.clear()
         return repo
-    except Exception as e:
-        print(f"❌ Erro ao autenticar no GitHub: {e}")
-        return None
+
+def _lembrar_sha(remote_path, sha):
+    if sha:
+        _shas_github[remote_path] = sha
+        _remoto_vazio.pop(remote_path, None)
+
+def remoto_vazio_recente(remote_path):
+    """True se há menos de REMOTO_VAZIO_TTL s o GitHub confirmou o arquivo vazio ou inexistente."""
+    quando = _remoto_vazio.get(remote_path)
+    return quando is not None and time.monotonic() - quando < REMOTO_VAZIO_TTL
 
 def upload_or_update_github_file(repo, remote_path, binary_content, message):
     """
     Cria/atualiza um arquivo no GitHub (branch main) com conteúdo binário (bytes).
+    Usa o sha em cache para atualizar sem buscar o arquivo antes.
     """
     if not repo:
         return False
     try:
-        # Tenta buscar o arquivo para decidir se cria ou atualiza
-        try:
-            file = repo.get_contents(remote_path, ref=GITHUB_BRANCH)
-            repo.update_file(
-                path=file.path,
-                message=message,
-                content=binary_content,
-                sha=file.sha,
-                branch=GITHUB_BRANCH
-            )
-            print(f"♻️ Atualizado no GitHub: {remote_path}")
-        except Exception:
-            repo.create_file(
-                path=remote_path,
-                message=message,
-                content=binary_content,
-                branch=GITHUB_BRANCH
-            )
-            print(f"📤 Criado no GitHub: {remote_path}")
+        sha = _shas_github.get(remote_path)
+        resultado = None
+        if sha:
+            try:
+                resultado = repo.update_file(
+                    path=remote_path,
+                    message=message,
+                    content=binary_content,
+                    sha=sha,
+                    branch=GITHUB_BRANCH
+                )
+                print(f"♻️ Atualizado no GitHub: {remote_path}")
+            except Exception:
+                # sha desatualizado (alguém mexeu no arquivo): cai no fluxo completo
+                _shas_github.pop(remote_path, None)
+        if resultado is None:
+            # Tenta buscar o arquivo para decidir se cria ou atualiza
+            try:
+                file = repo.get_contents(remote_path, ref=GITHUB_BRANCH)
+                resultado = repo.update_file(
+                    path=file.path,
+                    message=message,
+                    content=binary_content,
+                    sha=file.sha,
+                    branch=GITHUB_BRANCH
+                )
+                print(f"♻️ Atualizado no GitHub: {remote_path}")
+            except Exception:
+                resultado = repo.create_file(
+                    path=remote_path,
+                    message=message,
+                    content=binary_content,
+                    branch=GITHUB_BRANCH
+                )
+                print(f"📤 Criado no GitHub: {remote_path}")
+        _lembrar_sha(remote_path, resultado["content"].sha)
         return True
     except Exception as e:
         print(f"❌ Falha ao enviar {remote_path} para GitHub: {e}")
@@ -96,18 +510,212 @@ def upload_or_update_github_file(repo, remote_path, binary_content, message):
 def fetch_github_json(remote_path):
     """
     Busca um JSON no GitHub e retorna o objeto (lista/dict).
-    Se não existir, retorna [].
+    Se não existir, retorna [] (e não busca de novo por REMOTO_VAZIO_TTL s).
+    """
+    texto = fetch_github_texto(remote_path)
+    try:
+        return json.loads(texto) if texto.strip() else []
+    except ValueError as e:
+        print(f"⚠️  JSON inválido em {remote_path} no GitHub: {e}")
+        return []
+
+# ==========================================================
+# FILA DE SINCRONIZAÇÃO COM O GITHUB (outbox + worker)
+# ==========================================================
+# Cada envio vira um par de arquivos em OUTBOX_DIR: o conteúdo (.bin) e os
+# metadados (.json), gravado por último. O worker junta as pendências em um
+# único commit via Git Data API (blobs -> tree -> commit -> ref). Para o mesmo
+# caminho remoto só a versão mais nova é enviada (ex.: atendimentos.json).
+_evento_outbox = threading.Event()
+_worker_github_lock = threading.Lock()
+_worker_github = None
+
+def enfileirar_github_lote(arquivos, message):
+    """
+    Grava o envio na outbox local e acorda o worker. 'arquivos' é uma lista
+    de (remote_path, bytes ou caminho local) que saem no mesmo commit.
+    O .json da pendência é gravado por último: sem ele os .bin são ignorados.
+    Retorna True assim que a pendência estiver persistida em disco.
+    """
+    if not os.getenv("GITHUB_TOKEN"):
+        print("⚠️  GITHUB_TOKEN ausente. Subida para GitHub será ignorada.")
+        return False
+    try:
+        base = os.path.join(OUTBOX_DIR, f"{time.time_ns()}_{uuid.uuid4().hex[:8]}")
+        itens = []
+        for i, (remote_path, conteudo) in enumerate(arquivos):
+            if not isinstance(conteudo, (bytes, bytearray)):
+                with open(conteudo, "rb") as f:
+                    conteudo = f.read()
+            payload = f"{base}.bin" if i == 0 else f"{base}.{i}.bin"
+            gravar_atomico(payload, conteudo)
+            itens.append({"remote_path": remote_path, "payload": payload})
+        meta = {"message": message, "arquivos": itens}
+        gravar_atomico(base + ".json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+    except Exception as e:
+        print(f"❌ Erro ao gravar {len(arquivos)} arquivo(s) na outbox: {e}")
+        return False
+    _garantir_worker_github()
+    _evento_outbox.set()
+    if len(arquivos) == 1:
+        print(f"🕒 Na fila para o GitHub: {arquivos[0][0]}")
+    else:
+        print(f"🕒 Na fila para o GitHub: {len(arquivos)} arquivo(s) em um commit")
+    return True
+
+def enviar_ou_enfileirar_github(remote_path, binary_content, message):
+    """Enfileira o envio; se a outbox falhar, envia na hora (modo antigo)."""
+    return enviar_ou_enfileirar_github_lote([(remote_path, binary_content)], message)
+
+def enviar_ou_enfileirar_github_lote(arquivos, message):
+    """Enfileira os arquivos num commit só; se a outbox falhar, envia um a um."""
+    if enfileirar_github_lote(arquivos, message):
+        return True
+    if not os.getenv("GITHUB_TOKEN"):
+        return False
+    repo = _get_github()
+    ok = True
+    for remote_path, conteudo in arquivos:
+        if not isinstance(conteudo, (bytes, bytearray)):
+            with open(conteudo, "rb") as f:
+                conteudo = f.read()
+        ok = upload_or_update_github_file(repo, remote_path, conteudo, message) and ok
+    return ok
+
+def _pendencias_outbox():
+    """Lista as pendências da outbox em ordem de chegada."""
+    pendencias = []
+    for nome in sorted(os.listdir(OUTBOX_DIR)):
+        if not nome.endswith(".json"):
+            continue
+        caminho = os.path.join(OUTBOX_DIR, nome)
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception as e:
+            print(f"⚠️  Pendência ilegível na outbox ({nome}): {e}")
+            continue
+        if "arquivos" not in meta:  # pendência de um arquivo só (formato antigo)
+            meta["arquivos"] = [{"remote_path": meta["remote_path"], "payload": meta["payload"]}]
+        meta["meta_path"] = caminho
+        pendencias.append(meta)
+    return pendencias
+
+def _remover_pendencias(pendencias):
+    for p in pendencias:
+        for caminho in [p["meta_path"]] + [a["payload"] for a in p["arquivos"]]:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+def commit_lote_github(repo, pendencias):
     """
+    Envia um lote de pendências em um único commit na branch GITHUB_BRANCH.
+    Pendências repetidas para o mesmo caminho são reduzidas à mais recente.
+    """
+    mais_recentes = {}
+    for p in pendencias:
+        for a in p["arquivos"]:
+            mais_recentes[a["remote_path"]] = a  # a lista vem em ordem de chegada
+
+    mensagens = list(dict.fromkeys(p["message"] for p in pendencias))
+    if len(mensagens) == 1:
+        mensagem = mensagens[0]
+    else:
+        mensagem = f"Sincroniza {len(mais_recentes)} arquivo(s)\n\n" + "\n".join(f"- {m}" for m in mensagens)
+
+    import github_sync
+    commit_sha, shas = github_sync.commit_arquivos(
+        repo, GITHUB_BRANCH, {remote_path: a["payload"] for remote_path, a in mais_recentes.items()}, mensagem)
+    for remote_path, sha in shas.items():
+        _lembrar_sha(remote_path, sha)  # o sha do conteúdo é o sha do blob
+    print(f"📤 Commit {commit_sha[:7]} no GitHub com {len(mais_recentes)} arquivo(s)")
+    return commit_sha
+
+_outbox_lock = TravaProcesso(os.path.join(OUTBOX_DIR, ".lock"))
+
+def sincronizar_outbox():
+    """
+    Uma rodada do worker: até GITHUB_SYNC_LOTE pendências num commit só.
+    Retorna False se o envio falhou (as pendências ficam para a próxima) e
+    None se outro processo está esvaziando a outbox.
+    """
+    # um único processo esvazia a outbox por vez: dois workers commitando
+    # o mesmo lote poderiam deixar uma versão antiga por último no GitHub
+    if not _outbox_lock.acquire(blocking=False):
+        return None
+    try:
+        pendencias = _pendencias_outbox()[:GITHUB_SYNC_LOTE]
+        if not pendencias:
+            return True
+        try:
+            repo = _get_github()
+            if not repo:
+                raise RuntimeError("repositório indisponível")
+            commit_lote_github(repo, pendencias)
+        except Exception as e:
+            print(f"❌ Falha ao sincronizar outbox ({len(pendencias)} pendência(s)): {e}")
+            return False
+        _remover_pendencias(pendencias)
+        return True
+    finally:
+        _outbox_lock.release()
+
+def _loop_worker_github():
+    espera_erro = GITHUB_SYNC_INTERVALO
+    while True:
+        _evento_outbox.wait()
+        # pequena janela para acumular envios no mesmo commit
+        time.sleep(GITHUB_SYNC_INTERVALO)
+        _evento_outbox.clear()
+        enviado = sincronizar_outbox()
+        if enviado:
+            espera_erro = GITHUB_SYNC_INTERVALO
+        elif enviado is False:
+            time.sleep(espera_erro)
+            espera_erro = min(espera_erro * 2, 300)
+        if _pendencias_outbox():
+            _evento_outbox.set()
+
+def _garantir_worker_github():
+    """Sobe o worker da outbox (uma vez por processo)."""
+    global _worker_github
+    with _worker_github_lock:
+        if _worker_github is None or not _worker_github.is_alive():
+            _worker_github = threading.Thread(
+                target=_loop_worker_github, name="github-outbox", daemon=True
+            )
+            _worker_github.start()
+
+def ler_github_texto(remote_path):
+    """
+    Busca um arquivo texto no GitHub. Se não existir, retorna "".
+    Arquivo vazio/inexistente fica lembrado por REMOTO_VAZIO_TTL s.
+    Retorna None se não deu para ler (sem token, falha de rede...).
+    """
+    if remoto_vazio_recente(remote_path):
+        return ""
     repo = _get_github()
     if not repo:
-        return []
+        return None
+    import github_sync
     try:
-        file = repo.get_contents(remote_path, ref=GITHUB_BRANCH)
-        content = base64.b64decode(file.content).decode("utf-8")
-        return json.loads(content) if content.strip() else []
+        texto, sha = github_sync.ler_arquivo(repo, remote_path, GITHUB_BRANCH)
+        _lembrar_sha(remote_path, sha)
+    except github_sync.ArquivoInexistente:
+        print(f"ℹ️  {remote_path} ainda não existe no GitHub")
+        texto = ""
     except Exception as e:
         print(f"⚠️  Não foi possível ler {remote_path} do GitHub: {e}")
-        return []
+        return None
+    if not texto.strip() or texto.strip() == "[]":
+        _remoto_vazio[remote_path] = time.monotonic()
+    return texto
+
+def fetch_github_texto(remote_path):
+    """Como ler_github_texto, mas falha de leitura também vira ""."""
+    return ler_github_texto(remote_path) or ""
 
 def github_raw_url(remote_path):
     """
@@ -116,121 +724,1459 @@ def github_raw_url(remote_path):
     """
     return f"https://raw.githubusercontent.com/{GITHUB_REPO}/{GITHUB_BRANCH}/{remote_path}"
 
+# ==========================================================
+# CACHE EM DISCO (LRU por tamanho)
+# ==========================================================
+class CacheDiscoLRU:
+    """
+    Pasta de arquivos com limite de tamanho total, descartando os menos usados.
+    As chaves são caminhos relativos ("16/23450/34123.png"); o mtime de cada
+    arquivo guarda a ordem de uso, entre reinícios e entre processos.
+    O limite vale para a pasta, não por processo: o total fica em
+    <pasta>/.total, atualizado sob flock por quem grava, e quem passa do
+    limite relê a pasta e descarta os mais antigos até CACHE_FOLGA abaixo dele.
+    """
+    CACHE_FOLGA = 0.1  # fração liberada a cada limpeza (evita reler a pasta a cada gravação)
+
+    def __init__(self, diretorio, max_bytes):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._lru = None  # OrderedDict chave -> bytes, do menos para o mais usado
+        self._bytes = 0
+        os.makedirs(diretorio, exist_ok=True)
+        self._trava = TravaProcesso(os.path.join(diretorio, ".lock"))
+        self._arquivo_total = os.path.join(diretorio, ".total")
+
+    def caminho(self, chave):
+        return os.path.join(self.diretorio, *chave.split("/"))
+
+    def _carregar(self):
+        encontrados = []
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                if nome.endswith(".tmp") or nome.startswith("."):
+                    continue
+                caminho = os.path.join(raiz, nome)
+                try:
+                    st = os.stat(caminho)
+                except OSError:
+                    continue
+                chave = os.path.relpath(caminho, self.diretorio).replace(os.sep, "/")
+                encontrados.append((st.st_mtime, chave, st.st_size))
+        encontrados.sort()
+        self._lru = OrderedDict((chave, tam) for _, chave, tam in encontrados)
+        self._bytes = sum(self._lru.values())
+
+    def caminho_se_existir(self, chave):
+        """
+        Caminho do arquivo em cache (marcado como recém-usado) ou None.
+        Vale o disco: arquivo gravado por outro processo também conta, e um
+        descartado por outro processo deixa de contar.
+        """
+        with self._lock:
+            if self._lru is None:
+                self._carregar()
+        caminho = self.caminho(chave)
+        try:
+            os.utime(caminho)
+            tamanho = os.path.getsize(caminho)
+        except OSError:
+            with self._lock:
+                self._bytes -= self._lru.pop(chave, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self._bytes += tamanho - self._lru.pop(chave, 0)
+            self._lru[chave] = tamanho
+            self.hits += 1
+        return caminho
+
+    def obter(self, chave):
+        caminho = self.caminho_se_existir(chave)
+        if caminho is None:
+            return None
+        try:
+            with open(caminho, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def guardar(self, chave, dados):
+        """Grava bytes no cache e devolve o caminho final."""
+        tmp = f"{self.caminho(chave)}.{uuid.uuid4().hex[:8]}.tmp"
+        os.makedirs(os.path.dirname(tmp), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(dados)
+        return self.guardar_arquivo(chave, tmp)
+
+    def _ler_total(self):
+        try:
+            with open(self._arquivo_total, "r") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _limpar(self):
+        """Relê a pasta (ordem de uso = mtime) e descarta os mais antigos. Retorna o total."""
+        with self._lock:
+            self._carregar()
+            alvo = self.max_bytes * (1 - self.CACHE_FOLGA)
+            while self._bytes > alvo and len(self._lru) > 1:
+                antiga, tam = self._lru.popitem(last=False)
+                self._bytes -= tam
+                try:
+                    os.remove(self.caminho(antiga))
+                except OSError:
+                    pass
+            return self._bytes
+
+    def guardar_arquivo(self, chave, caminho_origem):
+        """Move um arquivo já gravado para dentro do cache."""
+        caminho = self.caminho(chave)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with self._trava:
+            with self._lock:
+                if self._lru is None:
+                    self._carregar()
+            try:
+                anterior = os.path.getsize(caminho)
+            except OSError:
+                anterior = 0
+            os.replace(caminho_origem, caminho)
+            tamanho = os.path.getsize(caminho)
+            with self._lock:
+                self._bytes += tamanho - self._lru.pop(chave, 0)
+                self._lru[chave] = tamanho
+            total = self._ler_total()
+            if total is not None:
+                total += tamanho - anterior
+            if total is None or total > self.max_bytes:
+                total = self._limpar()
+            # só uma estimativa entre limpezas: gravação simples (ilegível = relê a pasta)
+            with open(self._arquivo_total, "w") as f:
+                f.write(str(total))
+        return caminho
+
+    def estatisticas(self):
+        with self._lock:
+            if self._lru is None:
+                self._carregar()
+        total = self._ler_total()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "arquivos": len(self._lru),
+                "bytes": self._bytes if total is None else total,
+                "max_bytes": self.max_bytes,
+            }
+
+# ==========================================================
+# CACHE DE TILES DO MAPA
+# ==========================================================
+_cache_tiles = CacheDiscoLRU(TILE_CACHE_DIR, TILE_CACHE_MAX_MB * 1024 * 1024)
+USER_AGENT_TILES = "gerador-laudos/DefesaCivilCuiaba"
+
+def _chave_tile(z, x, y):
+    return f"{z}/{x}/{y}.png"
+
+def fetcher_tiles_http(url_template):
+    """Busca tiles em um servidor (OSM ou servidor próprio) com sessão keep-alive."""
+    def buscar(z, x, y):
+        sessao = sessao_http("tiles", **{"User-Agent": USER_AGENT_TILES})
+        resp = sessao.get(url_template.format(z=z, x=x, y=y), timeout=10)
+        return resp.content if resp.status_code == 200 else None
+    return buscar
+
+def fetcher_tiles_diretorio(raiz):
+    """Lê tiles de uma pasta local no formato {z}/{x}/{y}.png."""
+    def buscar(z, x, y):
+        caminho = os.path.join(raiz, str(z), str(x), f"{y}.png")
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, "rb") as f:
+            return f.read()
+    return buscar
+
+def _fetcher_padrao():
+    if "{z}" in TILE_SOURCE:
+        return fetcher_tiles_http(TILE_SOURCE)
+    return fetcher_tiles_diretorio(TILE_SOURCE)
+
+_fetcher_tiles = _fetcher_padrao()
+
+def definir_fetcher_tiles(fetcher):
+    """Troca a origem dos tiles: fetcher(z, x, y) -> bytes PNG ou None."""
+    global _fetcher_tiles
+    _fetcher_tiles = fetcher
+
+def obter_tile(z, x, y, offline=None):
+    """Devolve o PNG do tile (cache primeiro; rede/pasta só se não estiver offline)."""
+    dados = _cache_tiles.obter(_chave_tile(z, x, y))
+    if dados is not None:
+        return dados
+    if MAPA_OFFLINE if offline is None else offline:
+        return None
+    try:
+        dados = _fetcher_tiles(z, x, y)
+    except Exception as e:
+        print(f"⚠️  Falha ao buscar tile {z}/{x}/{y}: {e}")
+        return None
+    if dados:
+        try:
+            _cache_tiles.guardar(_chave_tile(z, x, y), dados)
+        except OSError as e:
+            print(f"⚠️  Não foi possível gravar tile {z}/{x}/{y}: {e}")
+    return dados
+
+def _tile_xy(lon, lat, zoom):
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def _origem_tiles_osm():
+    """True se TILE_SOURCE aponta para os servidores públicos do OpenStreetMap."""
+    if "{z}" not in TILE_SOURCE:
+        return False
+    host = (urlsplit(TILE_SOURCE).hostname or "").lower()
+    return host == "tile.openstreetmap.org" or host.endswith(".tile.openstreetmap.org")
+
+def semear_tiles(bbox=CUIABA_BBOX, zooms=(MAPA_ZOOM,)):
+    """
+    Pré-carrega no cache todos os tiles da área (lon_min, lat_min, lon_max, lat_max).
+    Retorna (tiles já em cache, baixados, falhas). A política de uso dos tiles
+    do OpenStreetMap proíbe download em massa: exige um TILE_SOURCE próprio
+    (servidor contratado ou pasta local), senão ValueError.
+    """
+    if "TILE_SOURCE" not in os.environ or _origem_tiles_osm():
+        raise ValueError(
+            "Semear tiles exige TILE_SOURCE apontando para um servidor próprio/contratado "
+            "ou uma pasta local: os servidores do OpenStreetMap não permitem download em massa"
+        )
+    lon_min, lat_min, lon_max, lat_max = bbox
+    ja, baixados, falhas = 0, 0, 0
+    for z in zooms:
+        x0, y0 = _tile_xy(lon_min, lat_max, z)
+        x1, y1 = _tile_xy(lon_max, lat_min, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                if _cache_tiles.caminho_se_existir(_chave_tile(z, x, y)):
+                    ja += 1
+                elif obter_tile(z, x, y, offline=False):
+                    baixados += 1
+                else:
+                    falhas += 1
+    return ja, baixados, falhas
+
+@app.cli.command("semear-tiles")
+def semear_tiles_cli():
+    """Baixa os tiles de Cuiabá para o cache (uso: TILE_SOURCE=... flask --app app semear-tiles)."""
+    try:
+        ja, baixados, falhas = semear_tiles()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(f"🗺️ Tiles: {ja} já em cache, {baixados} baixados, {falhas} falhas")
+
 # ==========================================================
 # FUNÇÕES AUXILIARES (MAPA e JSON local + GitHub)
 # ==========================================================
-def gerar_mapa(lat, lon, caminho_saida):
-    """Gera imagem PNG de mapa estático com marcador nas coordenadas."""
+_cache_mapas = CacheDiscoLRU(MAPA_CACHE_DIR, MAPA_CACHE_MAX_MB * 1024 * 1024)
+
+def _chave_mapa(lat, lon, zoom=MAPA_ZOOM, largura=MAPA_LARGURA, altura=MAPA_ALTURA):
+    """Chave do mapa: hash das coordenadas arredondadas + zoom + tamanho."""
+    lat_r = round(float(lat), MAPA_PRECISAO)
+    lon_r = round(float(lon), MAPA_PRECISAO)
+    base = f"{lat_r:.{MAPA_PRECISAO}f},{lon_r:.{MAPA_PRECISAO}f},z{zoom},{largura}x{altura}"
+    return hashlib.sha1(base.encode("utf-8")).hexdigest() + ".png", lat_r, lon_r
+
+def gerar_mapa(lat, lon, caminho_saida=None):
+    """
+    Gera imagem PNG de mapa estático com marcador nas coordenadas.
+    Locais repetidos (mesma coordenada arredondada) reaproveitam o PNG em cache.
+    Retorna o caminho da imagem. Sem 'caminho_saida' é o arquivo do cache,
+    que outro processo pode descartar a qualquer momento: quem vai ler o
+    arquivo depois deve pedir uma cópia própria em 'caminho_saida'.
+    """
     try:
-        m = StaticMap(600, 400)
-        marker = CircleMarker((float(lon), float(lat)), 'red', 12)
-        m.add_marker(marker)
-        image = m.render(zoom=16)
-        image.save(caminho_saida)
-        return caminho_saida
+        chave, lat_r, lon_r = _chave_mapa(lat, lon)
+        caminho = _cache_mapas.caminho_se_existir(chave)
+        if caminho is not None:
+            if not caminho_saida:
+                return caminho
+            try:
+                _ligar_ou_copiar(caminho, caminho_saida)
+                return caminho_saida
+            except FileNotFoundError:
+                pass  # descartado entre achar e copiar: desenha de novo
+        import mapa_estatico
+        tmp = os.path.join(MAPA_CACHE_DIR, f"{chave}.{uuid.uuid4().hex[:8]}.tmp")
+        mapa_estatico.desenhar_mapa(lat_r, lon_r, MAPA_LARGURA, MAPA_ALTURA, MAPA_ZOOM, obter_tile, tmp)
+        if caminho_saida:
+            _ligar_ou_copiar(tmp, caminho_saida)  # antes de entrar no cache (e poder ser descartado)
+        caminho = _cache_mapas.guardar_arquivo(chave, tmp)
+        return caminho_saida or caminho
     except Exception as e:
         print(f"❌ Erro ao gerar mapa: {e}")
         return None
 
+def _ligar_ou_copiar(origem, destino):
+    """Hardlink (a cópia continua valendo se o cache apagar a origem) ou cópia."""
+    if os.path.exists(destino):
+        os.remove(destino)
+    try:
+        os.link(origem, destino)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(origem, destino)
+
+def copia_mapa_temporaria():
+    """Caminho para a cópia do mapa de um laudo (ignorada pelo cache; apagar depois do render)."""
+    return os.path.join(MAPA_CACHE_DIR, f"uso-{uuid.uuid4().hex}.png.tmp")
+
 def carregar_atendimentos_local():
-    """Tenta ler o JSON de atendimentos do /tmp."""
+    """
+    Tenta ler o snapshot JSON de atendimentos do /tmp.
+    Snapshot corrompido não vira lista vazia: é separado e o snapshot do
+    GitHub é baixado no lugar.
+    """
     try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                txt = f.read().strip()
-                return json.loads(txt) if txt else []
+        return ler_json_verificado(DATA_FILE)
+    except FileNotFoundError:
         return []
+    except ValueError as e:
+        print(f"❌ Snapshot {DATA_FILE} corrompido ({e}); recuperando do GitHub")
     except Exception as e:
         print(f"⚠️  Erro ao ler {DATA_FILE}: {e}")
         return []
+    separar_corrompido(DATA_FILE)
+    lista = fetch_github_json(GITHUB_DATA_PATH)
+    if lista:
+        gravar_json_verificado(DATA_FILE, lista, registros_github=len(lista))
+    return lista
 
-def salvar_atendimentos_local(lista):
-    """Grava a lista no /tmp (cache local)."""
+def salvar_atendimentos_local(lista, registros_github=None):
+    """
+    Grava a lista inteira como novo snapshot no /tmp (cache local), zera o
+    journal e reindexa o store em memória. 'registros_github' registra que o
+    GitHub tem (ou vai ter) esse mesmo snapshot, com o journal vazio.
+    """
     try:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(lista, f, ensure_ascii=False, indent=2)
+        gravar_json_verificado(DATA_FILE, lista, registros_github)
+        if registros_github is not None:
+            atualizar_checksum(DATA_FILE, journal_github=0)
+        gravar_atomico(DATA_JOURNAL_FILE, b"")
     except Exception as e:
         print(f"❌ Erro ao salvar {DATA_FILE}: {e}")
+    if USAR_SQLITE:
+        _store["versao"] = _versao_arquivos_atendimentos()
+    else:
+        _indexar_atendimentos(lista, _versao_arquivos_atendimentos(), 0)
+    _store["carga"] += 1
+    _sincronizar_revisoes([])
+
+# ==========================================================
+# JOURNAL DE ATENDIMENTOS (append-only + compactação)
+# ==========================================================
+# Cada inclusão/edição/exclusão vira uma linha JSON em DATA_JOURNAL_FILE:
+#   {"op": "insert", "registro": {...}}
+#   {"op": "update", "numero_laudo": "<antigo>", "registro": {...}}
+#   {"op": "delete", "numero_laudo": "..."}
+# O estado atual é o snapshot (DATA_FILE, mesmo formato de sempre) mais o
+# journal. A cada JOURNAL_COMPACTAR_A_CADA operações o journal é aplicado ao
+# snapshot e zerado. No GitHub vale o mesmo par de arquivos.
+def aplicar_operacao(lista, op):
+    """
+    Aplica uma operação do journal sobre a lista (in place).
+    Inclusão de número já existente vira substituição, então reaplicar um
+    journal antigo sobre um snapshot mais novo não duplica registros.
+    """
+    tipo = op.get("op")
+    if tipo == "insert":
+        numero = _chave(op["registro"].get("numero_laudo"))
+        for i, a in enumerate(lista):
+            if _chave(a.get("numero_laudo")) == numero:
+                lista[i] = op["registro"]
+                return
+        lista.append(op["registro"])
+    elif tipo == "update":
+        antigo = _chave(op.get("numero_laudo"))
+        novo = _chave(op["registro"].get("numero_laudo"))
+        atual = next((a for a in lista if _chave(a.get("numero_laudo")) == antigo), None)
+        if novo != antigo:
+            # outro registro já com o número novo só existe ao reaplicar journal antigo
+            lista[:] = [a for a in lista if a is atual or _chave(a.get("numero_laudo")) != novo]
+        if atual is None:
+            lista.append(op["registro"])
+        else:
+            lista[next(i for i, a in enumerate(lista) if a is atual)] = op["registro"]
+    elif tipo == "delete":
+        numero = _chave(op.get("numero_laudo"))
+        lista[:] = [a for a in lista if _chave(a.get("numero_laudo")) != numero]
+
+def _ler_journal(texto):
+    operacoes = []
+    for linha in texto.splitlines():
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            operacoes.append(json.loads(linha))
+        except ValueError:
+            # última linha cortada por queda no meio da escrita: ignora
+            print(f"⚠️  Linha inválida no journal de atendimentos ignorada: {linha[:80]}")
+    return operacoes
+
+def carregar_journal_local():
+    try:
+        with open(DATA_JOURNAL_FILE, "r", encoding="utf-8") as f:
+            return _ler_journal(f.read())
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"⚠️  Erro ao ler {DATA_JOURNAL_FILE}: {e}")
+        return []
+
+def reconstruir_atendimentos(snapshot, operacoes):
+    """Estado atual = snapshot + operações do journal, em ordem."""
+    lista = list(snapshot)
+    for op in operacoes:
+        aplicar_operacao(lista, op)
+    return lista
+
+def _journal_bytes():
+    try:
+        with open(DATA_JOURNAL_FILE, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return b""
+
+def _consultar_github_atendimentos():
+    """
+    Chamada antes de pegar _store_lock: pergunta ao GitHub o que o .sha256
+    local ainda não sabe. Retorna {"registros_github", "journal_github"}
+    (None no que não deu para ler) para _registros_github_atendimentos.
+    """
+    meta = _ler_checksum(DATA_FILE) or {}
+    consultado = {}
+    if meta.get("registros_github") is None:
+        consultado["registros_github"] = registros_no_github(GITHUB_DATA_PATH)
+    if meta.get("journal_github") is None:
+        texto = ler_github_texto(GITHUB_JOURNAL_PATH)
+        consultado["journal_github"] = None if texto is None else len(_ler_journal(texto))
+    return consultado
+
+def _registros_github_atendimentos(consultado=None):
+    """
+    (registros no snapshot, operações no journal) que o GitHub tem, pelo
+    .sha256 local ou pelo que _consultar_github_atendimentos trouxe. Roda com
+    _store_lock em mãos, então não vai à rede. None se não se sabe.
+    """
+    meta = _ler_checksum(DATA_FILE) or {}
+    consultado = consultado or {}
+    # o .sha256 vale mais: outro worker pode ter enviado enquanto o GitHub respondia
+    registros, n_journal = (meta.get(campo) if meta.get(campo) is not None else consultado.get(campo)
+                            for campo in ("registros_github", "journal_github"))
+    if registros is None or n_journal is None:
+        return None
+    atualizar_checksum(DATA_FILE, registros_github=registros, journal_github=n_journal)
+    return registros, n_journal
+
+def _bloqueio_envio_atendimentos(registros, operacoes, consultado=None):
+    """
+    Confere um envio de atendimentos ao GitHub (journal ou snapshot) que deixa
+    o estado remoto com 'registros' registros, sendo 'operacoes' o journal
+    local. Retorna None se pode enviar ou o motivo do bloqueio. Bloqueia se:
+    - não dá para saber o que o GitHub tem;
+    - o journal local tem menos operações que o do GitHub (o envio apagaria
+      operações que só existem lá);
+    - o estado encolheu além do que as exclusões do journal explicam.
+    Envio bloqueado não perde nada: o journal local continua inteiro e vai
+    no próximo envio que passar.
+    """
+    remoto = _registros_github_atendimentos(consultado)
+    if remoto is None:
+        return "não foi possível conferir o que o GitHub tem"
+    anterior, n_journal = remoto
+    if len(operacoes) < n_journal:
+        return f"journal local com {len(operacoes)} operação(ões) contra {n_journal} no GitHub"
+    removidos = sum(1 for op in operacoes if op.get("op") == "delete")
+    if queda_suspeita(anterior, registros, removidos):
+        return f"{registros} registros contra {anterior} no GitHub e só {removidos} exclusão(ões) no journal"
+    return None
+
+def _registrar_operacao(op, mensagem):
+    """
+    Acrescenta a operação ao journal local, aplica no store (ou no banco) e
+    envia o journal (só os deltas desde a última compactação) pro GitHub.
+    """
+    _registrar_operacoes([op], mensagem)
+
+def _registrar_operacoes(ops, mensagem, arquivos=()):
+    """
+    Como _registrar_operacao, para várias operações de uma vez: uma gravação
+    no journal, uma reindexação e um envio ao GitHub. 'arquivos' (lista de
+    (remote_path, bytes ou caminho local)) vai no mesmo commit do journal.
+    Nenhuma chamada ao GitHub acontece com _store_lock em mãos.
+    """
+    consultado = _consultar_github_atendimentos()
+    with _store_lock:
+        linhas = "".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops).encode("utf-8")
+        alteracoes = []  # (antes, depois) de cada operação
+        if USAR_SQLITE:
+            _detectar_escrita_externa_sql()
+            for op in ops:
+                numeros = _numeros_da_operacao(op)
+                antes = sql_atendimentos_por_numeros(numeros)
+                sql_aplicar_operacao(op)
+                alteracoes.append((antes, sql_atendimentos_por_numeros(numeros)))
+            anexar_sincronizado(DATA_JOURNAL_FILE, linhas)
+            _store["versao"] = _versao_arquivos_atendimentos()
+            n_ops = _journal_bytes().count(b"\n")
+        else:
+            store = _store_atendimentos()
+            anexar_sincronizado(DATA_JOURNAL_FILE, linhas)
+            lista = list(store["lista"])
+            for op in ops:
+                numeros = _numeros_da_operacao(op)
+                antes = [a for a in lista if _chave(a.get("numero_laudo")) in numeros]
+                aplicar_operacao(lista, op)
+                alteracoes.append((antes, [a for a in lista if _chave(a.get("numero_laudo")) in numeros]))
+            n_ops = store["n_journal"] + len(ops)
+            _indexar_atendimentos(lista, _versao_arquivos_atendimentos(), n_ops)
+        for op, (antes, depois) in zip(ops, alteracoes):
+            atualizar_contadores_dashboard(antes, depois)
+            atualizar_grade(antes, depois)
+            _registrar_revisao(op)
+    if n_ops >= JOURNAL_COMPACTAR_A_CADA and compactar_atendimentos(mensagem, arquivos, consultado):
+        return
+    with _store_lock:
+        journal = _journal_bytes()
+        operacoes = _ler_journal(journal.decode("utf-8"))
+        registros = sql_contar_atendimentos() if USAR_SQLITE else len(_store["lista"])
+        motivo = _bloqueio_envio_atendimentos(registros, operacoes, consultado)
+        if motivo:
+            print(f"❌ Journal de atendimentos NÃO enviado ao GitHub: {motivo}. Fica no journal local.")
+            return
+        atualizar_checksum(DATA_FILE, journal_github=len(operacoes))
+    try:
+        enviar_ou_enfileirar_github_lote([(GITHUB_JOURNAL_PATH, journal)] + list(arquivos), mensagem)
+    except Exception as e:
+        print(f"❌ Erro ao enviar journal de atendimentos: {e}")
+
+def compactar_atendimentos(mensagem="Compacta atendimentos", arquivos=(), consultado=None):
+    """
+    Aplica o journal ao snapshot (local e GitHub) e zera o journal.
+    Recusa (retorna False, journal mantido) se _bloqueio_envio_atendimentos
+    barrar o envio. 'arquivos' extras vão no mesmo commit do snapshot.
+    """
+    if consultado is None:
+        consultado = _consultar_github_atendimentos()
+    with _store_lock:
+        lista = carregar_atendimentos()
+        motivo = _bloqueio_envio_atendimentos(len(lista), carregar_journal_local(), consultado)
+        if motivo:
+            print(f"❌ Snapshot de atendimentos NÃO enviado: {motivo}. Journal mantido.")
+            return False
+        salvar_atendimentos_local(lista, registros_github=len(lista))
+    print(f"🗜️ Journal de atendimentos compactado ({len(lista)} registros)")
+    try:
+        json_bytes = json.dumps(lista, ensure_ascii=False, indent=2).encode("utf-8")
+        # snapshot e journal vazio no mesmo commit: nunca fica no GitHub um
+        # snapshot novo com o journal antigo (nem o contrário)
+        enviar_ou_enfileirar_github_lote(
+            [(GITHUB_DATA_PATH, json_bytes), (GITHUB_JOURNAL_PATH, b"")] + list(arquivos), mensagem)
+    except Exception as e:
+        print(f"❌ Erro ao enviar atendimentos.json: {e}")
+    return True
+
+def _numeros_da_operacao(op):
+    """Números de laudo que a operação pode alterar."""
+    numeros = {_chave(op.get("numero_laudo"))} if "numero_laudo" in op else set()
+    if "registro" in op:
+        numeros.add(_chave(op["registro"].get("numero_laudo")))
+    return numeros
+
+def registrar_inclusao(atendimento, mensagem=None):
+    _registrar_operacao({"op": "insert", "registro": atendimento},
+                        mensagem or f"Adiciona atendimento {atendimento.get('numero_laudo')}")
+
+def registrar_edicao(numero_antigo, atendimento, mensagem=None):
+    _registrar_operacao({"op": "update", "numero_laudo": numero_antigo, "registro": atendimento},
+                        mensagem or f"Atualiza atendimento {atendimento.get('numero_laudo')}")
+
+def registrar_exclusao(numero, mensagem=None):
+    _registrar_operacao({"op": "delete", "numero_laudo": numero},
+                        mensagem or f"Remoção {numero}")
+
+# ==========================================================
+# STORE EM MEMÓRIA DE ATENDIMENTOS (índices por chave)
+# ==========================================================
+# O snapshot + journal são lidos uma única vez por processo e só voltam a ser
+# lidos quando algum dos dois arquivos muda (ex.: outro worker gravou).
+_store_lock = TravaProcesso(os.path.join(DATA_DIR, "atendimentos.lock"))
+_store = {
+    "versao": None,
+    "lista": [],
+    "n_journal": 0,
+    "retentar_github": 0,  # time.monotonic() a partir do qual um store vazio relê o GitHub
+    "carga": 0,            # muda a cada releitura do disco (contadores/grade são refeitos)
+    "por_numero": {},
+    "por_evento": {},
+}
+
+def _chave(valor):
+    return str(valor if valor is not None else "").strip()
+
+def _versao_arquivos_atendimentos():
+    """Assinatura (mtime/tamanho) do snapshot e do journal locais."""
+    versao = []
+    for caminho in (DATA_FILE, DATA_JOURNAL_FILE):
+        try:
+            st = os.stat(caminho)
+            versao.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            versao.append(None)
+    return tuple(versao) if any(v is not None for v in versao) else None
+
+def _indexar_atendimentos(lista, versao, n_journal):
+    """Reconstrói os índices hash a partir da lista completa."""
+    por_numero, por_evento = {}, {}
+    for a in lista:
+        # em caso de número repetido, vale o primeiro (mesma regra do next())
+        por_numero.setdefault(_chave(a.get("numero_laudo")), a)
+        por_evento.setdefault(_chave(a.get("evento_id")), []).append(a)
+    with _store_lock:
+        _store.update(
+            versao=versao,
+            lista=lista,
+            n_journal=n_journal,
+            por_numero=por_numero,
+            por_evento=por_evento,
+        )
+
+def _ler_atendimentos_github():
+    """(snapshot, operações do journal) do GitHub, ou None se o GitHub não respondeu. Só rede."""
+    snapshot = fetch_github_json(GITHUB_DATA_PATH)
+    operacoes = _ler_journal(fetch_github_texto(GITHUB_JOURNAL_PATH))
+    vazio_confirmado = remoto_vazio_recente(GITHUB_DATA_PATH) and remoto_vazio_recente(GITHUB_JOURNAL_PATH)
+    if not (snapshot or operacoes or vazio_confirmado):
+        return None
+    return snapshot, operacoes
+
+def _baixar_atendimentos_github(remoto=None):
+    """
+    Copia snapshot + journal do GitHub (ou os já lidos em 'remoto') para o
+    /tmp e retorna a lista já combinada. O journal remoto vira o journal
+    local (não é compactado aqui): o próximo envio do journal leva essas
+    operações junto, em vez de trocar o journal do GitHub por um só com as
+    operações novas. Retorna None se o GitHub não respondeu (nada é gravado).
+    """
+    remoto = remoto or _ler_atendimentos_github()
+    if remoto is None:
+        return None
+    snapshot, operacoes = remoto
+    linhas = "".join(json.dumps(op, ensure_ascii=False) + "\n" for op in operacoes).encode("utf-8")
+    try:
+        gravar_json_verificado(DATA_FILE, snapshot, registros_github=len(snapshot))
+        atualizar_checksum(DATA_FILE, journal_github=len(operacoes))
+        gravar_atomico(DATA_JOURNAL_FILE, linhas)
+    except Exception as e:
+        print(f"❌ Erro ao salvar {DATA_FILE}: {e}")
+    return reconstruir_atendimentos(snapshot, operacoes)
+
+def _store_atendimentos():
+    """Retorna o store, recarregando apenas se os arquivos locais mudaram."""
+    with _store_lock:
+        store = _recarregar_store()
+    if store is not None:
+        return store
+    # cache vazio: o GitHub é lido fora da trava, para uma rede lenta não
+    # segurar as gravações dos outros workers
+    remoto = _ler_atendimentos_github()
+    with _store_lock:
+        return _recarregar_store(remoto, github_lido=True)
+
+def _recarregar_store(remoto=None, github_lido=False):
+    """
+    Com _store_lock em mãos: relê snapshot/journal se mudaram. Cache local
+    vazio e GitHub ainda não lido -> None (o chamador lê o GitHub sem a trava
+    e volta com 'remoto', None se o GitHub não respondeu).
+    """
+    versao = _versao_arquivos_atendimentos()
+    if versao == _store["versao"] and (versao is not None or time.monotonic() < _store["retentar_github"]):
+        return _store
+    snapshot = carregar_atendimentos_local()
+    operacoes = carregar_journal_local()
+    lista = reconstruir_atendimentos(snapshot, operacoes)
+    if not (lista or operacoes):
+        # cache vazio -> lê do GitHub e popula o cache (um snapshot vazio
+        # também: evita rebuscar a cada leitura)
+        if not github_lido:
+            return None
+        baixado = _baixar_atendimentos_github(remoto) if remoto is not None else None
+        if baixado is None:
+            # GitHub fora do ar: o store segue vazio, sem nova geração (o
+            # cursor não muda) e só tenta de novo em GITHUB_RETENTAR_LEITURA s
+            _store["retentar_github"] = time.monotonic() + GITHUB_RETENTAR_LEITURA
+            if versao == _store["versao"] and not _store["lista"]:
+                return _store
+        else:
+            lista, versao, operacoes = baixado, _versao_arquivos_atendimentos(), carregar_journal_local()
+    _indexar_atendimentos(lista, versao, len(operacoes))
+    _store["carga"] += 1
+    _sincronizar_revisoes(operacoes)
+    return _store
 
 def carregar_atendimentos():
     """
     Carrega atendimentos para exibir no painel:
-    1) Tenta usar o cache local (/tmp/atendimentos.json)
-    2) Se não houver, lê do GitHub (data/atendimentos.json) e salva cache.
+    1) Usa o store em memória (recarregado se o snapshot/journal em /tmp mudar)
+    2) Se não houver cache local, lê do GitHub (data/atendimentos.json + journal) e salva cache.
+    Com ARMAZENAMENTO=sqlite a lista vem do banco.
+    Retorna uma cópia rasa da lista, que pode ser alterada pelo chamador.
     """
-    lista = carregar_atendimentos_local()
-    if lista:
-        return lista
-    # cache vazio -> lê do GitHub
-    lista = fetch_github_json(GITHUB_DATA_PATH)
-    if lista:
-        salvar_atendimentos_local(lista)  # popula o cache
-    return lista
+    if USAR_SQLITE:
+        return sql_carregar_atendimentos()
+    return list(_store_atendimentos()["lista"])
+
+def buscar_atendimento(numero):
+    """Busca um atendimento pelo número do laudo em O(1)."""
+    if USAR_SQLITE:
+        return sql_buscar_atendimento(numero)
+    return _store_atendimentos()["por_numero"].get(_chave(numero))
+
+def atendimentos_por_evento(evento_id):
+    """Atendimentos vinculados a um evento."""
+    if USAR_SQLITE:
+        return sql_atendimentos_por_evento(evento_id)
+    return list(_store_atendimentos()["por_evento"].get(_chave(evento_id), []))
 
 def numero_laudo_existe(numero):
     """Verifica se já existe um laudo com o mesmo número."""
-    lista = carregar_atendimentos()
-    return any(str(a.get("numero_laudo")).strip() == str(numero).strip() for a in lista)
+    return buscar_atendimento(numero) is not None
 
 
-def adicionar_atendimento_e_sincronizar(atendimento):
+# ==========================================================
+# REVISÕES DE ATENDIMENTOS (feed incremental do painel)
+# ==========================================================
+# O cursor entregue aos clientes é "<geração>.<revisão>", calculado do que
+# está no disco: a geração é o começo do sha256 do snapshot (do .sha256) e a
+# revisão é o número de operações no journal. Todos os workers (e o mesmo
+# worker depois de um restart) chegam ao mesmo cursor para os mesmos dados.
+# Operações que outro worker acrescentou ao journal entram no log como
+# revisões normais; só a compactação (snapshot novo) troca a geração e
+# obriga o cliente a recarregar tudo. O log guarda só as últimas
+# REVISOES_MAX alterações; "base" é a revisão a partir da qual ele está completo.
+REVISOES_MAX = 5000
+_revisoes_lock = threading.Lock()
+_revisoes = {"geracao": "0", "rev": 0, "base": 0, "log": []}  # log: [(rev, numero, registro ou None)]
+
+def _geracao_snapshot():
+    sha = (_ler_checksum(DATA_FILE) or {}).get("sha256") if os.path.exists(DATA_FILE) else None
+    return sha[:12] if sha else "0"
+
+def _anotar_revisao(log, rev, op):
+    if op.get("op") == "delete":
+        log.append((rev, _chave(op.get("numero_laudo")), None))
+    else:
+        novo = _chave(op["registro"].get("numero_laudo"))
+        antigo = _chave(op.get("numero_laudo", novo))
+        if antigo != novo:
+            log.append((rev, antigo, None))
+        log.append((rev, novo, op["registro"]))
+    if len(log) > REVISOES_MAX:
+        del log[:len(log) - REVISOES_MAX]
+        _revisoes["base"] = log[0][0]
+
+def _sincronizar_revisoes(operacoes):
     """
-    Adiciona atendimento:
-    - Valida número do laudo duplicado
-    - Atualiza cache local /tmp/atendimentos.json
-    - Sobe o JSON atualizado pro GitHub (data/atendimentos.json)
+    Alinha o cursor com o disco depois de uma releitura ('operacoes' = journal
+    inteiro). Mesmo snapshot e journal maior: só as operações novas viram
+    revisões. Snapshot trocado ou journal menor: nova geração.
     """
+    geracao, rev = _geracao_snapshot(), len(operacoes)
+    with _revisoes_lock:
+        if geracao == _revisoes["geracao"] and rev == _revisoes["rev"]:
+            return
+        if geracao == _revisoes["geracao"] and rev > _revisoes["rev"]:
+            for n in range(_revisoes["rev"], rev):
+                _anotar_revisao(_revisoes["log"], n + 1, operacoes[n])
+        else:
+            _revisoes.update(base=rev, log=[])
+        _revisoes.update(geracao=geracao, rev=rev)
+    publicar_alteracao()
+
+def _registrar_revisao(op):
+    """Operação gravada por este processo (o journal ganhou uma linha)."""
+    with _revisoes_lock:
+        rev = _revisoes["rev"] + 1
+        _anotar_revisao(_revisoes["log"], rev, op)
+        _revisoes["rev"] = rev
+    publicar_alteracao()
+
+def cursor_atendimentos():
+    """Cursor da versão atual dos atendimentos (igual em todos os processos)."""
+    with _revisoes_lock:
+        return f"{_revisoes['geracao']}.{_revisoes['rev']}"
+
+def alteracoes_desde(cursor):
+    """
+    (alterados, removidos) desde o cursor informado, ou None se o cliente
+    precisa recarregar tudo (outra geração ou cursor antigo demais).
+    """
+    geracao, _, rev = (cursor or "").partition(".")
+    try:
+        rev = int(rev)
+    except ValueError:
+        return None
+    with _revisoes_lock:
+        log = _revisoes["log"]
+        if geracao != _revisoes["geracao"] or not _revisoes["base"] <= rev <= _revisoes["rev"]:
+            return None
+        inicio = bisect.bisect_right(log, rev, key=lambda item: item[0])
+        ultimos = {}
+        for _, numero, registro in log[inicio:]:
+            ultimos[numero] = registro
+    alterados = [r for r in ultimos.values() if r is not None]
+    removidos = [n for n, r in ultimos.items() if r is None]
+    return alterados, removidos
 
-    numero = atendimento.get("numero_laudo")
-
-    # 1️⃣ valida duplicidade
-    if numero_laudo_existe(numero):
-        raise ValueError(f"Já existe um laudo com o número {numero}")
+# ==========================================================
+# HUB DE NOTIFICAÇÕES (Server-Sent Events do painel)
+# ==========================================================
+# Não há fila por assinante: quem publica só acorda todos com notify_all e
+# cada stream busca o próprio delta com alteracoes_desde(cursor). Um
+# assinante parado custa apenas uma espera na Condition: em produção o
+# gunicorn roda com workers gevent (render.yaml), então cada stream é um
+# greenlet e não prende uma thread. Escritas de outro worker não passam pelo
+# notify_all daqui: uma thread vigia confere os arquivos a cada SSE_VERIFICAR
+# segundos enquanto houver assinantes.
+SSE_HEARTBEAT = int(os.environ.get("SSE_HEARTBEAT", 25))  # s entre comentários de keep-alive
+SSE_MAX_ASSINANTES = int(os.environ.get("SSE_MAX_ASSINANTES", 500))
+SSE_VERIFICAR = float(os.environ.get("SSE_VERIFICAR", 2))  # s entre checagens de escrita de outro worker
+_hub_cond = threading.Condition()
+_hub_assinantes = 0
+_hub_vigia = {"ativa": False}
+
+def publicar_alteracao():
+    with _hub_cond:
+        _hub_cond.notify_all()
+
+def _vigiar_outros_workers():
+    """Enquanto houver streams abertos, acorda todos se outro worker mudou os atendimentos."""
+    while True:
+        time.sleep(SSE_VERIFICAR)
+        with _hub_cond:
+            if not _hub_assinantes:
+                _hub_vigia["ativa"] = False
+                return
+        antes = cursor_atendimentos()
+        try:
+            depois = cursor_atual_atendimentos()  # relê snapshot/journal/banco se mudaram no disco
+        except Exception as e:
+            print(f"⚠️  Falha ao verificar atendimentos para o painel: {e}")
+            continue
+        if depois != antes:
+            publicar_alteracao()
+
+def _garantir_vigia():
+    """Chamada com _hub_cond em mãos, ao entrar um assinante."""
+    if not _hub_vigia["ativa"]:
+        _hub_vigia["ativa"] = True
+        threading.Thread(target=_vigiar_outros_workers, daemon=True).start()
+
+def aguardar_alteracao(cursor, timeout):
+    """Bloqueia até o cursor mudar ou o timeout passar. Retorna True se mudou."""
+    with _hub_cond:
+        return _hub_cond.wait_for(lambda: cursor_atendimentos() != cursor, timeout)
 
-    # 2️⃣ carrega lista atual
-    lista = carregar_atendimentos()
+# ==========================================================
+# CONTADORES DO DASHBOARD
+# ==========================================================
+# Contagens por tipo (origem normalizada), grau de risco, bairro e mês. São
+# montadas uma vez por carga do store e depois só ajustadas com os registros que
+# cada inclusão/edição/exclusão tirou e colocou.
+REGRAS_TIPO_DASHBOARD = (
+    ("Chuvas", ("chuva",)),
+    ("Regularização", ("regularizacao",)),
+    ("Incêndios", ("incendio",)),
+    ("Movimento de Massa", ("deslizamento", "movimento de massa", "movimentacao de massa")),
+)
+_dashboard = {"carga": None, "contadores": None}
+
+def _normalizar_texto(valor):
+    """Minúsculo, sem acento e com espaços simples."""
+    texto = unicodedata.normalize("NFD", _chave(valor))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.casefold().split())
+
+def _tipo_atendimento(origem):
+    origem = _normalizar_texto(origem)
+    for tipo, alvos in REGRAS_TIPO_DASHBOARD:
+        if any(alvo in origem for alvo in alvos):
+            return tipo
+    return "Outros"
+
+def _mes_vistoria(data_vistoria):
+    """'AAAA-MM' a partir de 'AAAA-MM-DD' ou 'DD/MM/AAAA'."""
+    texto = _chave(data_vistoria)
+    m = re.match(r"(\d{4})-(\d{2})", texto)
+    if m:
+        return f"{m.group(1)}-{m.group(2)}"
+    m = re.match(r"\d{1,2}/(\d{1,2})/(\d{4})", texto)
+    if m:
+        return f"{m.group(2)}-{int(m.group(1)):02d}"
+    return "Sem data"
+
+def _somar(contagem, chave, delta):
+    total = contagem.get(chave, 0) + delta
+    if total > 0:
+        contagem[chave] = total
+    else:
+        contagem.pop(chave, None)
+
+def _contar_atendimento(contadores, a, delta):
+    contadores["total"] += delta
+    _somar(contadores["tipo"], _tipo_atendimento(a.get("origem")), delta)
+    _somar(contadores["risco"], _chave(a.get("grau_risco")).upper() or "NÃO INFORMADO", delta)
+    _somar(contadores["mes"], _mes_vistoria(a.get("data_vistoria")), delta)
+    bairro = " ".join(_chave(a.get("bairro")).split()) or "Não informado"
+    chave = _normalizar_texto(bairro)
+    _somar(contadores["bairro"], chave, delta)
+    _somar(contadores["bairro_rotulos"].setdefault(chave, {}), bairro, delta)
+    if not contadores["bairro_rotulos"][chave]:
+        del contadores["bairro_rotulos"][chave]
+
+def _contadores_dashboard():
+    """Contadores da carga atual (recontados só se o store foi relido do disco)."""
+    with _store_lock:
+        cursor_atual_atendimentos()
+        carga = _store["carga"]
+        if _dashboard["carga"] != carga or _dashboard["contadores"] is None:
+            contadores = {"total": 0, "tipo": {}, "risco": {}, "mes": {}, "bairro": {}, "bairro_rotulos": {}}
+            for a in carregar_atendimentos():
+                _contar_atendimento(contadores, a, 1)
+            _dashboard.update(carga=carga, contadores=contadores)
+        return _dashboard["contadores"]
+
+def atualizar_contadores_dashboard(antes, depois):
+    """Tira os registros antigos e soma os novos (chamado a cada operação)."""
+    with _store_lock:
+        contadores = _dashboard["contadores"]
+        if contadores is None or _dashboard["carga"] != _store["carga"]:
+            return  # ainda não montados ou de outra carga: recontados na próxima leitura
+        for a in antes:
+            _contar_atendimento(contadores, a, -1)
+        for a in depois:
+            _contar_atendimento(contadores, a, 1)
+
+def resumo_dashboard():
+    """Resumo pronto para o dashboard.html (poucas centenas de bytes)."""
+    with _store_lock:
+        c = _contadores_dashboard()
+        tipos = {tipo: c["tipo"].get(tipo, 0) for tipo, _ in REGRAS_TIPO_DASHBOARD}
+        if c["tipo"].get("Outros"):
+            tipos["Outros"] = c["tipo"]["Outros"]
+        bairros = [
+            # rótulo mais usado entre as grafias do mesmo bairro
+            [max(c["bairro_rotulos"][chave].items(), key=lambda item: item[1])[0], qtd]
+            for chave, qtd in c["bairro"].items()
+        ]
+        return {
+            "total": c["total"],
+            "tipos": tipos,
+            "riscos": dict(c["risco"]),
+            "meses": dict(sorted(c["mes"].items())),
+            "bairros": sorted(bairros, key=lambda item: (-item[1], item[0])),
+        }
 
-    # 3️⃣ adiciona novo atendimento
-    lista.append(atendimento)
+# ==========================================================
+# ÍNDICE ESPACIAL (grade lat/lon do painel)
+# ==========================================================
+# Grade uniforme de GRADE_CELULA graus (~1,1 km com 0.01). As coordenadas,
+# gravadas como texto, são convertidas para float uma vez ao entrar na grade.
+# Cada célula guarda seus pontos e um agregado (quantidade, somas e riscos),
+# usado direto como cluster nos zooms baixos.
+GRADE_CELULA = float(os.environ.get("GRADE_CELULA", 0.01))
+PAINEL_ZOOM_PONTOS = int(os.environ.get("PAINEL_ZOOM_PONTOS", 16))  # a partir daqui, sem cluster
+PAINEL_CLUSTER_PX = 60       # tamanho aproximado de um cluster na tela
+PAINEL_LIMITE_MAPA = int(os.environ.get("PAINEL_LIMITE_MAPA", 2000))  # acima disso o painel usa bbox
+RISCOS_ORDEM = ("muito baixo", "baixo", "medio", "alto", "muito alto")
+_grade = {"carga": None, "celulas": None}
+
+def _coordenada(valor):
+    try:
+        n = float(_chave(valor).replace(",", "."))
+    except ValueError:
+        return None
+    return n if math.isfinite(n) else None
 
-    # 4️⃣ salva local
-    salvar_atendimentos_local(lista)
+def _coordenadas(a):
+    lat, lon = _coordenada(a.get("latitude")), _coordenada(a.get("longitude"))
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
 
-    # 5️⃣ envia para GitHub
-    repo = _get_github()
+def _celula(lat, lon, tamanho=None):
+    tamanho = tamanho or GRADE_CELULA
+    return math.floor(lat / tamanho), math.floor(lon / tamanho)
 
+def _inserir_na_grade(celulas, a):
+    coords = _coordenadas(a)
+    if coords is None:
+        return
+    lat, lon = coords
+    celula = celulas.setdefault(_celula(lat, lon), {
+        "pontos": [], "n": 0, "soma_lat": 0.0, "soma_lon": 0.0, "riscos": {},
+    })
+    celula["pontos"].append((lat, lon, a))
+    celula["n"] += 1
+    celula["soma_lat"] += lat
+    celula["soma_lon"] += lon
+    _somar(celula["riscos"], _normalizar_texto(a.get("grau_risco")), 1)
+
+def _remover_da_grade(celulas, a):
+    coords = _coordenadas(a)
+    if coords is None:
+        return
+    chave = _celula(*coords)
+    celula = celulas.get(chave)
+    if celula is None:
+        return
+    numero = _chave(a.get("numero_laudo"))
+    for i, (lat, lon, registro) in enumerate(celula["pontos"]):
+        if _chave(registro.get("numero_laudo")) == numero:
+            del celula["pontos"][i]
+            celula["n"] -= 1
+            celula["soma_lat"] -= lat
+            celula["soma_lon"] -= lon
+            _somar(celula["riscos"], _normalizar_texto(registro.get("grau_risco")), -1)
+            break
+    if not celula["pontos"]:
+        del celulas[chave]
+
+def _grade_atual():
+    """Grade da carga atual (reconstruída só se o store foi relido do disco)."""
+    with _store_lock:
+        cursor_atual_atendimentos()
+        carga = _store["carga"]
+        if _grade["carga"] != carga or _grade["celulas"] is None:
+            celulas = {}
+            for a in carregar_atendimentos():
+                _inserir_na_grade(celulas, a)
+            _grade.update(carga=carga, celulas=celulas)
+        return _grade["celulas"]
+
+def atualizar_grade(antes, depois):
+    """Mesma ideia dos contadores do dashboard: tira os antigos, põe os novos."""
+    with _store_lock:
+        celulas = _grade["celulas"]
+        if celulas is None or _grade["carga"] != _store["carga"]:
+            return
+        for a in antes:
+            _remover_da_grade(celulas, a)
+        for a in depois:
+            _inserir_na_grade(celulas, a)
+
+def _pior_risco(riscos):
+    for risco in reversed(RISCOS_ORDEM):
+        if riscos.get(risco):
+            return risco
+    return next(iter(riscos), "")
+
+def _filtro_painel(a, filtros):
+    """Mesmas regras dos filtros do painel.html."""
+    return ((not filtros.get("tipo") or _normalizar_texto(a.get("origem")) == filtros["tipo"]) and
+            (not filtros.get("bairro") or filtros["bairro"] in _normalizar_texto(a.get("bairro"))) and
+            (not filtros.get("risco") or _normalizar_texto(a.get("grau_risco")) == filtros["risco"]))
+
+def consultar_grade(bbox, zoom, filtros=None):
+    """
+    Pontos e clusters dentro do bbox (oeste, sul, leste, norte) para o zoom.
+    Retorna {"pontos": [registros], "clusters": [{latitude, longitude, quantidade, grau_risco}]}.
+    """
+    oeste, sul, leste, norte = bbox
+    filtros = {k: _normalizar_texto(v) for k, v in (filtros or {}).items() if _chave(v)}
+    tamanho = 360 / 2 ** zoom * PAINEL_CLUSTER_PX / 256
+    with _store_lock:
+        celulas = _grade_atual()
+        lat0, lon0 = _celula(sul, oeste)
+        lat1, lon1 = _celula(norte, leste)
+        if (lat1 - lat0 + 1) * (lon1 - lon0 + 1) > len(celulas):
+            candidatas = [c for (i, j), c in celulas.items() if lat0 <= i <= lat1 and lon0 <= j <= lon1]
+        else:
+            candidatas = [celulas[(i, j)] for i in range(lat0, lat1 + 1) for j in range(lon0, lon1 + 1)
+                          if (i, j) in celulas]
+
+        grupos = {}
+        if zoom < PAINEL_ZOOM_PONTOS and tamanho >= GRADE_CELULA and not filtros:
+            # zoom baixo: junta os agregados das células, sem olhar ponto a ponto
+            for c in candidatas:
+                lat, lon = c["soma_lat"] / c["n"], c["soma_lon"] / c["n"]
+                if not (sul <= lat <= norte and oeste <= lon <= leste):
+                    continue
+                g = grupos.setdefault(_celula(lat, lon, tamanho), {
+                    "pontos": [], "n": 0, "soma_lat": 0.0, "soma_lon": 0.0, "riscos": {},
+                })
+                g["pontos"] = g["pontos"] or c["pontos"][:1]  # basta um, caso o grupo fique com 1 ponto
+                g["n"] += c["n"]
+                g["soma_lat"] += c["soma_lat"]
+                g["soma_lon"] += c["soma_lon"]
+                for risco, qtd in c["riscos"].items():
+                    _somar(g["riscos"], risco, qtd)
+        else:
+            for c in candidatas:
+                for lat, lon, a in c["pontos"]:
+                    if not (sul <= lat <= norte and oeste <= lon <= leste) or not _filtro_painel(a, filtros):
+                        continue
+                    chave = (lat, lon, id(a)) if zoom >= PAINEL_ZOOM_PONTOS else _celula(lat, lon, tamanho)
+                    g = grupos.setdefault(chave, {
+                        "pontos": [], "n": 0, "soma_lat": 0.0, "soma_lon": 0.0, "riscos": {},
+                    })
+                    g["pontos"] = g["pontos"] or [(lat, lon, a)]
+                    g["n"] += 1
+                    g["soma_lat"] += lat
+                    g["soma_lon"] += lon
+                    _somar(g["riscos"], _normalizar_texto(a.get("grau_risco")), 1)
+
+    pontos, clusters = [], []
+    for g in grupos.values():
+        if g["n"] == 1:
+            pontos.append(g["pontos"][0][2])
+        else:
+            clusters.append({
+                "latitude": round(g["soma_lat"] / g["n"], 6),
+                "longitude": round(g["soma_lon"] / g["n"], 6),
+                "quantidade": g["n"],
+                "grau_risco": _pior_risco(g["riscos"]),
+            })
+    return {"pontos": pontos, "clusters": clusters}
+
+def _ler_bbox(texto):
+    """'oeste,sul,leste,norte' (formato do Leaflet toBBoxString) -> tupla de floats."""
     try:
-        json_bytes = json.dumps(lista, ensure_ascii=False, indent=2).encode("utf-8")
+        oeste, sul, leste, norte = (float(v) for v in texto.split(","))
+    except ValueError:
+        return None
+    if not (all(math.isfinite(v) for v in (oeste, sul, leste, norte)) and oeste <= leste and sul <= norte):
+        return None
+    return oeste, sul, leste, norte
 
-        ok = upload_or_update_github_file(
-            repo,
-            GITHUB_DATA_PATH,
-            json_bytes,
-            f"Adiciona atendimento {numero}"
-        )
+# ==========================================================
+# BANCO SQLITE (ARMAZENAMENTO=sqlite)
+# ==========================================================
+# Mesmas funções de leitura/escrita usadas pelas rotas, mas respondidas por
+# consultas indexadas. O GitHub continua recebendo snapshot + journal em JSON
+# (o snapshot sai de exportar_atendimentos_json na compactação).
+_banco_lock = threading.Lock()
+_banco_modulo = None
+
+def _banco():
+    """Módulo banco.py (flask_sqlalchemy), importado e ligado ao app no primeiro uso."""
+    global _banco_modulo
+    with _banco_lock:
+        if _banco_modulo is None:
+            import banco
+            app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
+            banco.db.init_app(app)
+            _banco_modulo = banco
+        return _banco_modulo
+
+if USAR_SQLITE:
+    _banco()  # o Flask só aceita init_app antes da primeira requisição
+
+# flock: com vários workers só um cria as tabelas e faz a primeira importação
+_sql_lock = TravaProcesso(os.path.join(DATA_DIR, "banco.lock"))
+_sql_pronto = False
+
+def _garantir_banco():
+    """
+    Cria as tabelas e, se estiverem vazias, importa o JSON local/GitHub (uma vez
+    por processo; entre processos, um de cada vez). Retorna o módulo banco.
+    """
+    global _sql_pronto
+    banco = _banco()
+    if _sql_pronto:
+        return banco
+    with _sql_lock:
+        if _sql_pronto:
+            return banco
+        with app.app_context():
+            banco.db.create_all()
+            if banco.db.session.query(banco.Atendimento.id).first() is None:
+                lista = reconstruir_atendimentos(carregar_atendimentos_local(), carregar_journal_local())
+                importar_atendimentos(lista or _baixar_atendimentos_github() or [])
+            if banco.db.session.query(banco.Evento.id).first() is None:
+                importar_eventos(_carregar_eventos_json())
+        _sql_pronto = True
+    return banco
+
+def importar_atendimentos(lista, substituir=False):
+    """
+    Importa atendimentos (formato do atendimentos.json) para o banco, na
+    mesma ordem e com os mesmos registros: números repetidos dentro da lista
+    ficam todos, como no JSON (senão a próxima compactação mandaria ao GitHub
+    um snapshot sem eles). Só números que o banco já tinha antes da
+    importação são ignorados. Retorna (importados, ignorados).
+    """
+    banco = _banco()
+    with app.app_context():
+        if substituir:
+            banco.Atendimento.query.delete()
+        no_banco = {numero for (numero,) in banco.db.session.query(banco.Atendimento.numero_laudo)}
+        importados, ignorados = 0, []
+        for dados in lista:
+            numero = _chave(dados.get("numero_laudo"))
+            if numero in no_banco:
+                ignorados.append(numero)
+                continue
+            banco.db.session.add(banco.Atendimento().atualizar(dados))
+            importados += 1
+        banco.db.session.commit()
+    if ignorados:
+        print(f"⚠️  {len(ignorados)} atendimento(s) já existentes no banco ignorados: {ignorados}")
+    return importados, ignorados
+
+def importar_eventos(lista, substituir=False):
+    banco = _banco()
+    with app.app_context():
+        if substituir:
+            banco.Evento.query.delete()
+        for dados in lista:
+            if _chave(dados.get("id")):
+                banco.db.session.merge(banco.Evento().atualizar(dados))
+        banco.db.session.commit()
+    return len(lista)
+
+def exportar_atendimentos_json():
+    """Lista de atendimentos no formato do data/atendimentos.json."""
+    return sql_carregar_atendimentos()
+
+def sql_carregar_atendimentos():
+    banco = _garantir_banco()
+    with app.app_context():
+        return [a.para_dict() for a in banco.Atendimento.query.order_by(banco.Atendimento.id)]
+
+def sql_contar_atendimentos():
+    banco = _garantir_banco()
+    with app.app_context():
+        return banco.Atendimento.query.count()
+
+def sql_buscar_atendimento(numero):
+    banco = _garantir_banco()
+    with app.app_context():
+        a = banco.Atendimento.query.filter_by(numero_laudo=_chave(numero)).order_by(banco.Atendimento.id).first()
+        return a.para_dict() if a else None
+
+def sql_atendimentos_por_numeros(numeros):
+    banco = _garantir_banco()
+    with app.app_context():
+        consulta = banco.Atendimento.query.filter(banco.Atendimento.numero_laudo.in_(list(numeros)))
+        return [a.para_dict() for a in consulta]
+
+def sql_atendimentos_por_evento(evento_id):
+    banco = _garantir_banco()
+    with app.app_context():
+        consulta = banco.Atendimento.query.filter(banco.Atendimento.evento_id == _chave(evento_id))
+        return [a.para_dict() for a in consulta.order_by(banco.Atendimento.id)]
+
+def sql_aplicar_operacao(op):
+    """Mesma semântica de aplicar_operacao, no banco."""
+    banco = _garantir_banco()
+    with app.app_context():
+        tipo = op.get("op")
+        if tipo in ("insert", "update"):
+            registro = op["registro"]
+            novo = _chave(registro.get("numero_laudo"))
+            antigo = _chave(op.get("numero_laudo")) if tipo == "update" else novo
+            atual = banco.Atendimento.query.filter_by(numero_laudo=antigo).order_by(banco.Atendimento.id).first()
+            if novo != antigo:
+                banco.Atendimento.query.filter_by(numero_laudo=novo).delete()
+            if atual is None:
+                banco.db.session.add(banco.Atendimento().atualizar(registro))
+            else:
+                atual.atualizar(registro)
+        elif tipo == "delete":
+            banco.Atendimento.query.filter_by(numero_laudo=_chave(op.get("numero_laudo"))).delete()
+        banco.db.session.commit()
+
+def sql_carregar_eventos():
+    banco = _garantir_banco()
+    with app.app_context():
+        return [e.para_dict() for e in banco.Evento.query.order_by(banco.Evento.id)]
+
+def sql_salvar_eventos(lista):
+    _garantir_banco()
+    importar_eventos(lista, substituir=True)
+
+@app.cli.command("importar-json")
+@click.option("--dados", default=os.path.join(BASE_DIR, "data"), help="Pasta com atendimentos.json e eventos.json")
+@click.option("--substituir", is_flag=True, help="Apaga o que já estiver no banco antes de importar")
+def importar_json_cli(dados, substituir):
+    """Importa data/atendimentos.json e data/eventos.json para o banco."""
+    with app.app_context():
+        _banco().db.create_all()
+    with open(os.path.join(dados, "atendimentos.json"), "r", encoding="utf-8") as f:
+        importados, ignorados = importar_atendimentos(json.load(f), substituir)
+    eventos = 0
+    if os.path.exists(os.path.join(dados, "eventos.json")):
+        with open(os.path.join(dados, "eventos.json"), "r", encoding="utf-8") as f:
+            eventos = importar_eventos(json.load(f), substituir)
+    print(f"📥 {importados} atendimento(s) e {eventos} evento(s) importados ({len(ignorados)} ignorados)")
+
+@app.cli.command("exportar-json")
+@click.option("--dados", default=os.path.join(BASE_DIR, "data"), help="Pasta de destino")
+def exportar_json_cli(dados):
+    """Exporta o banco para atendimentos.json e eventos.json (formato do GitHub)."""
+    atendimentos = exportar_atendimentos_json()
+    eventos = sql_carregar_eventos()
+    for nome, lista in (("atendimentos.json", atendimentos), ("eventos.json", eventos)):
+        with open(os.path.join(dados, nome), "w", encoding="utf-8") as f:
+            json.dump(lista, f, ensure_ascii=False, indent=2)
+    print(f"📤 {len(atendimentos)} atendimento(s) e {len(eventos)} evento(s) exportados para {dados}")
 
-        if ok:
-            print("✅ atendimentos.json sincronizado no GitHub")
+def adicionar_atendimento_e_sincronizar(atendimento):
+    """
+    Adiciona atendimento:
+    - Valida número do laudo duplicado
+    - Acrescenta a inclusão no journal local (/tmp/atendimentos.journal.jsonl)
+    - Enfileira o journal pro GitHub (data/atendimentos.journal.jsonl)
+    """
 
-    except Exception as e:
-        print(f"❌ Erro ao enviar atendimentos.json: {e}")
+    numero = atendimento.get("numero_laudo")
 
-def carregar_telefones_alerta():
-    """Lê a lista de telefones que receberão os alertas de WhatsApp."""
-    if not os.path.exists(TELEFONES_ALERTA_FILE):
-        # Se não existir, retorna lista vazia (ou você pode retornar um exemplo)
-        return []
+    with _store_lock:
+        # 1️⃣ valida duplicidade
+        if numero_laudo_existe(numero):
+            raise ValueError(f"Já existe um laudo com o número {numero}")
 
-    try:
-        with open(TELEFONES_ALERTA_FILE, "r", encoding="utf-8") as f:
-            dados = json.load(f)
-            # Garante que seja uma lista de strings
-            if isinstance(dados, list):
-                return [str(t).strip() for t in dados if str(t).strip()]
-            return []
-    except Exception as e:
-        print(f"❌ Erro ao ler telefones_alerta.json: {e}")
-        return []
+        # 2️⃣ registra no journal + store e sincroniza
+        registrar_inclusao(atendimento)
+
+# telefones_alerta.json: lista de números (recebem todos os alertas) e/ou de
+# objetos {"numero": "...", "regioes": ["Centro", "CPA 2", ...]} que só
+# recebem alertas dessas regiões/bairros. O índice é montado uma vez por
+# versão do arquivo.
+_grupos_alerta = {"versao": None, "todos": [], "geral": [], "por_regiao": {}}
+_grupos_alerta_lock = threading.Lock()
+
+def _indice_telefones_alerta():
+    with _grupos_alerta_lock:
+        try:
+            st = os.stat(TELEFONES_ALERTA_FILE)
+            versao = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            # Se não existir, não há destinatários
+            _grupos_alerta.update(versao=None, todos=[], geral=[], por_regiao={})
+            return _grupos_alerta
+        if versao == _grupos_alerta["versao"]:
+            return _grupos_alerta
+
+        try:
+            with open(TELEFONES_ALERTA_FILE, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+        except Exception as e:
+            print(f"❌ Erro ao ler telefones_alerta.json: {e}")
+            dados = []
+        if not isinstance(dados, list):
+            dados = []
+
+        todos, geral, por_regiao = {}, {}, {}
+        for item in dados:
+            if isinstance(item, dict):
+                numero = str(item.get("numero") or "").strip()
+                regioes = item.get("regioes") or item.get("bairros") or []
+            else:
+                numero, regioes = str(item).strip(), []
+            if not numero:
+                continue
+            todos[numero] = True
+            if isinstance(regioes, str):
+                regioes = [regioes]
+            if not regioes:
+                geral[numero] = True
+            for regiao in regioes:
+                por_regiao.setdefault(_normalizar_texto(regiao), {})[numero] = True
+
+        _grupos_alerta.update(
+            versao=versao,
+            todos=list(todos),
+            geral=list(geral),
+            por_regiao={r: list(nums) for r, nums in por_regiao.items()},
+        )
+        return _grupos_alerta
+
+def telefones_para_alerta(alerta):
+    """
+    Destinatários de um alerta: os números gerais + os grupos das regiões
+    citadas em alerta["regiao"] (separadas por vírgula, ';', '/' ou ' e ').
+    Região sem grupo cadastrado -> vai para todos.
+    """
+    indice = _indice_telefones_alerta()
+    regiao = _normalizar_texto(alerta.get("regiao"))
+    partes = {regiao} | set(re.split(r"\s*(?:[,;/]|\be\b)\s*", regiao))
+    grupos = [indice["por_regiao"][p] for p in partes if p and p in indice["por_regiao"]]
+    if not grupos:
+        return list(indice["todos"])
+    numeros = dict.fromkeys(indice["geral"])
+    for grupo in grupos:
+        numeros.update(dict.fromkeys(grupo))
+    return list(numeros)
+
+# Mensagens por tipo de alerta: cabeçalho + detalhes do tipo + rodapé,
+# compiladas uma vez (Jinja, sem autoescape) na primeira vez que o tipo é usado.
+_ALERTA_CABECALHO = """🚨 DEFESA CIVIL DE CUIABÁ 🚨
+*{{ titulo|upper }}*
+
+📍 Região/Local: {{ regiao }}
+"""
+_ALERTA_DETALHES_CHUVA = """{% if chuva_mm %}
+🌧️ Precipitação prevista: *{{ chuva_mm }} mm*
+{% endif %}
+"""
+_ALERTA_DETALHES = {
+    "chuvas": _ALERTA_DETALHES_CHUVA,
+    "enxurrada": _ALERTA_DETALHES_CHUVA,
+    "alagamento": _ALERTA_DETALHES_CHUVA,
+    "deslizamento": _ALERTA_DETALHES_CHUVA,
+    "onda de calor": """{% if temperatura %}
+🌡️ Temperatura máxima prevista: *{{ temperatura }}°C*
+{% endif %}
+{% if umidade %}
+💨 Umidade relativa do ar: *{{ umidade }}%*
+{% endif %}
+""",
+}
+_ALERTA_RODAPE = """{% if mensagem %}
+
+ℹ️ {{ mensagem }}
+{% endif %}
+{% if validade %}
+
+⏰ Validade do alerta: {{ validade }}
+{% endif %}
+{% if data_emissao %}
+📅 Emitido em: {{ data_emissao }}
+{% endif %}
+
+👉 Em caso de risco, procure abrigo seguro e siga as orientações da Defesa Civil."""
+
+_jinja_alertas = Environment(autoescape=False, trim_blocks=True, lstrip_blocks=True)
+_modelos_mensagem = {}  # tipo (minúsculo) -> Template compilado
+
+def _modelo_mensagem(tipo):
+    chave = tipo.lower() if tipo.lower() in _ALERTA_DETALHES else ""
+    modelo = _modelos_mensagem.get(chave)
+    if modelo is None:
+        fonte = _ALERTA_CABECALHO + _ALERTA_DETALHES.get(chave, "") + _ALERTA_RODAPE
+        modelo = _modelos_mensagem[chave] = _jinja_alertas.from_string(fonte)
+    return modelo
 
 def montar_texto_alerta(alerta):
     """
@@ -238,86 +2184,484 @@ def montar_texto_alerta(alerta):
     'alerta' é um dict com campos tipo, titulo, mensagem, regiao, chuva_mm, temperatura, umidade, validade, data_emissao.
     """
     tipo = alerta.get("tipo", "Alerta")
-    titulo = alerta.get("titulo") or f"Alerta de {tipo}"
-    mensagem = alerta.get("mensagem", "")
-    regiao = alerta.get("regiao", "Região não informada")
-    chuva_mm = alerta.get("chuva_mm", "")
-    temperatura = alerta.get("temperatura", "")
-    umidade = alerta.get("umidade", "")
-    validade = alerta.get("validade", "")
-    data_emissao = alerta.get("data_emissao", "")
-
-    linhas = []
-    linhas.append(f"🚨 DEFESA CIVIL DE CUIABÁ 🚨")
-    linhas.append(f"*{titulo.upper()}*")
-    linhas.append("")
-    linhas.append(f"📍 Região/Local: {regiao}")
-
-    if tipo.lower() in ["chuvas", "enxurrada", "alagamento", "deslizamento"] and chuva_mm:
-        linhas.append(f"🌧️ Precipitação prevista: *{chuva_mm} mm*")
-
-    if tipo.lower() == "onda de calor":
-        if temperatura:
-            linhas.append(f"🌡️ Temperatura máxima prevista: *{temperatura}°C*")
-        if umidade:
-            linhas.append(f"💨 Umidade relativa do ar: *{umidade}%*")
-
-    if mensagem:
-        linhas.append("")
-        linhas.append(f"ℹ️ {mensagem}")
-
-    if validade:
-        linhas.append("")
-        linhas.append(f"⏰ Validade do alerta: {validade}")
-
-    if data_emissao:
-        linhas.append(f"📅 Emitido em: {data_emissao}")
-
-    linhas.append("")
-    linhas.append("👉 Em caso de risco, procure abrigo seguro e siga as orientações da Defesa Civil.")
-
-    return "\n".join(linhas)
+    return _modelo_mensagem(tipo).render(
+        titulo=alerta.get("titulo") or f"Alerta de {tipo}",
+        mensagem=alerta.get("mensagem", ""),
+        regiao=alerta.get("regiao", "Região não informada"),
+        chuva_mm=alerta.get("chuva_mm", ""),
+        temperatura=alerta.get("temperatura", ""),
+        umidade=alerta.get("umidade", ""),
+        validade=alerta.get("validade", ""),
+        data_emissao=alerta.get("data_emissao", ""),
+    )
+
+# ==========================================================
+# DISPARO DE ALERTAS WHATSAPP (em segundo plano)
+# ==========================================================
+# Cada destinatário vira uma tarefa num pool de WHATSAPP_CONCORRENCIA threads
+# que compartilham uma sessão HTTP (keep-alive) e um balde de tokens com a
+# vazão permitida pela Cloud API. 429 e 5xx são repetidos com backoff.
+class BaldeTokens:
+    """
+    Token bucket: até 'taxa' retiradas por segundo, com rajada de 'capacidade'.
+    O balde vale para a máquina, não por processo: o saldo fica em 'caminho'
+    ("<tokens> <instante>"), lido e regravado sob flock por quem retira.
+    """
+
+    def __init__(self, taxa, caminho, capacidade=None):
+        self.taxa = taxa
+        self.capacidade = capacidade or max(1.0, taxa)
+        self.caminho = caminho
+        self._trava = TravaProcesso(caminho + ".lock")
+
+    def _ler(self, agora):
+        try:
+            with open(self.caminho, "r") as f:
+                tokens, instante = f.read().split()
+            return float(tokens), float(instante)
+        except (OSError, ValueError):
+            return self.capacidade, agora  # primeiro uso (ou arquivo apagado): balde cheio
+
+    def consumir(self):
+        """Bloqueia até haver um token disponível."""
+        while True:
+            with self._trava:
+                agora = time.time()
+                tokens, instante = self._ler(agora)
+                # relógio voltando não gera tokens (nem apaga os que já foram contados)
+                tokens = min(self.capacidade, tokens + max(0.0, agora - instante) * self.taxa)
+                pegou = tokens >= 1
+                if pegou:
+                    tokens -= 1
+                else:
+                    espera = (1 - tokens) / self.taxa
+                with open(self.caminho, "w") as f:
+                    f.write(f"{tokens!r} {max(agora, instante)!r}")
+            if pegou:
+                return
+            time.sleep(espera)
+
+ENVIOS_WHATSAPP_MAX = 50  # envios mantidos em memória para consulta
+_envios_whatsapp = OrderedDict()  # envio_id -> {"alerta", "criado_em", "destinatarios": {numero: estado}}
+_envios_lock = threading.Lock()
+_pool_whatsapp = None
+_sessao_whatsapp = None
+_balde_whatsapp = BaldeTokens(WHATSAPP_TAXA, os.path.join(DATA_DIR, "whatsapp.balde"))
+
+def _obter_pool_whatsapp():
+    global _pool_whatsapp, _sessao_whatsapp
+    with _envios_lock:
+        if _pool_whatsapp is None:
+            import whatsapp
+            _sessao_whatsapp = whatsapp.nova_sessao(WHATSAPP_TOKEN, WHATSAPP_CONCORRENCIA)
+            _pool_whatsapp = ThreadPoolExecutor(max_workers=WHATSAPP_CONCORRENCIA,
+                                                thread_name_prefix="whatsapp")
+        return _pool_whatsapp
+
+def _atualizar_destinatario(envio_id, numero, **campos):
+    with _envios_lock:
+        _envios_whatsapp[envio_id]["destinatarios"][numero].update(campos)
+
+def _espera_retry(resp, tentativa):
+    """Retry-After da API, se vier; senão backoff exponencial com jitter."""
+    try:
+        return min(60.0, float(resp.headers["Retry-After"]))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return min(60.0, 2 ** tentativa) * (0.5 + random.random() / 2)
+
+def _enviar_whatsapp_destinatario(envio_id, numero, texto):
+    """Envia para um número, repetindo 429/5xx/erros de rede. Grava o estado final."""
+    import whatsapp
+    inicio = time.monotonic()
+    erro = None
+    for tentativa in range(1, WHATSAPP_TENTATIVAS + 1):
+        _balde_whatsapp.consumir()
+        _atualizar_destinatario(envio_id, numero, status="enviando", tentativas=tentativa)
+        resp = None
+        try:
+            resp = whatsapp.enviar_texto(_sessao_whatsapp, WHATSAPP_API_URL, numero, texto)
+            if resp.status_code in (200, 201):
+                _atualizar_destinatario(envio_id, numero, status="enviado", http_status=resp.status_code,
+                                        message_id=whatsapp.id_mensagem(resp), erro=None,
+                                        latencia_ms=round((time.monotonic() - inicio) * 1000))
+                print(f"✅ Alerta enviado com sucesso para {numero}")
+                registrar_entrega_alerta(envio_id, numero)
+                return
+            erro = f"{resp.status_code} - {resp.text[:200]}"
+        except whatsapp.ErroRede as e:
+            erro = str(e)
+        _atualizar_destinatario(envio_id, numero, erro=erro,
+                                http_status=resp.status_code if resp is not None else None)
+        if resp is not None and resp.status_code != 429 and resp.status_code < 500:
+            break  # erro do pedido (número inválido, token...): repetir não adianta
+        if tentativa < WHATSAPP_TENTATIVAS:
+            time.sleep(_espera_retry(resp, tentativa))
+    _atualizar_destinatario(envio_id, numero, status="falhou",
+                            latencia_ms=round((time.monotonic() - inicio) * 1000))
+    print(f"❌ Erro ao enviar para {numero}: {erro}")
+    registrar_entrega_alerta(envio_id, numero)
 
 def enviar_alerta_whatsapp(alerta):
     """
-    Envia um alerta via WhatsApp Cloud API para todos os números definidos em telefones_alerta.json.
+    Dispara o alerta via WhatsApp Cloud API para os números de
+    telefones_alerta.json que cobrem a região do alerta, em segundo plano.
+    Retorna o id do envio (para consultar o estado em /alerta/envios/<id>)
+    ou None se nada foi enviado.
+    Se o alerta já tiver "id" (salvo com salvar_alerta), o envio usa o mesmo id.
     """
-    numeros = carregar_telefones_alerta()
+    numeros = telefones_para_alerta(alerta)
     if not numeros:
         print("⚠️ Nenhum telefone configurado em telefones_alerta.json")
-        return
+        return None
 
     if not WHATSAPP_TOKEN or not WHATSAPP_PHONE_NUMBER_ID:
-        print("⚠️ WHATSAPP_TOKEN ou WHATSAPP_PHONE_NUMBER_ID não configurados.")
-        return
-
-    url = f"https://graph.facebook.com/{WHATSAPP_API_VERSION}/{WHATSAPP_PHONE_NUMBER_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-        "Content-Type": "application/json"
-    }
+        print("⚠️ WHATSAPP_TOKEN ou WHATSAPP_PHONE_NUMBER_ID não configurados.")
+        return None
 
     texto = montar_texto_alerta(alerta)
-
+    envio_id = alerta.get("id") or uuid.uuid4().hex
+    pool = _obter_pool_whatsapp()
+    with _envios_lock:
+        _envios_whatsapp[envio_id] = {
+            "alerta": alerta,
+            "criado_em": datetime.now().isoformat(timespec="seconds"),
+            "destinatarios": {n: {"status": "pendente", "tentativas": 0} for n in numeros},
+        }
+        while len(_envios_whatsapp) > ENVIOS_WHATSAPP_MAX:
+            _envios_whatsapp.popitem(last=False)
     for numero in numeros:
-        payload = {
+        pool.submit(_enviar_whatsapp_destinatario, envio_id, numero, texto)
+    print(f"📨 Alerta na fila para {len(numeros)} número(s) (envio {envio_id})")
+    return envio_id
+
+def estado_envio_whatsapp(envio_id):
+    """Cópia do estado do envio, com um resumo por status (ou None)."""
+    with _envios_lock:
+        envio = _envios_whatsapp.get(envio_id)
+        if envio is None:
+            return None
+        destinatarios = {n: dict(e) for n, e in envio["destinatarios"].items()}
+    resumo = {}
+    for e in destinatarios.values():
+        resumo[e["status"]] = resumo.get(e["status"], 0) + 1
+    return {
+        "envio_id": envio_id,
+        "criado_em": envio["criado_em"],
+        "concluido": all(e["status"] in ("enviado", "falhou") for e in destinatarios.values()),
+        "resumo": resumo,
+        "destinatarios": destinatarios,
+    }
+
+@app.cli.command("whatsapp-mock")
+@click.option("--porta", default=5055, show_default=True)
+@click.option("--falhas", default=0.0, show_default=True, help="Fração de respostas 429 simuladas.")
+@click.option("--latencia", default=0.05, show_default=True, help="Segundos de espera por resposta.")
+def whatsapp_mock_cli(porta, falhas, latencia):
+    """Sobe um endpoint local que imita a Cloud API (usar com WHATSAPP_API_URL)."""
+    mock = Flask("whatsapp_mock")
+
+    @mock.route("/messages", methods=["POST"])
+    def mensagens():
+        time.sleep(latencia)
+        if random.random() < falhas:
+            return jsonify({"error": {"message": "Rate limit", "code": 130429}}), 429, {"Retry-After": "1"}
+        dados = request.get_json(silent=True) or {}
+        return jsonify({
             "messaging_product": "whatsapp",
-            "to": numero,
-            "type": "text",
-            "text": {
-                "preview_url": False,
-                "body": texto
-            }
+            "contacts": [{"input": dados.get("to"), "wa_id": dados.get("to")}],
+            "messages": [{"id": f"wamid.mock.{uuid.uuid4().hex}"}],
+        })
+
+    print(f"🧪 Mock da WhatsApp Cloud API em http://127.0.0.1:{porta}/messages")
+    run_simple("127.0.0.1", porta, mock, threaded=True)  # app.run() é ignorado dentro do CLI
+
+# ==========================================================
+# HISTÓRICO DE ALERTAS (alertas.jsonl)
+# ==========================================================
+# Arquivo só de acréscimo com dois tipos de linha:
+#   {"registro": "alerta", "id": ..., <campos do alerta>}
+#   {"registro": "entrega", "alerta_id": ..., "numero": ..., "status": ..., ...}
+# Em memória fica só o índice (offset da linha do alerta + contadores de
+# entrega com as latências em faixas) e os últimos ALERTAS_JANELA alertas
+# completos. Páginas antigas são lidas do disco pelo offset.
+#
+# No GitHub o histórico é rotacionado: data/alertas.jsonl guarda só o trecho
+# atual, aberto por {"registro": "partes", "anteriores": N}; passando de
+# ALERTAS_PARTE_MAX_KB o trecho é selado em data/alertas/parte-<N+1>.jsonl,
+# que não muda mais. Cada envio leva só o trecho atual. O arquivo local
+# ALERTAS_PARTES_FILE lembra N e o offset local onde o trecho atual começa.
+GITHUB_ALERTAS_PATH = "data/alertas.jsonl"
+GITHUB_ALERTAS_PARTE = "data/alertas/parte-{:04d}.jsonl"
+ALERTAS_PARTES_FILE = ALERTAS_FILE + ".partes"
+ALERTAS_PARTE_MAX_KB = int(os.environ.get("ALERTAS_PARTE_MAX_KB", 256))
+ALERTAS_JANELA = int(os.environ.get("ALERTAS_JANELA", 50))
+LATENCIA_FAIXAS_MS = (100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000, 20000, 60000)
+_alertas_lock = TravaProcesso(ALERTAS_FILE + ".lock")
+_alertas = {
+    "carregado": False,
+    "arquivo": None,           # inode do alertas.jsonl lido (regravado -> índice refeito do zero)
+    "fim": 0,                  # até onde o arquivo já foi lido (outros workers também acrescentam)
+    "retentar_github": 0,      # time.monotonic() da próxima tentativa de ler o histórico remoto
+    "indice": OrderedDict(),   # id -> {"offset", "enviados", "falhas", "faixas"}
+    "recentes": OrderedDict(), # id -> alerta (últimos ALERTAS_JANELA)
+}
+
+def _aplicar_linha_alerta(registro, offset):
+    indice = _alertas["indice"]
+    if registro.get("registro") == "alerta":
+        indice[registro["id"]] = {
+            "offset": offset, "enviados": 0, "falhas": 0,
+            "faixas": [0] * (len(LATENCIA_FAIXAS_MS) + 1),
         }
+        recentes = _alertas["recentes"]
+        recentes[registro["id"]] = registro
+        while len(recentes) > ALERTAS_JANELA:
+            recentes.popitem(last=False)
+    elif registro.get("registro") == "entrega":
+        info = indice.get(registro.get("alerta_id"))
+        if info is None:
+            return
+        if registro.get("status") == "enviado":
+            info["enviados"] += 1
+            latencia = registro.get("latencia_ms") or 0
+            info["faixas"][bisect.bisect_left(LATENCIA_FAIXAS_MS, latencia)] += 1
+        else:
+            info["falhas"] += 1
 
-        try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=10)
-            if resp.status_code == 200 or resp.status_code == 201:
-                print(f"✅ Alerta enviado com sucesso para {numero}")
+def _ler_partes_alertas():
+    """{"partes": N selados no GitHub (None se o histórico remoto não foi lido), "inicio": offset local}."""
+    try:
+        with open(ALERTAS_PARTES_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"partes": 0, "inicio": 0}  # histórico de antes da rotação: tudo no trecho atual
+
+def _gravar_partes_alertas(partes, inicio):
+    gravar_atomico(ALERTAS_PARTES_FILE, json.dumps({"partes": partes, "inicio": inicio}).encode("utf-8"))
+
+def _cabecalho_alertas(partes):
+    return (json.dumps({"registro": "partes", "anteriores": partes}) + "\n").encode("utf-8")
+
+def _baixar_alertas_github():
+    """(partes seladas, trecho atual sem o cabeçalho, N) do GitHub, ou None se algo não veio."""
+    atual = ler_github_texto(GITHUB_ALERTAS_PATH)
+    if atual is None:
+        return None
+    partes = 0
+    primeira, _, resto = atual.partition("\n")
+    try:
+        cabecalho = json.loads(primeira)
+    except ValueError:
+        cabecalho = None
+    if isinstance(cabecalho, dict) and cabecalho.get("registro") == "partes":
+        partes, atual = int(cabecalho["anteriores"]), resto
+    anteriores = []
+    for n in range(1, partes + 1):
+        texto = ler_github_texto(GITHUB_ALERTAS_PARTE.format(n))
+        if texto is None:
+            return None
+        anteriores.append(texto)
+    return "".join(anteriores).encode("utf-8"), atual.encode("utf-8"), partes
+
+def _carregar_indice_alertas():
+    """Lê o trecho do arquivo ainda não visto (tudo, na primeira vez) e atualiza o índice."""
+    with _alertas_lock:
+        if not _alertas["carregado"] and not os.path.exists(ALERTAS_FILE):
+            baixado = _baixar_alertas_github()
+            if baixado is None:
+                # sem o histórico remoto, enviar o trecho local apagaria o de lá:
+                # os envios ficam parados até _mesclar_alertas_github conseguir lê-lo
+                print("⚠️  Histórico de alertas do GitHub indisponível: novos alertas ficam só neste servidor por enquanto")
+                _gravar_partes_alertas(None, 0)
+                _alertas["retentar_github"] = time.monotonic() + GITHUB_RETENTAR_LEITURA
             else:
-                print(f"❌ Erro ao enviar para {numero}: {resp.status_code} - {resp.text}")
-        except Exception as e:
-            print(f"❌ Exceção ao enviar WhatsApp para {numero}: {e}")
+                anteriores, atual, partes = baixado
+                if anteriores or atual:
+                    gravar_atomico(ALERTAS_FILE, anteriores + atual)
+                _gravar_partes_alertas(partes, len(anteriores))
+        _alertas["carregado"] = True
+        try:
+            arquivo = os.stat(ALERTAS_FILE).st_ino
+        except FileNotFoundError:
+            arquivo = None
+        if arquivo != _alertas["arquivo"]:
+            _alertas.update(arquivo=arquivo, fim=0, indice=OrderedDict(), recentes=OrderedDict())
+        try:
+            with open(ALERTAS_FILE, "rb") as f:
+                offset = f.seek(_alertas["fim"])
+                for linha in f:
+                    if not linha.endswith(b"\n"):
+                        break
+                    try:
+                        _aplicar_linha_alerta(json.loads(linha), offset)
+                    except ValueError:
+                        print(f"⚠️  Linha inválida no histórico de alertas ignorada (offset {offset})")
+                    offset += len(linha)
+                _alertas["fim"] = offset
+        except FileNotFoundError:
+            pass
+
+def _anexar_alerta(registro):
+    with _alertas_lock:
+        _carregar_indice_alertas()
+        linha = (json.dumps(registro, ensure_ascii=False) + "\n").encode("utf-8")
+        offset = anexar_sincronizado(ALERTAS_FILE, linha)
+        _aplicar_linha_alerta(registro, offset)
+        _alertas.update(arquivo=os.stat(ALERTAS_FILE).st_ino, fim=offset + len(linha))
+
+def _mesclar_alertas_github():
+    """
+    O histórico remoto não foi lido quando esta pasta começou (GitHub fora na
+    subida): tenta de novo, no máximo a cada GITHUB_RETENTAR_LEITURA s. Se
+    vier, o arquivo local passa a ser o remoto + as linhas gravadas só aqui.
+    Retorna o novo {"partes", "inicio"} ou None se ainda não deu.
+    """
+    if time.monotonic() < _alertas["retentar_github"]:
+        return None
+    baixado = _baixar_alertas_github()
+    if baixado is None:
+        _alertas["retentar_github"] = time.monotonic() + GITHUB_RETENTAR_LEITURA
+        return None
+    anteriores, atual, partes = baixado
+    if atual and not atual.endswith(b"\n"):
+        atual += b"\n"
+    try:
+        with open(ALERTAS_FILE, "rb") as f:
+            locais = f.read()
+    except FileNotFoundError:
+        locais = b""
+    gravar_atomico(ALERTAS_FILE, anteriores + atual + locais)
+    _gravar_partes_alertas(partes, len(anteriores))
+    _carregar_indice_alertas()  # arquivo regravado: o índice é refeito
+    print(f"🔄 Histórico de alertas do GitHub recuperado; {len(locais.splitlines())} linha(s) locais vão no próximo envio")
+    return _ler_partes_alertas()
+
+def _enviar_alertas_github(mensagem):
+    """Envia o trecho atual do histórico; acima de ALERTAS_PARTE_MAX_KB, sela-o numa parte."""
+    try:
+        with _alertas_lock:
+            meta = _ler_partes_alertas()
+            if meta["partes"] is None:
+                meta = _mesclar_alertas_github()
+            if meta is None:
+                print("🛑 Histórico de alertas NÃO enviado: o do GitHub ainda não foi lido (nova tentativa no próximo envio)")
+                return
+            with open(ALERTAS_FILE, "rb") as f:
+                f.seek(meta["inicio"])
+                trecho = f.read()
+            trecho = trecho[:trecho.rfind(b"\n") + 1]  # só linhas completas
+            if len(trecho) <= ALERTAS_PARTE_MAX_KB * 1024:
+                enviar_ou_enfileirar_github_lote(
+                    [(GITHUB_ALERTAS_PATH, _cabecalho_alertas(meta["partes"]) + trecho)], mensagem)
+                return
+            partes = meta["partes"] + 1
+            arquivos = [
+                (GITHUB_ALERTAS_PARTE.format(partes), trecho),
+                (GITHUB_ALERTAS_PATH, _cabecalho_alertas(partes)),
+            ]
+            if enviar_ou_enfileirar_github_lote(arquivos, f"{mensagem} (histórico: parte {partes})"):
+                _gravar_partes_alertas(partes, meta["inicio"] + len(trecho))
+    except Exception as e:
+        print(f"❌ Erro ao enviar histórico de alertas: {e}")
+
+def salvar_alerta(alerta):
+    """Grava o alerta no histórico (gera alerta["id"] se faltar) e retorna o id."""
+    alerta.setdefault("id", uuid.uuid4().hex)
+    _anexar_alerta({"registro": "alerta", **alerta})
+    _enviar_alertas_github(f"Alerta {alerta.get('titulo') or alerta['id']}")
+    return alerta["id"]
+
+def registrar_entrega_alerta(envio_id, numero):
+    """Grava o estado final de um destinatário; ao concluir o envio, sincroniza o histórico."""
+    estado = estado_envio_whatsapp(envio_id)
+    if estado is None:
+        return
+    final = estado["destinatarios"][numero]
+    _anexar_alerta({
+        "registro": "entrega",
+        "alerta_id": envio_id,
+        "numero": numero,
+        "status": final.get("status"),
+        "tentativas": final.get("tentativas"),
+        "http_status": final.get("http_status"),
+        "latencia_ms": final.get("latencia_ms"),
+        "erro": final.get("erro"),
+        "em": datetime.now().isoformat(timespec="seconds"),
+    })
+    if estado["concluido"]:
+        _enviar_alertas_github(f"Entrega do alerta {envio_id}")
+
+def _percentil_faixas(faixas, p):
+    """Limite superior da faixa que contém o percentil p (ms), ou None."""
+    total = sum(faixas)
+    if not total:
+        return None
+    alvo = math.ceil(total * p / 100)
+    acumulado = 0
+    for i, qtd in enumerate(faixas):
+        acumulado += qtd
+        if acumulado >= alvo:
+            return LATENCIA_FAIXAS_MS[i] if i < len(LATENCIA_FAIXAS_MS) else None
+    return None
+
+def estatisticas_alerta(alerta_id):
+    """Enviados, falhas, pendentes e percentis de latência (aproximados por faixa)."""
+    with _alertas_lock:
+        _carregar_indice_alertas()
+        info = _alertas["indice"].get(alerta_id)
+        if info is None:
+            return None
+        enviados, falhas, faixas = info["enviados"], info["falhas"], list(info["faixas"])
+    envio = estado_envio_whatsapp(alerta_id)
+    pendentes = sum(qtd for status, qtd in envio["resumo"].items()
+                    if status not in ("enviado", "falhou")) if envio else 0
+    return {
+        "enviados": enviados,
+        "falhas": falhas,
+        "pendentes": pendentes,
+        "latencia_ms": {f"p{p}": _percentil_faixas(faixas, p) for p in (50, 90, 99)},
+    }
+
+def _ler_alerta(alerta_id):
+    """Alerta da janela recente ou lido do disco pelo offset."""
+    with _alertas_lock:
+        alerta = _alertas["recentes"].get(alerta_id)
+        if alerta is not None:
+            return dict(alerta)
+        offset = _alertas["indice"][alerta_id]["offset"]
+    with open(ALERTAS_FILE, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+def carregar_alertas_enviados():
+    """Últimos ALERTAS_JANELA alertas (do mais antigo ao mais novo), com estatísticas de entrega."""
+    with _alertas_lock:
+        _carregar_indice_alertas()
+        recentes = [dict(a) for a in _alertas["recentes"].values()]
+    for a in recentes:
+        a["entrega"] = estatisticas_alerta(a["id"])
+    return recentes
+
+def historico_alertas(pagina=1, por_pagina=20):
+    """Página do histórico completo, do mais novo para o mais antigo."""
+    with _alertas_lock:
+        _carregar_indice_alertas()
+        ids = list(_alertas["indice"].keys())
+    total = len(ids)
+    inicio = total - (pagina - 1) * por_pagina
+    pagina_ids = reversed(ids[max(0, inicio - por_pagina):max(0, inicio)])
+    alertas = []
+    for alerta_id in pagina_ids:
+        a = _ler_alerta(alerta_id)
+        a["entrega"] = estatisticas_alerta(alerta_id)
+        alertas.append(a)
+    return {
+        "pagina": pagina,
+        "por_pagina": por_pagina,
+        "total": total,
+        "paginas": max(1, math.ceil(total / por_pagina)),
+        "alertas": alertas,
+    }
 
 # ==========================================================
 # CAMPOS E PROCESSAMENTO DE LAUDO
@@ -339,85 +2683,766 @@ campos_chuvas = [
     ("Telefone", "telefone"),
 ] + campos_base
 
-def processar_laudo(contexto, tipo, modelo_docx):
+# ==========================================================
+# MODELOS DOCX (parseados uma vez e copiados por requisição)
+# ==========================================================
+MODELOS_LAUDO = {
+    "chuvas": "modelo_laudo_chuvas.docx",
+    "regularizacao": "modelo_laudo_reg.docx",
+    "incendios": "modelo_laudo_incendio.docx",
+    "deslizamentos": "modelo_laudo_massa.docx",
+}
+NOMES_LAUDO = {
+    "chuvas": "Chuvas",
+    "regularizacao": "Regularização",
+    "incendios": "Incêndios",
+    "deslizamentos": "Deslizamentos",
+}
+
+_modelos_lock = threading.Lock()
+_modelos = {}  # caminho -> {"mtime": ..., "docx": Document já parseado}
+
+def _caminho_modelo(modelo_docx):
+    return modelo_docx if os.path.isabs(modelo_docx) else os.path.join(BASE_DIR, modelo_docx)
+
+def _modelo_parseado(modelo_docx):
+    """Document do modelo, relido só quando o arquivo muda (mtime)."""
+    caminho = _caminho_modelo(modelo_docx)
+    mtime = os.stat(caminho).st_mtime_ns  # FileNotFoundError se o modelo não existir
+    with _modelos_lock:
+        atual = _modelos.get(caminho)
+        if atual and atual["mtime"] == mtime:
+            return caminho, atual["docx"]
+        import laudo_render
+        docx = laudo_render.parsear_modelo(caminho)
+        _modelos[caminho] = {"mtime": mtime, "docx": docx}
+        return caminho, docx
+
+def carregar_modelo(modelo_docx):
+    """
+    DocxTemplate pronto para renderizar, sem reabrir o zip nem reparsear o XML:
+    cada chamada recebe uma cópia própria do documento em cache.
+    """
+    import laudo_render
+    caminho, docx = _modelo_parseado(modelo_docx)
+    return laudo_render.copiar_modelo(caminho, docx)
+
+def _numero_laudo_do_contexto(contexto):
+    numero_laudo = (contexto.get("numero_laudo") or "").strip()
+    if not numero_laudo:
+        numero_laudo = datetime.now().strftime("%Y%m%d%H%M%S")
+    contexto["numero_laudo"] = numero_laudo
+    contexto["ano"] = date.today().year
+    return numero_laudo
+
+def salvar_imagens_formulario(tipo, numero_laudo, dono):
+    """
+    Guarda as fotos 2–7 do formulário em FOTOS_DIR (fotos idênticas ficam uma
+    vez só), marcadas como usadas por 'dono', e devolve [(i, caminho ou None, descrição)].
+    """
+    imagens = []
+    for i in range(2, 8):
+        arquivo = request.files.get(f"imagem{i}")
+        desc = request.form.get(f"descricao{i}", "")
+        caminho = None
+        if arquivo and arquivo.filename:
+            caminho = arquivo.stream.guardar_deduplicado(FOTOS_DIR, ".upload", dono)
+        imagens.append((i, caminho, desc))
+    return imagens
+
+def limpar_fotos_laudo(imagens, dono):
+    """Solta as fotos de 'dono' e apaga original e versão otimizada das que ninguém mais usa."""
+    with _fotos_lock:
+        for caminho in {c for _, c, _ in imagens if c}:
+            try:
+                os.remove(f"{caminho}.{dono}.ref")
+            except OSError:
+                pass
+            if glob.glob(glob.escape(caminho) + ".*.ref"):
+                continue
+            for arquivo in (caminho, os.path.splitext(caminho)[0] + ".jpg"):
+                try:
+                    os.remove(arquivo)
+                except OSError:
+                    pass
+
+def _largura_foto_px():
+    """Pixels necessários para imprimir FOTO_LARGURA_MM a FOTO_DPI."""
+    return round(FOTO_LARGURA_MM / 25.4 * FOTO_DPI)
+
+def otimizar_foto(caminho, destino=None):
+    """
+    Reduz a foto para a largura de impressão e grava como JPEG em destino
+    (ou por cima do original). Corrige a orientação EXIF.
+    Retorna (bytes antes, bytes depois).
+    """
+    import laudo_render
+    destino = destino or caminho
+    antes = os.path.getsize(caminho)
+    tmp = f"{destino}.{uuid.uuid4().hex[:8]}.tmp"
     try:
-        doc = DocxTemplate(modelo_docx)
-
-        numero_laudo = (contexto.get("numero_laudo") or "").strip()
-        if not numero_laudo:
-            numero_laudo = datetime.now().strftime("%Y%m%d%H%M%S")
-
-        contexto["numero_laudo"] = numero_laudo
-        contexto["ano"] = date.today().year
-
-        # Mapa (imagem1)
-        lat, lon = contexto.get("latitude"), contexto.get("longitude")
-        if lat and lon:
-            caminho_mapa = os.path.join(UPLOAD_FOLDER, f"mapa_{numero_laudo}.png")
-            if gerar_mapa(lat, lon, caminho_mapa):
-                contexto["imagem1"] = InlineImage(doc, caminho_mapa, width=Mm(100))
-                contexto["descricao1"] = "Localização Geográfica"
-            else:
-                contexto["imagem1"] = ""
-                contexto["descricao1"] = ""
+        formato, girada, reduzida = laudo_render.reduzir_foto(caminho, tmp, _largura_foto_px(), FOTO_QUALIDADE)
+        depois = os.path.getsize(tmp)
+        if formato == "JPEG" and not girada and not reduzida and depois >= antes:
+            # já estava leve: mantém o original
+            shutil.copyfile(caminho, tmp)
+            depois = antes
+        os.replace(tmp, destino)
+        return antes, depois
+    except Exception as e:
+        print(f"⚠️  Não foi possível otimizar {caminho}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if destino != caminho:
+            shutil.copyfile(caminho, destino)
+        return antes, antes
+
+def _otimizar_upload(caminho):
+    """<sha>.upload -> <sha>.jpg, reaproveitando a versão já otimizada de uma foto idêntica."""
+    destino = os.path.splitext(caminho)[0] + ".jpg"
+    if destino != caminho and os.path.exists(destino):
+        return destino, os.path.getsize(caminho), os.path.getsize(destino)
+    antes, depois = otimizar_foto(caminho, destino)
+    return destino, antes, depois
+
+def otimizar_fotos(imagens):
+    """
+    Otimiza as fotos do laudo em paralelo.
+    Retorna (imagens com os caminhos otimizados, bytes antes, bytes depois).
+    """
+    caminhos = [caminho for _, caminho, _ in imagens if caminho]
+    if not caminhos:
+        return imagens, 0, 0
+    with ThreadPoolExecutor(max_workers=len(caminhos)) as pool:
+        resultados = dict(zip(caminhos, pool.map(_otimizar_upload, caminhos)))
+    otimizadas = [(i, resultados[c][0] if c else None, desc) for i, c, desc in imagens]
+    return (otimizadas,
+            sum(r[1] for r in resultados.values()),
+            sum(r[2] for r in resultados.values()))
+
+def renderizar_laudo(contexto, tipo, modelo_docx, imagens, job_id=None):
+    """
+    Gera mapa + DOCX a partir de dados já gravados em disco.
+    Não depende da requisição, então pode rodar no pool de processos.
+    O DOCX fica num nome temporário em UPLOAD_FOLDER: só vai para o nome
+    final (publicar_docx) depois de conferido que o número continua livre.
+    Retorna (nome_arquivo, caminho temporário).
+    """
+    import laudo_render
+    if job_id:
+        _gravar_job(job_id, status="running")
+    doc = carregar_modelo(modelo_docx)
+    contexto = dict(contexto)
+    numero_laudo = contexto["numero_laudo"]
+
+    # Mapa (imagem1): cópia própria, o cache pode descartar o PNG antes do render
+    lat, lon = contexto.get("latitude"), contexto.get("longitude")
+    caminho_mapa = gerar_mapa(lat, lon, copia_mapa_temporaria()) if lat and lon else None
+    try:
+        if caminho_mapa:
+            contexto["imagem1"] = laudo_render.imagem(doc, caminho_mapa, 100)
+            contexto["descricao1"] = "Localização Geográfica"
         else:
             contexto["imagem1"] = ""
             contexto["descricao1"] = ""
 
-        # Imagens 2–7
-        for i in range(2, 8):
-            arquivo = request.files.get(f"imagem{i}")
-            desc = request.form.get(f"descricao{i}", "")
+        # Imagens 2–7 (reduzidas para o tamanho de impressão antes de entrar no DOCX)
+        imagens, antes, depois = otimizar_fotos(imagens)
+        if antes:
+            print(f"📉 Fotos do laudo {numero_laudo}: {antes / 1024:.0f} KB → {depois / 1024:.0f} KB "
+                  f"({(antes - depois) / 1024:.0f} KB economizados)")
+            if job_id:
+                _gravar_job(job_id, fotos_bytes_originais=antes, fotos_bytes_economizados=antes - depois)
+        for i, caminho, desc in imagens:
             contexto[f"descricao{i}"] = desc
-
-            if arquivo and arquivo.filename:
-                caminho = os.path.join(UPLOAD_FOLDER, f"{tipo}_img{i}_{numero_laudo}.jpg")
-                arquivo.save(caminho)
-                contexto[f"imagem{i}"] = InlineImage(doc, caminho, width=Mm(100))
-            else:
-                contexto[f"imagem{i}"] = ""
+            contexto[f"imagem{i}"] = laudo_render.imagem(doc, caminho, FOTO_LARGURA_MM) if caminho else ""
 
         # Renderiza e salva DOCX
         nome_arquivo = f"{tipo.capitalize()}_{numero_laudo}.docx"
-        caminho_saida = os.path.join(UPLOAD_FOLDER, nome_arquivo)
+        caminho_tmp = os.path.join(UPLOAD_FOLDER, f".{nome_arquivo}.{uuid.uuid4().hex[:8]}.tmp")
         doc.render(contexto)
-        doc.save(caminho_saida)
-        print(f"✅ Laudo gerado local: {caminho_saida}")
+        doc.save(caminho_tmp)
+    finally:
+        if caminho_mapa:
+            os.remove(caminho_mapa)
+    return nome_arquivo, caminho_tmp
+
+def publicar_docx(caminho_tmp, nome_arquivo):
+    """Move o DOCX renderizado para o nome final em UPLOAD_FOLDER. Retorna o caminho final."""
+    caminho_saida = os.path.join(UPLOAD_FOLDER, nome_arquivo)
+    os.replace(caminho_tmp, caminho_saida)
+    print(f"✅ Laudo gerado local: {caminho_saida}")
+    return caminho_saida
+
+def descartar_docx(caminho_tmp):
+    try:
+        os.remove(caminho_tmp)
+    except OSError:
+        pass
+
+def _atendimento_do_laudo(contexto, tipo, nome_arquivo):
+    """Registro de atendimento de um laudo gerado. Retorna (atendimento, remote_path do DOCX)."""
+    remote_path = f"{GITHUB_UPLOADS_PATH}/{nome_arquivo}"
+    atendimento = {
+        "origem": tipo.capitalize(),
+        "numero_laudo": contexto["numero_laudo"],
+        "bairro": contexto.get("bairro", ""),
+        "latitude": contexto.get("latitude", ""),
+        "longitude": contexto.get("longitude", ""),
+        "data_vistoria": contexto.get("data_vistoria", ""),
+        "grau_risco": contexto.get("grau_risco", ""),
+        "evento_id": contexto.get("evento_id", ""),
+        "arquivo": nome_arquivo,
+        "arquivo_github": f"https://github.com/{GITHUB_REPO}/blob/{GITHUB_BRANCH}/{remote_path}",
+        "data_registro": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+    }
+    return atendimento, remote_path
+
+def registrar_laudo(contexto, tipo, nome_arquivo, caminho_tmp):
+    """
+    Publica o DOCX renderizado, enfileira para o GitHub e registra o
+    atendimento. Se o número foi cadastrado enquanto o laudo renderizava,
+    descarta o DOCX novo (o do laudo já cadastrado fica intacto) e levanta
+    ValueError.
+    """
+    numero_laudo = contexto["numero_laudo"]
+    atendimento, remote_path = _atendimento_do_laudo(contexto, tipo, nome_arquivo)
+
+    with _store_lock:
+        if numero_laudo_existe(numero_laudo):
+            descartar_docx(caminho_tmp)
+            raise ValueError(f"Já existe um laudo com o número {numero_laudo}")
+        caminho_saida = publicar_docx(caminho_tmp, nome_arquivo)
 
-        # Upload DOCX para GitHub
-        repo = _get_github()
-        remote_path = f"{GITHUB_UPLOADS_PATH}/{nome_arquivo}"
+        # Upload DOCX para GitHub (via outbox, em segundo plano)
         try:
             with open(caminho_saida, "rb") as f:
                 content = f.read()
-            upload_or_update_github_file(
-                repo, remote_path, content,
+            enviar_ou_enfileirar_github(
+                remote_path, content,
                 f"Laudo {numero_laudo} - {tipo.capitalize()}"
             )
         except Exception as e:
             print(f"❌ Erro ao enviar DOCX p/ GitHub: {e}")
 
         # Registra atendimento
-        atendimento = {
-            "origem": tipo.capitalize(),
-            "numero_laudo": numero_laudo,
-            "bairro": contexto.get("bairro", ""),
-            "latitude": contexto.get("latitude", ""),
-            "longitude": contexto.get("longitude", ""),
-            "data_vistoria": contexto.get("data_vistoria", ""),
-            "grau_risco": contexto.get("grau_risco", ""),
-            "evento_id": contexto.get("evento_id", ""),
-            "arquivo": nome_arquivo,
-            "arquivo_github": f"https://github.com/{GITHUB_REPO}/blob/{GITHUB_BRANCH}/{remote_path}",
-            "data_registro": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-        }
         adicionar_atendimento_e_sincronizar(atendimento)
 
-        return numero_laudo
+# ==========================================================
+# FILA DE RENDERIZAÇÃO DE LAUDOS (pool de processos + jobs)
+# ==========================================================
+# O POST só valida, grava as fotos e cria o job; mapa e DOCX são gerados em
+# RENDER_WORKERS processos. O status fica em JOBS_DIR/<id>.json, legível por
+# qualquer worker web.
+_pool_render_lock = threading.Lock()
+_pool_render = None
+_dono_jobs_atual = {"id": None, "trava": None}
+
+def _caminho_job(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+def _gravar_job(job_id, **campos):
+    job = obter_job(job_id) or {"id": job_id}
+    job.update(campos, atualizado_em=datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
+    gravar_atomico(_caminho_job(job_id), json.dumps(job, ensure_ascii=False).encode("utf-8"))
+    return job
+
+def _jobs_ativos():
+    """Jobs ainda na fila ou renderizando (aproveita para apagar os finalizados há mais de 1 dia)."""
+    ativos = []
+    limite = time.time() - 24 * 3600
+    for nome in os.listdir(JOBS_DIR):
+        if not nome.endswith(".json"):
+            continue
+        job = obter_job(nome[:-5])
+        if job and job.get("status") in ("queued", "running"):
+            ativos.append(job)
+            continue
+        try:
+            if os.path.getmtime(os.path.join(JOBS_DIR, nome)) < limite:
+                os.remove(os.path.join(JOBS_DIR, nome))
+        except OSError:
+            pass
+    return ativos
+
+def obter_job(job_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id or ""):
+        return None
+    try:
+        with open(_caminho_job(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _dono_jobs():
+    """
+    Id deste processo como dono dos jobs que cria. O processo segura um flock
+    em JOBS_DIR/dono-<id>.lock enquanto vive: se a trava estiver livre, o dono
+    morreu (restart, crash) e os jobs dele não vão terminar.
+    """
+    with _pool_render_lock:
+        if _dono_jobs_atual["id"] is None:
+            dono = uuid.uuid4().hex
+            trava = TravaProcesso(os.path.join(JOBS_DIR, f"dono-{dono}.lock"))
+            trava.acquire()
+            _dono_jobs_atual.update(id=dono, trava=trava)
+        return _dono_jobs_atual["id"]
+
+def _dono_morto(dono):
+    if not dono:
+        return True  # job de antes de existir o campo "dono"
+    if dono == _dono_jobs_atual["id"]:
+        return False
+    caminho = os.path.join(JOBS_DIR, f"dono-{dono}.lock")
+    if not os.path.exists(caminho):
+        return True
+    trava = TravaProcesso(caminho)
+    if not trava.acquire(blocking=False):
+        return False
+    trava.release()
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+    return True
+
+def falhar_jobs_orfaos():
+    """
+    Marca como "failed" os jobs ainda "queued"/"running" cujo processo dono
+    não existe mais (ficariam assim para sempre). Roda na subida de cada
+    worker; jobs de outro worker vivo não são tocados.
+    """
+    orfaos = 0
+    for job in _jobs_ativos():
+        if _dono_morto(job.get("dono")):
+            _gravar_job(job["id"], status="failed", erro="Servidor reiniciado antes de concluir o laudo")
+            limpar_fotos_laudo([(None, c, None) for c in job.get("fotos", [])], job["id"])
+            orfaos += 1
+    if orfaos:
+        print(f"⚠️  {orfaos} job(s) de laudo interrompido(s) por reinício marcados como falha")
+    return orfaos
+
+def _iniciar_processo_render():
+    """
+    Initializer de cada processo do pool: importa a pilha de renderização e
+    parseia os modelos antes do primeiro laudo (o cache de modelos é por
+    processo; o do processo web não serve aos filhos).
+    """
+    for modelo in MODELOS_LAUDO.values():
+        try:
+            carregar_modelo(modelo)
+        except Exception as e:
+            # o job que usar o modelo falha com a mensagem certa
+            print(f"⚠️  Modelo de laudo não carregado no pool ({modelo}): {e}")
+
+def _obter_pool_render():
+    global _pool_render
+    with _pool_render_lock:
+        if _pool_render is None:
+            # spawn: o filho não herda threads/locks do processo web
+            _pool_render = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_iniciar_processo_render,
+            )
+        return _pool_render
 
+def _finalizar_job(job_id, contexto, tipo, imagens, futuro):
+    """Callback no processo web: registra o laudo renderizado ou a falha."""
+    try:
+        nome_arquivo, caminho_tmp = futuro.result()
+        registrar_laudo(contexto, tipo, nome_arquivo, caminho_tmp)
+        _gravar_job(job_id, status="done", arquivo=nome_arquivo)
     except Exception as e:
-        print(f"❌ Erro ao processar laudo ({tipo}): {e}")
-        return None
+        print(f"❌ Erro ao processar laudo ({tipo}) no job {job_id}: {e}")
+        _gravar_job(job_id, status="failed", erro=str(e))
+    # o DOCX já tem as fotos e já está na outbox: os arquivos temporários podem sair
+    limpar_fotos_laudo(imagens, job_id)
+
+def _submeter_render(*args):
+    """Submete ao pool de renderização; se o pool quebrou (filho morto), recria e tenta de novo."""
+    global _pool_render
+    try:
+        return _obter_pool_render().submit(*args)
+    except RuntimeError:
+        with _pool_render_lock:
+            _pool_render = None
+        return _obter_pool_render().submit(*args)
+
+def enfileirar_laudo(contexto, tipo, modelo_docx):
+    """
+    Valida, grava as fotos e manda o laudo para o pool de renderização.
+    Retorna (job_id, numero_laudo). ValueError se o número já existe;
+    FileNotFoundError se o modelo DOCX não está no servidor.
+    """
+    numero_laudo = _numero_laudo_do_contexto(contexto)
+    if numero_laudo_existe(numero_laudo):
+        raise ValueError(f"Já existe um laudo com o número {numero_laudo}")
+    if not os.path.exists(_caminho_modelo(modelo_docx)):
+        raise FileNotFoundError(f"Modelo de laudo ausente: {modelo_docx}")
+    job_id = uuid.uuid4().hex
+    imagens = salvar_imagens_formulario(tipo, numero_laudo, job_id)
+    _gravar_job(job_id, status="queued", tipo=tipo, numero_laudo=numero_laudo, dono=_dono_jobs(),
+                fotos=[c for _, c, _ in imagens if c],
+                criado_em=datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
+    futuro = _submeter_render(renderizar_laudo, contexto, tipo, modelo_docx, imagens, job_id)
+    futuro.add_done_callback(partial(_finalizar_job, job_id, contexto, tipo, imagens))
+    return job_id, numero_laudo
+
+def _erro_laudo(mensagem, status):
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"erro": mensagem}), status
+    return f"⚠️ {mensagem}", status
+
+def responder_laudo(contexto, tipo, mensagem_erro):
+    """
+    Enfileira o laudo e monta a resposta comum das rotas de laudo: JSON 202
+    para clientes de API, redirect para o formulário. Número repetido volta
+    como 400 com a mensagem; modelo ausente, 500 com a mensagem; o resto,
+    500 com 'mensagem_erro'.
+    """
+    try:
+        job_id, numero_laudo = enfileirar_laudo(contexto, tipo, MODELOS_LAUDO[tipo])
+    except ValueError as e:
+        return _erro_laudo(str(e), 400)
+    except FileNotFoundError as e:
+        print(f"❌ Erro ao enfileirar laudo ({tipo}): {e}")
+        return _erro_laudo(str(e), 500)
+    except Exception as e:
+        print(f"❌ Erro ao enfileirar laudo ({tipo}): {e}")
+        return _erro_laudo(mensagem_erro, 500)
+    status_url = url_for("status_job_laudo", job_id=job_id)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job_id, "numero_laudo": numero_laudo, "status_url": status_url}), 202
+    flash(f"Laudo {numero_laudo} em processamento (acompanhe em {status_url}).", "success")
+    return redirect(url_for("atendimentos"))
+
+@app.route("/laudos/jobs/<job_id>")
+def status_job_laudo(job_id):
+    if not session.get("logado"):
+        return redirect(url_for("login"))
+    job = obter_job(job_id)
+    if not job:
+        return jsonify({"erro": "Job não encontrado"}), 404
+    if job.get("status") == "done":
+        if job.get("lote"):
+            job["download_url"] = url_for("download_lote", job_id=job_id)
+        else:
+            job["download_url"] = url_for("download_arquivo", nome_arquivo=job["arquivo"])
+    return jsonify(job)
+
+# ==========================================================
+# LAUDOS EM LOTE (planilha CSV/XLSX)
+# ==========================================================
+# Uma linha por laudo, com as colunas de campos_base (pelo rótulo ou pela
+# chave), grau_risco, evento_id e, opcionalmente, imagem2..imagem7 (nome do
+# arquivo da foto) + descricao2..descricao7. Colunas extras vão para o contexto.
+# O lote inteiro usa uma checagem de duplicidade, uma sessão de tiles (mapas
+# gerados antes, no processo principal), o pool de renderização e, no fim,
+# uma única gravação no journal e um único commit com o journal + os DOCX.
+_COLUNAS_LOTE = {
+    _normalizar_texto(nome): chave
+    for rotulo, chave in campos_base + [("Grau de risco", "grau_risco"), ("Evento", "evento_id")]
+    for nome in (rotulo, chave)
+}
+
+def _coluna_lote(cabecalho):
+    return _COLUNAS_LOTE.get(_normalizar_texto(cabecalho), str(cabecalho).strip())
+
+def _valor_celula(valor):
+    """Célula da planilha como texto, no mesmo formato que viria do formulário."""
+    if valor is None:
+        return ""
+    if isinstance(valor, (datetime, date)):
+        return valor.strftime("%Y-%m-%d")
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor).strip()
+
+def ler_planilha_laudos(caminho):
+    """
+    Lê a planilha (.xlsx ou .csv com ',' / ';' / tab) e devolve uma lista de
+    dicts com as chaves normalizadas e "_linha" (número da linha na planilha).
+    """
+    if caminho.lower().endswith(".xlsx"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("Para ler .xlsx instale o pacote openpyxl (ou envie a planilha em .csv)")
+        wb = load_workbook(caminho, read_only=True, data_only=True)
+        try:
+            linhas = wb.active.iter_rows(values_only=True)
+            cabecalho = next(linhas, None) or ()
+            registros = [dict(zip(cabecalho, linha)) for linha in linhas]
+        finally:
+            wb.close()
+    else:
+        with open(caminho, "rb") as f:
+            bruto = f.read()
+        try:
+            texto = bruto.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            texto = bruto.decode("latin-1")  # CSV salvo pelo Excel em português
+        try:
+            dialeto = csv.Sniffer().sniff(texto[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialeto = csv.excel
+        registros = list(csv.DictReader(io.StringIO(texto), dialect=dialeto))
+
+    resultado = []
+    for n, registro in enumerate(registros, start=2):  # linha 1 é o cabeçalho
+        linha = {_coluna_lote(k): _valor_celula(v) for k, v in registro.items() if k not in (None, "")}
+        if any(linha.values()):
+            linha["_linha"] = n
+            resultado.append(linha)
+    return resultado
+
+def _guardar_foto_lote(caminho, dono):
+    """
+    Copia uma foto da pasta do lote para FOTOS_DIR (<sha256>.upload), sem tocar
+    no original, e a marca como usada por 'dono'.
+    """
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    destino = os.path.join(FOTOS_DIR, h.hexdigest() + ".upload")
+    tmp = f"{destino}.{uuid.uuid4().hex[:8]}.tmp"
+    shutil.copyfile(caminho, tmp)
+    with _fotos_lock:
+        if os.path.exists(destino):
+            os.remove(tmp)
+        else:
+            os.replace(tmp, destino)
+        _referenciar_foto(destino, dono)
+    return destino
+
+def _contextos_lote(linhas, fotos, erros):
+    """Contexto + imagens de cada linha; linhas com foto ausente vão para 'erros'."""
+    carimbo = datetime.now().strftime("%Y%m%d%H%M%S")
+    itens = []
+    for seq, linha in enumerate(linhas, start=1):
+        contexto = {k: v for k, v in linha.items()
+                    if not k.startswith("_") and not re.fullmatch(r"(imagem|descricao)\d+", k)}
+        for _, chave in campos_base:
+            contexto.setdefault(chave, "")
+        contexto.setdefault("grau_risco", "")
+        contexto.setdefault("evento_id", "")
+        if not contexto["numero_laudo"]:
+            contexto["numero_laudo"] = f"{carimbo}{seq:03d}"
+        contexto["ano"] = date.today().year
+
+        imagens, faltando = [], []
+        for i in range(2, 8):
+            nome = linha.get(f"imagem{i}", "")
+            caminho = fotos.get(os.path.basename(nome)) if nome else None
+            if nome and not caminho:
+                faltando.append(nome)
+            imagens.append((i, caminho, linha.get(f"descricao{i}", "")))
+        if faltando:
+            erros.append({"linha": linha["_linha"], "numero_laudo": contexto["numero_laudo"],
+                          "erro": "Foto(s) não encontrada(s): " + ", ".join(faltando)})
+            continue
+        itens.append({"linha": linha["_linha"], "contexto": contexto, "imagens": imagens})
+    return itens
+
+def _sem_duplicados(itens, erros):
+    """Uma checagem para o lote todo: números repetidos na planilha ou já cadastrados."""
+    repetidos = Counter(_chave(it["contexto"]["numero_laudo"]) for it in itens)
+    validos = []
+    for it in itens:
+        numero = it["contexto"]["numero_laudo"]
+        if repetidos[_chave(numero)] > 1:
+            erros.append({"linha": it["linha"], "numero_laudo": numero, "erro": "Número repetido na planilha"})
+        elif numero_laudo_existe(numero):
+            erros.append({"linha": it["linha"], "numero_laudo": numero,
+                          "erro": f"Já existe um laudo com o número {numero}"})
+        else:
+            validos.append(it)
+    return validos
+
+def _preparar_mapas_lote(itens):
+    """Gera os mapas do lote aqui (mesma sessão de tiles); os processos de render só leem o cache."""
+    coordenadas = {(it["contexto"]["latitude"], it["contexto"]["longitude"]) for it in itens
+                   if it["contexto"]["latitude"] and it["contexto"]["longitude"]}
+    if coordenadas:
+        with ThreadPoolExecutor(max_workers=min(8, len(coordenadas))) as pool:
+            list(pool.map(lambda c: gerar_mapa(*c), coordenadas))
+
+def _gravar_zip_lote(caminho_zip, laudos, erros):
+    """ZIP com os DOCX (sem recompressão: DOCX já é zip) e erros.csv, se houver."""
+    tmp = f"{caminho_zip}.{uuid.uuid4().hex[:8]}.tmp"
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as z:
+        for nome_arquivo, caminho in laudos:
+            z.write(caminho, nome_arquivo)
+        if erros:
+            saida = io.StringIO()
+            escritor = csv.DictWriter(saida, fieldnames=["linha", "numero_laudo", "erro"], delimiter=";")
+            escritor.writeheader()
+            escritor.writerows(sorted(erros, key=lambda e: e["linha"]))
+            z.writestr("erros.csv", saida.getvalue().encode("utf-8-sig"), zipfile.ZIP_DEFLATED)
+    os.replace(tmp, caminho_zip)
+
+def gerar_laudos_em_lote(linhas, tipo, fotos=None, job_id=None):
+    """
+    Gera um laudo por linha da planilha (ver ler_planilha_laudos).
+    'fotos' mapeia o nome do arquivo citado na planilha -> caminho em FOTOS_DIR.
+    Retorna o job do lote: zip, gerados e erros [{"linha", "numero_laudo", "erro"}].
+    """
+    modelo_docx = MODELOS_LAUDO[tipo]
+    if not os.path.exists(_caminho_modelo(modelo_docx)):
+        raise ValueError(f"Modelo de laudo ausente: {modelo_docx}")
+    fotos = fotos or {}
+    job_id = job_id or uuid.uuid4().hex
+    _gravar_job(job_id, status="running", lote=True, tipo=tipo, total=len(linhas), dono=_dono_jobs(),
+                fotos=sorted(set(fotos.values())))
+
+    erros = []
+    itens = _sem_duplicados(_contextos_lote(linhas, fotos, erros), erros)
+    _preparar_mapas_lote(itens)
+
+    futuros = {_submeter_render(renderizar_laudo, it["contexto"], tipo, modelo_docx, it["imagens"]): it
+               for it in itens}
+    renderizados = []
+    for n, futuro in enumerate(as_completed(futuros), start=1):
+        it = futuros[futuro]
+        try:
+            nome_arquivo, caminho_tmp = futuro.result()
+            renderizados.append((it, nome_arquivo, caminho_tmp))
+        except Exception as e:
+            print(f"❌ Erro ao gerar laudo da linha {it['linha']} do lote {job_id}: {e}")
+            erros.append({"linha": it["linha"], "numero_laudo": it["contexto"]["numero_laudo"], "erro": str(e)})
+        if n % 10 == 0:
+            _gravar_job(job_id, renderizados=n)
+    renderizados.sort(key=lambda r: r[0]["linha"])
+
+    # um registro no journal e um commit para o lote inteiro; o DOCX só
+    # ganha o nome final depois da checagem (não sobrescreve o de outro laudo)
+    laudos, ops, arquivos = [], [], []
+    with _store_lock:
+        for it, nome_arquivo, caminho_tmp in renderizados:
+            numero = it["contexto"]["numero_laudo"]
+            if numero_laudo_existe(numero):  # cadastrado por outro usuário enquanto o lote rodava
+                descartar_docx(caminho_tmp)
+                erros.append({"linha": it["linha"], "numero_laudo": numero,
+                              "erro": f"Já existe um laudo com o número {numero}"})
+                continue
+            caminho_saida = publicar_docx(caminho_tmp, nome_arquivo)
+            atendimento, remote_path = _atendimento_do_laudo(it["contexto"], tipo, nome_arquivo)
+            ops.append({"op": "insert", "registro": atendimento})
+            arquivos.append((remote_path, caminho_saida))
+            laudos.append((nome_arquivo, caminho_saida))
+        if ops:
+            _registrar_operacoes(ops, f"Lote de {len(ops)} laudo(s) - {tipo.capitalize()}", arquivos)
+
+    nome_zip = f"Lote_{tipo.capitalize()}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{job_id[:8]}.zip"
+    caminho_zip = os.path.join(UPLOAD_FOLDER, nome_zip)
+    _gravar_zip_lote(caminho_zip, laudos, erros)
+    print(f"📦 Lote {job_id}: {len(laudos)} laudo(s) gerado(s), {len(erros)} linha(s) com erro -> {caminho_zip}")
+    return _gravar_job(job_id, status="done", arquivo=nome_zip, zip=caminho_zip,
+                       gerados=[nome for nome, _ in laudos], erros=erros)
+
+def tipos_lote_disponiveis():
+    """Tipos de laudo cujo modelo DOCX está no servidor (só esses geram lote)."""
+    return [tipo for tipo, modelo in MODELOS_LAUDO.items() if os.path.exists(_caminho_modelo(modelo))]
+
+def _executar_lote(job_id, linhas, tipo, fotos):
+    """Roda o lote em segundo plano (thread do processo web)."""
+    try:
+        gerar_laudos_em_lote(linhas, tipo, fotos, job_id)
+    except Exception as e:
+        print(f"❌ Erro no lote {job_id}: {e}")
+        _gravar_job(job_id, status="failed", erro=str(e))
+    limpar_fotos_laudo([(None, caminho, None) for caminho in fotos.values()], job_id)
+
+@app.route("/laudos/lote", methods=["POST"])
+def laudos_em_lote():
+    if not session.get("logado"):
+        return redirect(url_for("login"))
+    # lote traz muitas fotos numa requisição: limite próprio, antes de ler o formulário
+    request.max_content_length = LOTE_MAX_REQUISICAO_MB * 1024 * 1024
+    disponiveis = tipos_lote_disponiveis()
+    tipo = request.form.get("tipo") or (disponiveis[0] if disponiveis else "")
+    if tipo not in MODELOS_LAUDO:
+        return jsonify({"erro": f"Tipo de laudo inválido: {tipo}"}), 400
+    if tipo not in disponiveis:
+        return jsonify({"erro": f"Modelo de laudo ausente no servidor: {MODELOS_LAUDO[tipo]}"}), 400
+    planilha = request.files.get("planilha")
+    extensao = os.path.splitext(planilha.filename)[1].lower() if planilha and planilha.filename else ""
+    if extensao not in (".csv", ".xlsx"):
+        return jsonify({"erro": "Envie a planilha em .csv ou .xlsx"}), 400
+
+    caminho_planilha = planilha.stream.guardar_exclusivo(UPLOAD_PARTES_DIR, extensao)
+    try:
+        linhas = ler_planilha_laudos(caminho_planilha)
+    except Exception as e:
+        return jsonify({"erro": f"Planilha inválida: {e}"}), 400
+    finally:
+        os.remove(caminho_planilha)
+    if not linhas:
+        return jsonify({"erro": "A planilha não tem linhas preenchidas"}), 400
+
+    job_id = uuid.uuid4().hex
+    fotos = {}
+    for arquivo in request.files.getlist("fotos"):
+        if arquivo and arquivo.filename:
+            fotos[os.path.basename(arquivo.filename)] = arquivo.stream.guardar_deduplicado(FOTOS_DIR, ".upload", job_id)
+
+    _gravar_job(job_id, status="queued", lote=True, tipo=tipo, total=len(linhas), dono=_dono_jobs(),
+                fotos=sorted(set(fotos.values())), criado_em=datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
+    threading.Thread(target=_executar_lote, args=(job_id, linhas, tipo, fotos), daemon=True).start()
+
+    status_url = url_for("status_job_laudo", job_id=job_id)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"job_id": job_id, "total": len(linhas), "status_url": status_url}), 202
+    flash(f"Lote com {len(linhas)} laudo(s) em processamento (acompanhe em {status_url}).", "success")
+    return redirect(url_for("atendimentos"))
+
+@app.route("/laudos/lote/<job_id>.zip")
+def download_lote(job_id):
+    if not session.get("logado"):
+        return redirect(url_for("login"))
+    job = obter_job(job_id)
+    if not job or not job.get("lote") or not job.get("zip") or not os.path.exists(job["zip"]):
+        return jsonify({"erro": "Lote não encontrado"}), 404
+    return send_file(job["zip"], as_attachment=True, download_name=job["arquivo"])
+
+@app.cli.command("gerar-lote")
+@click.argument("planilha", type=click.Path(exists=True, dir_okay=False))
+@click.option("--fotos", type=click.Path(exists=True, file_okay=False), default=None,
+              help="Pasta com as fotos citadas nas colunas imagem2..imagem7")
+@click.option("--tipo", type=click.Choice(sorted(MODELOS_LAUDO)), default="chuvas", show_default=True)
+@click.option("--saida", type=click.Path(dir_okay=False), default=None, help="Copia o ZIP para este caminho")
+@click.option("--espera", default=120, help="Segundos aguardando o commit no GitHub antes de sair")
+def gerar_lote_cli(planilha, fotos, tipo, saida, espera):
+    """Gera os laudos de uma planilha CSV/XLSX (um por linha) e empacota em ZIP."""
+    linhas = ler_planilha_laudos(planilha)
+    job_id = uuid.uuid4().hex
+    fotos_lote = {}
+    if fotos:
+        for nome in sorted(os.listdir(fotos)):
+            caminho = os.path.join(fotos, nome)
+            if os.path.isfile(caminho):
+                fotos_lote[nome] = _guardar_foto_lote(caminho, job_id)
+    try:
+        job = gerar_laudos_em_lote(linhas, tipo, fotos_lote, job_id)
+    except Exception as e:
+        _gravar_job(job_id, status="failed", erro=str(e))
+        raise click.ClickException(str(e))
+    finally:
+        limpar_fotos_laudo([(None, caminho, None) for caminho in fotos_lote.values()], job_id)
+    if saida:
+        shutil.copyfile(job["zip"], saida)
+    for erro in job["erros"]:
+        print(f"⚠️  Linha {erro['linha']} ({erro['numero_laudo']}): {erro['erro']}")
+    print(f"📦 {len(job['gerados'])} laudo(s) em {saida or job['zip']}")
+
+    # o worker da outbox é uma thread deste processo: espera o commit sair
+    limite = time.time() + espera
+    while _pendencias_outbox() and os.getenv("GITHUB_TOKEN") and time.time() < limite:
+        time.sleep(1)
+    if _pendencias_outbox():
+        print("🕒 Commit ainda na outbox: será enviado quando o servidor (ou outro lote) rodar.")
 
 # ==========================================================
 # AUTENTICAÇÃO E PÁGINAS BÁSICAS
@@ -449,28 +3474,72 @@ def home():
 # ==========================================================
 GITHUB_EVENTOS_PATH = "data/eventos.json"
 
-def carregar_eventos():
-    lista = []
+_eventos_lock = TravaProcesso(os.path.join(DATA_DIR, "eventos.lock"))
+
+def _carregar_eventos_json():
     try:
-        if os.path.exists("/tmp/eventos.json"):
-            with open("/tmp/eventos.json", "r", encoding="utf-8") as f:
-                lista = json.load(f)
-        if not lista:
-            lista = fetch_github_json(GITHUB_EVENTOS_PATH)
-            if lista:
-                with open("/tmp/eventos.json", "w", encoding="utf-8") as f:
-                    json.dump(lista, f, ensure_ascii=False, indent=2)
+        try:
+            return ler_json_verificado(EVENTOS_FILE)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"❌ {EVENTOS_FILE} corrompido ({e}); recuperando do GitHub")
+            separar_corrompido(EVENTOS_FILE)
+        lista = fetch_github_json(GITHUB_EVENTOS_PATH)
+        if lista or remoto_vazio_recente(GITHUB_EVENTOS_PATH):
+            # lista vazia confirmada pelo GitHub também vai pro disco: as
+            # próximas leituras não voltam ao GitHub
+            gravar_json_verificado(EVENTOS_FILE, lista, registros_github=len(lista))
+        return lista
     except Exception as e:
         print(f"Erro ao carregar eventos: {e}")
-    return lista
+        return []
+
+def carregar_eventos():
+    with _eventos_lock:
+        if USAR_SQLITE:
+            return sql_carregar_eventos()
+        return _carregar_eventos_json()
+
+def _eventos_no_github():
+    """
+    Chamada antes de pegar _eventos_lock: quantos eventos o GitHub tem, se o
+    .sha256 local ainda não sabe (None se sabe ou se não deu para ler).
+    """
+    if USAR_SQLITE or registros_github_conhecidos(EVENTOS_FILE) is not None:
+        return None
+    return registros_no_github(GITHUB_EVENTOS_PATH)
 
-def salvar_eventos(lista):
+def salvar_eventos(lista, removidos=0, no_github=None):
+    """
+    Grava a lista de eventos. Ler-alterar-gravar deve ficar dentro de _eventos_lock.
+    'removidos' = eventos excluídos nesta gravação; uma queda maior que isso
+    (ex.: lista lida de um arquivo corrompido) não é enviada ao GitHub.
+    'no_github' = resultado de _eventos_no_github(), lido antes da trava.
+    """
     try:
-        with open("/tmp/eventos.json", "w", encoding="utf-8") as f:
-            json.dump(lista, f, ensure_ascii=False, indent=2)
-        repo = _get_github()
+        with _eventos_lock:
+            if USAR_SQLITE:
+                anterior = len(sql_carregar_eventos())
+            else:
+                anterior = registros_github_conhecidos(EVENTOS_FILE)
+                if anterior is None:
+                    anterior = no_github
+            # sem saber quantos o GitHub tem, não envia (grava só local)
+            suspeita = anterior is None or queda_suspeita(anterior, len(lista), removidos)
+            if USAR_SQLITE:
+                sql_salvar_eventos(lista)
+            else:
+                gravar_json_verificado(EVENTOS_FILE, lista, None if suspeita else len(lista))
+        if suspeita:
+            if anterior is None:
+                print("❌ eventos.json NÃO enviado ao GitHub: não foi possível conferir o que o GitHub tem.")
+            else:
+                print(f"❌ eventos.json NÃO enviado ao GitHub: {len(lista)} eventos contra {anterior} "
+                      f"e só {removidos} exclusão(ões).")
+            return
         json_bytes = json.dumps(lista, ensure_ascii=False, indent=2).encode("utf-8")
-        upload_or_update_github_file(repo, GITHUB_EVENTOS_PATH, json_bytes, "Atualiza eventos")
+        enviar_ou_enfileirar_github(GITHUB_EVENTOS_PATH, json_bytes, "Atualiza eventos")
     except Exception as e:
         print(f"Erro ao salvar eventos: {e}")
 
@@ -503,9 +3572,11 @@ def cadastrar_evento():
             "data_registro": datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
         }
 
-        lista = carregar_eventos()
-        lista.append(evento)
-        salvar_eventos(lista)
+        no_github = _eventos_no_github()
+        with _eventos_lock:
+            lista = carregar_eventos()
+            lista.append(evento)
+            salvar_eventos(lista, no_github=no_github)
 
         flash('Evento cadastrado com sucesso!', 'success')
         return redirect(url_for('listar_eventos'))
@@ -542,11 +3613,7 @@ def detalhe_evento(id_evento):
         return redirect(url_for('listar_eventos'))
 
     # Filtra os atendimentos (laudos) vinculados a esse evento
-    todos_atendimentos = carregar_atendimentos()
-    atendimentos_evento = [
-        a for a in todos_atendimentos
-        if str(a.get("evento_id", "")).strip() == str(id_evento).strip()
-    ]
+    atendimentos_evento = atendimentos_por_evento(id_evento)
 
     return render_template(
         'evento_detalhe.html',
@@ -558,9 +3625,11 @@ def detalhe_evento(id_evento):
 def excluir_evento(id_evento):
     if not session.get("logado"):
         return redirect(url_for("login"))
-    lista = carregar_eventos()
-    lista = [e for e in lista if e.get("id") != id_evento]
-    salvar_eventos(lista)
+    no_github = _eventos_no_github()
+    with _eventos_lock:
+        lista = carregar_eventos()
+        restantes = [e for e in lista if e.get("id") != id_evento]
+        salvar_eventos(restantes, removidos=len(lista) - len(restantes), no_github=no_github)
     flash('Evento excluído.', 'success')
     return redirect(url_for('listar_eventos'))
     
@@ -606,7 +3675,7 @@ def alerta():
     if not session.get("logado"):
         return redirect(url_for("login"))
 
-    alertas_enviados = carregar_alertas_enviados()  # se você já tiver isso
+    alertas_enviados = carregar_alertas_enviados()
 
     if request.method == "POST":
         tipo = request.form.get("tipo", "")
@@ -630,10 +3699,10 @@ def alerta():
             "data_emissao": datetime.now().strftime("%d/%m/%Y %H:%M")
         }
 
-        # 🔹 Aqui você salva em JSON/histórico se estiver usando isso
-        salvar_alerta(alerta_data)  # se já existir no seu código
+        # 🔹 Salva no histórico (alertas.jsonl); o id também identifica o envio
+        salvar_alerta(alerta_data)
 
-        # 🔹 E AQUI entra o envio via WhatsApp:
+        # 🔹 E AQUI entra o envio via WhatsApp (em segundo plano, não segura a requisição):
         enviar_alerta_whatsapp(alerta_data)
 
         return redirect(url_for("alerta"))
@@ -641,6 +3710,25 @@ def alerta():
     # GET
     return render_template("alerta.html", alertas=alertas_enviados)
 
+@app.route("/alerta/historico")
+def historico_alerta():
+    """Histórico paginado de alertas em JSON (?pagina=1&por_pagina=20)."""
+    if not session.get("logado"):
+        return redirect(url_for("login"))
+    pagina = max(1, request.args.get("pagina", 1, type=int))
+    por_pagina = min(100, max(1, request.args.get("por_pagina", 20, type=int)))
+    return jsonify(historico_alertas(pagina, por_pagina))
+
+@app.route("/alerta/envios/<envio_id>")
+def status_envio_alerta(envio_id):
+    """Estado de entrega por destinatário de um alerta disparado."""
+    if not session.get("logado"):
+        return redirect(url_for("login"))
+    estado = estado_envio_whatsapp(envio_id)
+    if estado is None:
+        return jsonify({"erro": "Envio não encontrado"}), 404
+    return jsonify(estado)
+
 
 @app.route("/dashboard")
 def dashboard():
@@ -648,27 +3736,154 @@ def dashboard():
         return redirect(url_for("login"))
     return render_template("dashboard.html")
 
+def _detectar_escrita_externa_sql():
+    """
+    No modo sqlite o journal local continua recebendo cada operação: se ele
+    mudou sem passar por este processo, outro worker gravou no banco. As
+    operações novas do journal viram revisões e contadores/grade são refeitos.
+    """
+    with _store_lock:
+        versao = _versao_arquivos_atendimentos()
+        if versao != _store["versao"]:
+            _store["versao"] = versao
+            _store["carga"] += 1
+            _sincronizar_revisoes(carregar_journal_local())
+
+def cursor_atual_atendimentos():
+    """Garante o store carregado (pode trocar a geração) e devolve o cursor."""
+    if USAR_SQLITE:
+        _detectar_escrita_externa_sql()
+    else:
+        _store_atendimentos()
+    return cursor_atendimentos()
+
+def resposta_json(dados, etag=None):
+    """JSON com gzip (se o cliente aceitar) e ETag fraco para revalidação."""
+    corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+    resp = app.response_class(corpo, mimetype="application/json")
+    if len(corpo) > 1024 and request.accept_encodings["gzip"]:
+        resp.set_data(gzip.compress(corpo, 6))
+        resp.headers["Content-Encoding"] = "gzip"
+    resp.vary.add("Accept-Encoding")
+    if etag:
+        resp.set_etag(etag, weak=True)
+        resp.cache_control.no_cache = True
+    return resp
+
 @app.route("/painel")
 def painel():
     if not session.get("logado"):
         return redirect(url_for("login"))
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            atendimentos = json.load(f)
-    except Exception:
-        atendimentos = []
-    return render_template("painel.html", atendimentos=atendimentos)
+    cursor = cursor_atual_atendimentos()
+    atendimentos = carregar_atendimentos()
+    # histórico grande: o mapa busca só o que está visível (/painel_dados?bbox=...)
+    modo_grade = len(atendimentos) > PAINEL_LIMITE_MAPA
+    return render_template("painel.html", atendimentos=[] if modo_grade else atendimentos,
+                           cursor=cursor, modo_grade=modo_grade)
+
+def _dados_alteracoes(cursor, cursor_cliente, grade):
+    """
+    Delta para quem está em cursor_cliente. O painel em modo grade não guarda
+    lista de atendimentos (recarrega só o bbox visível): recebe apenas o cursor.
+    """
+    if grade:
+        return {"cursor": cursor, "grade": True}
+    alteracoes = alteracoes_desde(cursor_cliente)
+    if alteracoes is None:
+        return {"cursor": cursor, "completo": True, "atendimentos": carregar_atendimentos()}
+    alterados, removidos = alteracoes
+    return {"cursor": cursor, "completo": False, "alterados": alterados, "removidos": removidos}
+
+def _evento_sse(cursor_cliente, grade=False):
+    """Gera o próximo evento SSE (ou None) a partir do cursor do cliente."""
+    cursor = cursor_atual_atendimentos()
+    if cursor == cursor_cliente:
+        return cursor, None
+    dados = _dados_alteracoes(cursor, cursor_cliente, grade)
+    corpo = json.dumps(dados, ensure_ascii=False)
+    return cursor, f"id: {cursor}\nevent: atendimentos\ndata: {corpo}\n\n"
+
+@app.route("/painel_stream")
+def painel_stream():
+    """
+    Stream SSE com as inclusões/edições/exclusões de atendimentos assim que
+    acontecem (mesmo formato do /painel_dados?since=...; com ?grade=1 só o cursor).
+    """
+    global _hub_assinantes
+    if not session.get("logado"):
+        return redirect(url_for("login"))
+    cursor_inicial = (request.headers.get("Last-Event-ID") or request.args.get("since")
+                      or cursor_atual_atendimentos())
+    grade = request.args.get("grade") == "1"
+    with _hub_cond:
+        if _hub_assinantes >= SSE_MAX_ASSINANTES:
+            return "Painel com muitas conexões abertas, tente mais tarde.", 503
+        _hub_assinantes += 1
+        _garantir_vigia()
+
+    def gerar():
+        global _hub_assinantes
+        cursor = cursor_inicial
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                cursor, evento = _evento_sse(cursor, grade)
+                if evento:
+                    yield evento
+                elif not aguardar_alteracao(cursor, SSE_HEARTBEAT):
+                    yield ": ping\n\n"
+        finally:
+            with _hub_cond:
+                _hub_assinantes -= 1
+
+    resp = Response(gerar(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # não deixar proxy segurar o stream
+    return resp
 
 @app.route("/painel_dados")
 def painel_dados():
-    """Retorna os atendimentos em JSON para atualização automática do mapa"""
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            atendimentos = json.load(f)
-    except Exception:
-        atendimentos = []
-    return jsonify(atendimentos)
-
+    """
+    Retorna os atendimentos em JSON para atualização automática do mapa.
+    - If-None-Match com o ETag atual -> 304 (nada mudou)
+    - ?since=<cursor> -> só os registros incluídos/editados/excluídos depois do cursor
+      (com &grade=1, só o cursor novo: o painel em modo grade recarrega o bbox)
+    - ?bbox=oeste,sul,leste,norte&zoom=N -> só o que está visível, com clusters
+      nos zooms baixos (aceita também tipo, bairro e risco como filtros)
+    """
+    cursor = cursor_atual_atendimentos()
+    if request.if_none_match.contains_weak(cursor):
+        resp = app.response_class(status=304)
+        resp.set_etag(cursor, weak=True)
+        return resp
+
+    since = request.args.get("since")
+    if "bbox" in request.args:
+        bbox = _ler_bbox(request.args["bbox"])
+        zoom = request.args.get("zoom", PAINEL_ZOOM_PONTOS, type=int)
+        if bbox is None or not 0 <= zoom <= 22:
+            return jsonify({"erro": "bbox deve ser oeste,sul,leste,norte e zoom entre 0 e 22"}), 400
+        filtros = {k: request.args.get(k) for k in ("tipo", "bairro", "risco")}
+        dados = consultar_grade(bbox, zoom, filtros)
+        dados.update(cursor=cursor, zoom=zoom)
+        resp = resposta_json(dados, cursor)
+    elif since is None:
+        resp = resposta_json(carregar_atendimentos(), cursor)
+    else:
+        dados = _dados_alteracoes(cursor, since, request.args.get("grade") == "1")
+        resp = resposta_json(dados, cursor)
+    resp.headers["X-Cursor"] = cursor
+    return resp
+
+@app.route("/dashboard_dados")
+def dashboard_dados():
+    """Contagens do dashboard já agregadas no servidor (ETag = cursor atual)."""
+    cursor = cursor_atual_atendimentos()
+    if request.if_none_match.contains_weak(cursor):
+        resp = app.response_class(status=304)
+        resp.set_etag(cursor, weak=True)
+        return resp
+    return resposta_json(resumo_dashboard(), cursor)
 
 
 # ==========================================================
@@ -688,10 +3903,7 @@ def chuvas():
         contexto = {campo[1]: request.form.get(campo[1], "") for campo in campos_chuvas}
         contexto["grau_risco"] = request.form.get("grau_risco", "")
         contexto["evento_id"]  = request.form.get("evento_id", "")
-        numero = processar_laudo(contexto, "chuvas", "modelo_laudo_chuvas.docx")
-        if not numero:
-            return "Erro ao gerar laudo de Chuvas.", 500
-        return redirect(url_for("atendimentos"))
+        return responder_laudo(contexto, "chuvas", "Erro ao gerar laudo de Chuvas.")
     return render_template("chuvas.html", campos=campos_chuvas,
                            eventos=carregar_eventos(), tipos_evento=TIPOS_EVENTO)
 
@@ -703,12 +3915,12 @@ def regularizacao():
         contexto = {campo[1]: request.form.get(campo[1], "") for campo in campos_base}
         contexto["grau_risco"] = request.form.get("grau_risco", "")
         contexto["evento_id"]  = request.form.get("evento_id", "")
-        numero = processar_laudo(contexto, "regularizacao", "modelo_laudo_reg.docx")
-        if not numero:
-            return "Erro ao gerar laudo de Regularização.", 500
-        return redirect(url_for("atendimentos"))
+        return responder_laudo(contexto, "regularizacao", "Erro ao gerar laudo de Regularização.")
+    disponiveis = tipos_lote_disponiveis()
     return render_template("regularizacao.html", campos=campos_base,
-                           eventos=carregar_eventos(), tipos_evento=TIPOS_EVENTO)
+                           eventos=carregar_eventos(), tipos_evento=TIPOS_EVENTO,
+                           tipos_lote=[(t, NOMES_LAUDO[t], t in disponiveis) for t in MODELOS_LAUDO],
+                           tipo_lote="regularizacao" if "regularizacao" in disponiveis else next(iter(disponiveis), None))
 
 @app.route("/incendios", methods=["GET", "POST"])
 def incendios():
@@ -719,10 +3931,7 @@ def incendios():
         contexto["evento_id"] = request.form.get("evento_id", "")
         for key in ["bairro", "latitude", "longitude", "data_vistoria", "grau_risco"]:
             contexto.setdefault(key, "")
-        numero = processar_laudo(contexto, "incendios", "modelo_laudo_incendio.docx")
-        if not numero:
-            return "Erro ao gerar laudo de Incêndios.", 500
-        return redirect(url_for("atendimentos"))
+        return responder_laudo(contexto, "incendios", "Erro ao gerar laudo de Incêndios.")
     return render_template("incendios.html",
                            eventos=carregar_eventos(), tipos_evento=TIPOS_EVENTO)
 # ==========================================================
@@ -780,12 +3989,7 @@ def deslizamentos():
         # Usa n_relatorio como número do laudo (campo principal de identificação)
         contexto["numero_laudo"] = contexto.get("n_relatorio", "").strip()
 
-        numero = processar_laudo(contexto, "deslizamentos", "modelo_laudo_massa.docx")
-
-        if not numero:
-            return "Erro ao gerar laudo de Movimentação de Massa.", 500
-
-        return redirect(url_for("atendimentos"))
+        return responder_laudo(contexto, "deslizamentos", "Erro ao gerar laudo de Movimentação de Massa.")
 
     # GET → renderiza formulário com lista de eventos
     return render_template(
@@ -806,34 +4010,281 @@ def atendimentos():
     return render_template(
         "atendimentos.html",
         atendimentos=lista,
-        atendimentos_json=json.dumps(lista, ensure_ascii=False)
+        atendimentos_json=json.dumps(lista, ensure_ascii=False),
+        eventos=carregar_eventos()
     )
 
+# ==========================================================
+# DOWNLOAD DE LAUDOS (local -> cache em disco -> GitHub)
+# ==========================================================
+# O DOCX recém-gerado ainda está em UPLOAD_FOLDER; os demais são buscados uma
+# vez no GitHub (API de conteúdo, sem o atraso do CDN do raw) e guardados num
+# CacheDiscoLRU. Range e requisições condicionais ficam com o send_file.
+_cache_downloads = CacheDiscoLRU(DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_MAX_MB * 1024 * 1024)
+_downloads_em_curso = {}  # nome -> Lock: um único download por arquivo
+_downloads_lock = threading.Lock()
+ETAGS_DOWNLOADS_MAX = 1024  # etags mantidos em memória (os mais usados)
+_etags_downloads = OrderedDict()  # (caminho, tamanho, inode) -> etag
+_etags_lock = threading.Lock()
+
+def _resposta_github_arquivo(remote_path):
+    """GET em streaming do arquivo no GitHub: API com token, raw sem token (repositório público)."""
+    token = os.getenv("GITHUB_TOKEN")
+    if token:
+        url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{remote_path}?ref={GITHUB_BRANCH}"
+        cabecalhos = {"Authorization": f"token {token}", "Accept": "application/vnd.github.raw"}
+    else:
+        url, cabecalhos = github_raw_url(remote_path), {}
+    resp = sessao_http("downloads").get(url, headers=cabecalhos, stream=True, timeout=30)
+    if resp.status_code != 200:
+        resp.close()
+        raise FileNotFoundError(f"{remote_path} não encontrado no GitHub (HTTP {resp.status_code})")
+    return resp
+
+def _baixar_para_cache(nome_arquivo):
+    """Baixa o DOCX do GitHub para o cache (uma vez só, mesmo com pedidos simultâneos)."""
+    with _downloads_lock:
+        trava = _downloads_em_curso.setdefault(nome_arquivo, threading.Lock())
+    with trava:
+        caminho = _cache_downloads.caminho_se_existir(nome_arquivo)
+        if caminho:
+            return caminho, "cache"  # outro pedido acabou de baixar
+        tmp = f"{_cache_downloads.caminho(nome_arquivo)}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with _resposta_github_arquivo(f"{GITHUB_UPLOADS_PATH}/{nome_arquivo}") as resp, open(tmp, "wb") as f:
+                for bloco in resp.iter_content(EXPORTAR_BLOCO):
+                    f.write(bloco)
+            return _cache_downloads.guardar_arquivo(nome_arquivo, tmp), "remoto"
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            with _downloads_lock:
+                _downloads_em_curso.pop(nome_arquivo, None)
+
+def localizar_docx(nome_arquivo, baixar=True):
+    """
+    (caminho, origem) do DOCX, com origem "local", "cache" ou "remoto".
+    Com baixar=False devolve (None, None) em vez de buscar no GitHub.
+    """
+    if os.path.basename(nome_arquivo) != nome_arquivo or nome_arquivo.startswith("."):
+        raise ValueError(f"Nome de arquivo inválido: {nome_arquivo}")
+    local = os.path.join(UPLOAD_FOLDER, nome_arquivo)
+    if os.path.isfile(local):
+        return local, "local"
+    caminho = _cache_downloads.caminho_se_existir(nome_arquivo)
+    if caminho:
+        return caminho, "cache"
+    if not baixar:
+        return None, None
+    return _baixar_para_cache(nome_arquivo)
+
+def _etag_arquivo(caminho):
+    """sha256 do conteúdo (o mtime do cache muda a cada uso e não serve de validador)."""
+    st = os.stat(caminho)
+    chave = (caminho, st.st_size, st.st_ino)
+    with _etags_lock:
+        etag = _etags_downloads.get(chave)
+        if etag is not None:
+            _etags_downloads.move_to_end(chave)
+            return etag
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    etag = h.hexdigest()[:32]
+    with _etags_lock:
+        _etags_downloads[chave] = etag
+        while len(_etags_downloads) > ETAGS_DOWNLOADS_MAX:
+            _etags_downloads.popitem(last=False)
+    return etag
+
 @app.route("/download/<nome_arquivo>")
 def download_arquivo(nome_arquivo):
     """
-    Redireciona para o RAW do GitHub (baixa direto do repositório).
+    Serve o DOCX da pasta local ou do cache (baixando do GitHub na primeira
+    vez). Se o GitHub não responder, redireciona para o RAW como antes.
     """
-    remote_path = f"{GITHUB_UPLOADS_PATH}/{nome_arquivo}"
-    return redirect(github_raw_url(remote_path))
+    if not session.get("logado"):
+        return redirect(url_for("login"))
+    inicio = time.perf_counter()
+    try:
+        caminho, origem = localizar_docx(nome_arquivo)
+    except ValueError:
+        return jsonify({"erro": "Arquivo inválido"}), 400
+    except Exception as e:
+        print(f"⚠️  Download {nome_arquivo}: falha ao buscar no GitHub ({e}); redirecionando para o RAW")
+        return redirect(github_raw_url(f"{GITHUB_UPLOADS_PATH}/{nome_arquivo}"))
+
+    resposta = send_file(caminho, as_attachment=True, download_name=nome_arquivo,
+                         etag=_etag_arquivo(caminho), conditional=True)
+    resposta.headers["X-Origem-Download"] = origem
+    print(f"📥 Download {nome_arquivo}: {origem} ({resposta.status_code}, "
+          f"{(time.perf_counter() - inicio) * 1000:.0f} ms)")
+    return resposta
+
+# ==========================================================
+# EXPORTAÇÃO EM ZIP (streaming)
+# ==========================================================
+# O ZIP é montado enquanto é enviado: ZipFile escreve num destino sem seek
+# (entradas com data descriptor) e o gerador entrega os bytes a cada bloco
+# lido. Nem o ZIP nem os DOCX ficam inteiros em memória ou em disco.
+EXPORTAR_BLOCO = 64 * 1024
+CAMPOS_MANIFESTO = [
+    "numero_laudo", "origem", "bairro", "data_vistoria", "grau_risco", "evento_id",
+    "latitude", "longitude", "arquivo", "arquivo_github", "data_registro", "situacao_zip",
+]
+class _SaidaZip:
+    """Destino do ZipFile: só acumula o que foi escrito até o gerador retirar."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        dados = b"".join(self._partes)
+        self._partes = []
+        return dados
+
+def _data_vistoria(valor):
+    """date a partir de 'AAAA-MM-DD' ou 'DD/MM/AAAA' (None se não der para ler)."""
+    texto = _chave(valor)
+    try:
+        m = re.match(r"(\d{4})-(\d{1,2})-(\d{1,2})", texto)
+        if m:
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        m = re.match(r"(\d{1,2})/(\d{1,2})/(\d{4})", texto)
+        if m:
+            return date(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+    except ValueError:
+        pass
+    return None
+
+def selecionar_para_exportacao(evento_id=None, bairro=None, origem=None, de=None, ate=None):
+    """
+    Atendimentos com DOCX que passam nos filtros. Bairro e origem sem
+    diferenciar acento/maiúsculas; de/ate (date) pela data da vistoria.
+    """
+    lista = atendimentos_por_evento(evento_id) if evento_id else carregar_atendimentos()
+    bairro = _normalizar_texto(bairro) if bairro else None
+    tipo = _tipo_atendimento(origem) if origem else None
+    selecionados = []
+    for a in lista:
+        if not a.get("arquivo"):
+            continue
+        if bairro and _normalizar_texto(a.get("bairro")) != bairro:
+            continue
+        if tipo and _tipo_atendimento(a.get("origem")) != tipo:
+            continue
+        if de or ate:
+            dia = _data_vistoria(a.get("data_vistoria"))
+            if dia is None or (de and dia < de) or (ate and dia > ate):
+                continue
+        selecionados.append(a)
+    return selecionados
+
+def _ler_em_blocos(f):
+    with f:
+        for bloco in iter(lambda: f.read(EXPORTAR_BLOCO), b""):
+            yield bloco
+
+def _ler_resposta(resp):
+    with resp:
+        for bloco in resp.iter_content(EXPORTAR_BLOCO):
+            yield bloco
+
+def abrir_docx_exportacao(nome_arquivo):
+    """
+    Blocos do DOCX: cópia local ou do cache de downloads e, se não houver,
+    direto do GitHub (sem encher o cache com uma exportação grande).
+    Falha já aqui (antes do primeiro bloco) se o arquivo não existir.
+    """
+    caminho, _ = localizar_docx(nome_arquivo, baixar=False)
+    if caminho:
+        return _ler_em_blocos(open(caminho, "rb"))
+    return _ler_resposta(_resposta_github_arquivo(f"{GITHUB_UPLOADS_PATH}/{nome_arquivo}"))
+
+def gerar_zip_exportacao(atendimentos):
+    """
+    Gerador com os bytes do ZIP: laudos/<arquivo>.docx de cada atendimento
+    e, no fim, manifesto.csv com os registros e a situação de cada arquivo.
+    """
+    saida = _SaidaZip()
+    manifesto = []
+    incluidos = set()
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_STORED) as z:  # DOCX já é zip
+        for a in atendimentos:
+            nome = a["arquivo"]
+            if nome in incluidos:
+                situacao = "incluido"
+            else:
+                try:
+                    blocos = abrir_docx_exportacao(nome)
+                    situacao = "incluido"
+                except Exception as e:
+                    print(f"⚠️  Exportação: {nome} ficou fora do ZIP: {e}")
+                    blocos, situacao = None, f"ausente: {e}"
+                if blocos is not None:
+                    info = zipfile.ZipInfo(f"laudos/{nome}", date_time=time.localtime()[:6])
+                    with z.open(info, "w") as destino:
+                        try:
+                            for bloco in blocos:
+                                destino.write(bloco)
+                                yield saida.retirar()
+                        except Exception as e:
+                            print(f"❌ Exportação: {nome} interrompido: {e}")
+                            situacao = f"incompleto: {e}"
+                    incluidos.add(nome)
+                    yield saida.retirar()
+            manifesto.append(dict({c: a.get(c, "") for c in CAMPOS_MANIFESTO}, situacao_zip=situacao))
+
+        texto = io.StringIO()
+        escritor = csv.DictWriter(texto, fieldnames=CAMPOS_MANIFESTO, delimiter=";")
+        escritor.writeheader()
+        escritor.writerows(manifesto)
+        z.writestr("manifesto.csv", texto.getvalue().encode("utf-8-sig"), zipfile.ZIP_DEFLATED)
+    yield saida.retirar()
+
+@app.route("/exportar")
+def exportar():
+    """ZIP com os DOCX filtrados por evento_id, bairro, origem e/ou período (de/ate, AAAA-MM-DD)."""
+    if not session.get("logado"):
+        return redirect(url_for("login"))
+    try:
+        de, ate = (datetime.strptime(request.args[p], "%Y-%m-%d").date() if request.args.get(p) else None
+                   for p in ("de", "ate"))
+    except ValueError:
+        return jsonify({"erro": "Datas no formato AAAA-MM-DD"}), 400
+    atendimentos = selecionar_para_exportacao(
+        evento_id=request.args.get("evento_id") or None,
+        bairro=request.args.get("bairro") or None,
+        origem=request.args.get("origem") or None,
+        de=de, ate=ate,
+    )
+    if not atendimentos:
+        return jsonify({"erro": "Nenhum laudo encontrado com esses filtros"}), 404
+    print(f"📦 Exportando {len(atendimentos)} laudo(s) em ZIP")
+    nome_zip = f"laudos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(
+        (parte for parte in gerar_zip_exportacao(atendimentos) if parte),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename={nome_zip}",
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 @app.route("/excluir_atendimento/<path:numero_laudo>", methods=["POST"])
 def excluir_atendimento(numero_laudo):
     try:
         numero_laudo = numero_laudo.strip()
 
-        lista = carregar_atendimentos()
-
-        nova = [
-            a for a in lista
-            if str(a.get("numero_laudo", "")).strip() != numero_laudo
-        ]
-
-        salvar_atendimentos_local(nova)
-
-        repo = _get_github()
-        json_bytes = json.dumps(nova, ensure_ascii=False, indent=2).encode("utf-8")
-        upload_or_update_github_file(repo, GITHUB_DATA_PATH, json_bytes, f"Remoção {numero_laudo}")
+        registrar_exclusao(numero_laudo)
 
         print(f"🗑️ Atendimento {numero_laudo} removido.")
         return redirect(url_for("atendimentos"))
@@ -876,12 +4327,7 @@ def inserir_atendimento():
 @app.route("/editar/<path:numero_laudo>")
 def editar_atendimento(numero_laudo):
 
-    lista = carregar_atendimentos()
-
-    atendimento = next(
-        (a for a in lista if str(a["numero_laudo"]) == str(numero_laudo)),
-        None
-    )
+    atendimento = buscar_atendimento(numero_laudo)
 
     if not atendimento:
         return "Atendimento não encontrado", 404
@@ -892,59 +4338,205 @@ def editar_atendimento(numero_laudo):
 @app.route("/salvar_edicao/<path:numero_laudo_antigo>", methods=["POST"])
 def salvar_edicao(numero_laudo_antigo):
 
-    lista = carregar_atendimentos()
-
     novo_numero = request.form["numero_laudo"]
 
-    # valida duplicidade
-    for item in lista:
-        if item["numero_laudo"] == novo_numero and item["numero_laudo"] != numero_laudo_antigo:
-            return "⚠️ Já existe um laudo com esse número.", 400
-
-    atualizado = False
-
-    for a in lista:
-        if str(a["numero_laudo"]) == str(numero_laudo_antigo):
-
-            a["numero_laudo"] = novo_numero
-            a["bairro"] = request.form["bairro"]
-            a["latitude"] = request.form["latitude"]
-            a["longitude"] = request.form["longitude"]
-            a["data_vistoria"] = request.form["data_vistoria"]
-            a["grau_risco"] = request.form["grau_risco"]
+    with _store_lock:
+        atual = buscar_atendimento(numero_laudo_antigo)
+        if not atual:
+            return "Atendimento não encontrado", 404
 
-            atualizado = True
-            break
-
-    if not atualizado:
-        return "Atendimento não encontrado", 404
+        # valida duplicidade
+        existente = buscar_atendimento(novo_numero)
+        if existente is not None and _chave(novo_numero) != _chave(numero_laudo_antigo):
+            return "⚠️ Já existe um laudo com esse número.", 400
 
-    # salva local
-    salvar_atendimentos_local(lista)
+        # registra a edição no journal (o store e o GitHub são atualizados juntos)
+        registrar_edicao(numero_laudo_antigo, dict(
+            atual,
+            numero_laudo=novo_numero,
+            bairro=request.form["bairro"],
+            latitude=request.form["latitude"],
+            longitude=request.form["longitude"],
+            data_vistoria=request.form["data_vistoria"],
+            grau_risco=request.form["grau_risco"],
+        ))
 
-    # envia para GitHub usando a lista atualizada
-    repo = _get_github()
+    return redirect(url_for("atendimentos"))
 
+# ==========================================================
+# ENTRADA WSGI (produção)
+# ==========================================================
+_iniciado = False
+AQUECER_TILES = os.environ.get("AQUECER_TILES", "").lower() in ("1", "true", "sim")
+
+# Aquecimento: cada etapa roda numa thread; o worker só atende depois que
+# todas terminarem (criar_app é chamado pelo gunicorn antes de aceitar
+# conexões). O resultado fica em _prontidao para a rota /pronto. O pool de
+# renderização sobe em segundo plano, com o worker já atendendo (e /pronto
+# já em 200): a etapa "modelos" aparece em _prontidao quando ele termina.
+_prontidao = {"pronto": False, "inicio": None, "duracao_ms": None, "etapas": {}}
+
+def _aquecer_atendimentos():
+    carregar_atendimentos()  # snapshot + journal (do /tmp ou do GitHub) e índices
+    _contadores_dashboard()
+    _grade_atual()
+
+def _aquecer_alertas():
+    _carregar_indice_alertas()
+    _indice_telefones_alerta()
+
+def _aquecer_modelos():
+    # sobe os processos do pool; cada um parseia os modelos em _iniciar_processo_render
+    for futuro in [_submeter_render(os.getpid) for _ in range(RENDER_WORKERS)]:
+        futuro.result()
+    faltando = [m for m in MODELOS_LAUDO.values() if not os.path.exists(_caminho_modelo(m))]
+    if faltando:
+        raise RuntimeError("modelos ausentes: " + ", ".join(faltando))
+
+def _aquecer_caches():
+    # só monta o índice LRU das pastas (o que sobrou no disco desde o último deploy)
+    return {nome: cache.estatisticas()["arquivos"] for nome, cache in
+            (("tiles", _cache_tiles), ("mapas", _cache_mapas), ("downloads", _cache_downloads))}
+
+ETAPAS_AQUECIMENTO = {
+    "atendimentos": _aquecer_atendimentos,
+    "eventos": carregar_eventos,
+    "alertas": _aquecer_alertas,
+    "caches": _aquecer_caches,
+}
+ETAPAS_SEGUNDO_PLANO = {
+    "modelos": _aquecer_modelos,
+}
+
+def _executar_etapa(nome, funcao):
+    inicio = time.perf_counter()
     try:
-        json_bytes = json.dumps(lista, ensure_ascii=False, indent=2).encode("utf-8")
-
-        upload_or_update_github_file(
-            repo,
-            GITHUB_DATA_PATH,
-            json_bytes,
-            f"Atualiza atendimento {novo_numero}"
-        )
-
+        funcao()
+        resultado = {"ok": True}
     except Exception as e:
-        print("Erro ao enviar GitHub:", e)
+        print(f"❌ Aquecimento ({nome}) falhou: {e}")
+        resultado = {"ok": False, "erro": str(e)}
+    resultado["ms"] = round((time.perf_counter() - inicio) * 1000)
+    return nome, resultado
+
+def aquecer():
+    """Carrega stores, modelos e índices em paralelo e registra o tempo de cada etapa."""
+    inicio = time.perf_counter()
+    _prontidao.update(pronto=False, inicio=datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
+    with ThreadPoolExecutor(max_workers=len(ETAPAS_AQUECIMENTO)) as pool:
+        etapas = dict(pool.map(lambda item: _executar_etapa(*item), ETAPAS_AQUECIMENTO.items()))
+    _prontidao.update(pronto=True, etapas=etapas,
+                      duracao_ms=round((time.perf_counter() - inicio) * 1000))
+    falhas = [nome for nome, r in etapas.items() if not r["ok"]]
+    print(f"🔥 Aquecimento em {_prontidao['duracao_ms']} ms"
+          + (f" (com falhas: {', '.join(falhas)})" if falhas else ""))
+    # modelos (e tiles da cidade, se pedido) em segundo plano: não seguram o worker
+    threading.Thread(target=_aquecer_em_segundo_plano, daemon=True).start()
+
+def _aquecer_em_segundo_plano():
+    for nome, funcao in ETAPAS_SEGUNDO_PLANO.items():
+        nome, resultado = _executar_etapa(nome, funcao)
+        _prontidao["etapas"][nome] = resultado
+    if AQUECER_TILES:
+        try:
+            semear_tiles()
+        except ValueError as e:
+            print(f"⚠️  AQUECER_TILES ignorado: {e}")
+
+@app.route("/pronto")
+def pronto():
+    """Readiness: 200 depois do aquecimento, 503 antes (ou se o store de atendimentos falhou)."""
+    etapas = _prontidao["etapas"]
+    ok = _prontidao["pronto"] and etapas.get("atendimentos", {}).get("ok", False)
+    return jsonify(_prontidao), 200 if ok else 503
+
+# Mede a subida num interpretador limpo: import do app, primeiras respostas
+# de /login e /home (sem a pilha pesada carregada), aquecimento e o import
+# dos módulos de renderização/mapa/GitHub/WhatsApp quando forem usados.
+_SCRIPT_MEDIR_INICIO = """
+import json, sys, time
+pesados = %r
+carregados = lambda: sorted(m for m in pesados if m in sys.modules)
+t = time.perf_counter()
+import app
+r = {"import_app_ms": (time.perf_counter() - t) * 1000, "pesados_apos_import": carregados()}
+cliente = app.app.test_client()
+t = time.perf_counter()
+cliente.get("/login")
+r["primeiro_login_ms"] = (time.perf_counter() - t) * 1000
+with cliente.session_transaction() as s:
+    s["logado"] = True
+t = time.perf_counter()
+cliente.get("/home")
+r["primeiro_home_ms"] = (time.perf_counter() - t) * 1000
+r["pesados_apos_home"] = carregados()
+if %r:
+    t = time.perf_counter()
+    app.ETAPAS_SEGUNDO_PLANO = {}
+    app.aquecer()
+    r["aquecimento_ms"] = (time.perf_counter() - t) * 1000
+for modulo in ("laudo_render", "mapa_estatico", "whatsapp", "github_sync"):
+    t = time.perf_counter()
+    __import__(modulo)
+    r["import_" + modulo + "_ms"] = (time.perf_counter() - t) * 1000
+print(json.dumps(r))
+"""
+
+def medir_inicio(aquecer=False):
+    """Roda _SCRIPT_MEDIR_INICIO num processo novo e devolve as medidas (ms)."""
+    import subprocess
+    import sys
+    script = _SCRIPT_MEDIR_INICIO % (MODULOS_PESADOS, aquecer)
+    saida = subprocess.run([sys.executable, "-c", script], cwd=BASE_DIR, capture_output=True,
+                           text=True, check=True).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+@app.cli.command("medir-inicio")
+@click.option("--repeticoes", default=5, help="Processos medidos (vale a mediana)")
+@click.option("--aquecer", is_flag=True, help="Inclui o aquecimento (lê stores do /tmp ou do GitHub)")
+@click.option("--orcamento-ms", default=IMPORT_ORCAMENTO_MS, help="Máximo para o import do app")
+def medir_inicio_cli(repeticoes, aquecer, orcamento_ms):
+    """Benchmark da subida; falha se o import passar do orçamento ou carregar a pilha pesada."""
+    medidas = [medir_inicio(aquecer) for _ in range(repeticoes)]
+    for chave in medidas[0]:
+        valores = [m[chave] for m in medidas]
+        if isinstance(valores[0], float):
+            valores.sort()
+            print(f"⏱️  {chave}: {valores[len(valores) // 2]:.0f} ms (mín {valores[0]:.0f}, máx {valores[-1]:.0f})")
+    import_ms = sorted(m["import_app_ms"] for m in medidas)[len(medidas) // 2]
+    pesados = sorted(set(medidas[0]["pesados_apos_import"]) | set(medidas[0]["pesados_apos_home"]))
+    if pesados:
+        raise click.ClickException(f"Módulos pesados carregados antes do /home: {', '.join(pesados)}")
+    if import_ms > orcamento_ms:
+        raise click.ClickException(f"Import do app em {import_ms:.0f} ms, acima do orçamento de {orcamento_ms} ms")
+    print(f"✅ Import do app dentro do orçamento ({import_ms:.0f} ms ≤ {orcamento_ms} ms), sem módulos pesados")
+
+def criar_app():
+    """
+    App pronta para servir. Em produção (render.yaml):
+        gunicorn "app:criar_app()" --workers 2 --worker-class gevent --worker-connections 1000
+    Cada worker aquece stores/índices, sobe o pool de renderização e retoma
+    a outbox uma vez; os filhos do pool só importam o módulo e parseiam os
+    modelos (_iniciar_processo_render), sem passar por aqui.
+    """
+    global _iniciado
+    if not _iniciado:
+        _iniciado = True
+        falhar_jobs_orfaos()
+        aquecer()
+        # pendências que sobraram de uma execução anterior
+        if _pendencias_outbox():
+            _garantir_worker_github()
+            _evento_outbox.set()
+    return app
 
-    return redirect(url_for("atendimentos"))
 # ==========================================================
 # RUN
 # ==========================================================
 if __name__ == "__main__":
+    # servidor de desenvolvimento; em produção usar gunicorn (ver criar_app)
     port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    criar_app().run(host="0.0.0.0", port=port, debug=True)
 
 
 
@@ -0,0 +1,76 @@
+"""
+Modelos do ARMAZENAMENTO=sqlite (Flask-SQLAlchemy). O app importa este
+módulo só quando o banco é usado (modo sqlite ou importar-json/exportar-json)
+e liga o db ao Flask com init_app.
+"""
+import json
+
+from flask_sqlalchemy import SQLAlchemy
+
+
+def _texto(valor):
+    return str(valor if valor is not None else "").strip()
+
+
+db = SQLAlchemy()
+
+CAMPOS_ATENDIMENTO = (
+    "origem", "numero_laudo", "bairro", "latitude", "longitude", "data_vistoria",
+    "grau_risco", "evento_id", "arquivo", "arquivo_github", "data_registro",
+)
+CAMPOS_EVENTO = ("id", "data_evento", "tipo_evento", "descricao", "data_registro")
+
+
+class Atendimento(db.Model):
+    __tablename__ = "atendimentos"
+
+    # id é a chave: o histórico tem números de laudo repetidos e o banco
+    # guarda todos, como o atendimentos.json
+    id = db.Column(db.Integer, primary_key=True)
+    numero_laudo = db.Column(db.String(120), index=True, nullable=False)
+    evento_id = db.Column(db.String(40), index=True, default="")
+    bairro = db.Column(db.String(200, collation="NOCASE"), index=True, default="")
+    origem = db.Column(db.String(60, collation="NOCASE"), index=True, default="")
+    grau_risco = db.Column(db.String(40), index=True, default="")
+    data_vistoria = db.Column(db.String(20), index=True, default="")
+    latitude = db.Column(db.String(40), default="")
+    longitude = db.Column(db.String(40), default="")
+    arquivo = db.Column(db.String(200), default="")
+    arquivo_github = db.Column(db.String(400), default="")
+    data_registro = db.Column(db.String(20), default="")
+    extras = db.Column(db.Text, default="{}")  # demais campos do JSON, devolvidos no export
+
+    def atualizar(self, dados):
+        for campo in CAMPOS_ATENDIMENTO:
+            setattr(self, campo, _texto(dados.get(campo)))
+        extras = {k: v for k, v in dados.items() if k not in CAMPOS_ATENDIMENTO}
+        self.extras = json.dumps(extras, ensure_ascii=False)
+        return self
+
+    def para_dict(self):
+        dados = {campo: getattr(self, campo) or "" for campo in CAMPOS_ATENDIMENTO}
+        dados.update(json.loads(self.extras or "{}"))
+        return dados
+
+
+class Evento(db.Model):
+    __tablename__ = "eventos"
+
+    id = db.Column(db.String(40), primary_key=True)
+    data_evento = db.Column(db.String(20), default="")
+    tipo_evento = db.Column(db.String(60), index=True, default="")
+    descricao = db.Column(db.Text, default="")
+    data_registro = db.Column(db.String(20), default="")
+    extras = db.Column(db.Text, default="{}")
+
+    def atualizar(self, dados):
+        for campo in CAMPOS_EVENTO:
+            setattr(self, campo, _texto(dados.get(campo)))
+        extras = {k: v for k, v in dados.items() if k not in CAMPOS_EVENTO}
+        self.extras = json.dumps(extras, ensure_ascii=False)
+        return self
+
+    def para_dict(self):
+        dados = {campo: getattr(self, campo) or "" for campo in CAMPOS_EVENTO}
+        dados.update(json.loads(self.extras or "{}"))
+        return dados
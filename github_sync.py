@@ -0,0 +1,49 @@
+"""
+Acesso ao repositório do GitHub (PyGithub). O app importa este módulo só
+quando há GITHUB_TOKEN e algo para ler ou enviar.
+"""
+import base64
+
+from github import Github, InputGitTreeElement, UnknownObjectException
+
+ArquivoInexistente = UnknownObjectException
+
+
+def conectar(token, repositorio, pool_size):
+    """Repositório com sessão HTTP keep-alive (reaproveitar o objeto retornado)."""
+    return Github(token, pool_size=pool_size).get_repo(repositorio)
+
+
+def ler_arquivo(repo, remote_path, branch):
+    """
+    (texto, sha) do arquivo na branch. Levanta ArquivoInexistente se não existir.
+    """
+    arquivo = repo.get_contents(remote_path, ref=branch)
+    if arquivo.size and not arquivo.content:
+        # acima de 1 MB a API de conteúdo não traz o arquivo: lê o blob
+        conteudo = repo.get_git_blob(arquivo.sha).content
+    else:
+        conteudo = arquivo.content
+    return base64.b64decode(conteudo).decode("utf-8"), arquivo.sha
+
+
+def commit_arquivos(repo, branch, arquivos, mensagem):
+    """
+    Um único commit (blobs -> tree -> commit -> ref) com {remote_path: caminho local}.
+    Retorna (sha do commit, {remote_path: sha do blob}).
+    """
+    ref = repo.get_git_ref(f"heads/{branch}")
+    base = repo.get_git_commit(ref.object.sha)
+
+    elementos, shas = [], {}
+    for remote_path, caminho in arquivos.items():
+        with open(caminho, "rb") as f:
+            conteudo = base64.b64encode(f.read()).decode("ascii")
+        blob = repo.create_git_blob(conteudo, "base64")
+        shas[remote_path] = blob.sha
+        elementos.append(InputGitTreeElement(remote_path, "100644", "blob", sha=blob.sha))
+    arvore = repo.create_git_tree(elementos, base.tree)
+
+    commit = repo.create_git_commit(mensagem, arvore, [base])
+    ref.edit(commit.sha)
+    return commit.sha, shas
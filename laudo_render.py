@@ -0,0 +1,50 @@
+"""
+Renderização do laudo: modelos DOCX (docxtpl/python-docx) e redução das
+fotos (Pillow). O app importa este módulo só quando vai gerar um laudo,
+então /login e /home sobem sem carregar essas bibliotecas.
+"""
+import copy
+
+from docxtpl import DocxTemplate, InlineImage
+from docx.shared import Mm
+from PIL import Image, ImageOps
+
+
+def parsear_modelo(caminho):
+    """Abre o .docx do modelo e devolve o Document já parseado."""
+    base = DocxTemplate(caminho)
+    base.init_docx()
+    return base.docx
+
+
+def copiar_modelo(caminho, docx):
+    """DocxTemplate com uma cópia própria do Document parseado (sem reler o zip)."""
+    doc = DocxTemplate(caminho)
+    doc.docx = copy.deepcopy(docx)
+    return doc
+
+
+def imagem(doc, caminho, largura_mm):
+    """Imagem para o contexto do docxtpl."""
+    return InlineImage(doc, caminho, width=Mm(largura_mm))
+
+
+def reduzir_foto(caminho, destino, largura_px, qualidade):
+    """
+    Grava em destino a foto como JPEG com no máximo largura_px de largura,
+    já com a orientação EXIF aplicada.
+    Retorna (formato original, estava girada, foi reduzida).
+    """
+    with Image.open(caminho) as original:
+        formato = original.format
+        # JPEG: decodifica já reduzido (1/2, 1/4, 1/8) sem carregar a foto inteira
+        original.draft("RGB", (largura_px, largura_px))
+        girada = original.getexif().get(0x0112, 1) != 1
+        img = ImageOps.exif_transpose(original)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        reduzida = img.width > largura_px
+        if reduzida:
+            img = img.resize((largura_px, max(1, round(img.height * largura_px / img.width))), Image.LANCZOS)
+        img.save(destino, "JPEG", quality=qualidade, optimize=True, progressive=True)
+    return formato, girada, reduzida
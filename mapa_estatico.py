@@ -0,0 +1,26 @@
+"""
+Mapa de localização do laudo (staticmap). Importado só na primeira vez que
+um mapa precisa ser desenhado; os tiles vêm do cache do app (obter_tile).
+"""
+from staticmap import StaticMap, CircleMarker
+
+
+class StaticMapCache(StaticMap):
+    """StaticMap que resolve os tiles por obter_tile(z, x, y) em vez de baixar sempre."""
+
+    def __init__(self, width, height, obter_tile, **kwargs):
+        # a "URL" só carrega z/x/y até o get() abaixo
+        super().__init__(width, height, url_template="tile:{z}/{x}/{y}", **kwargs)
+        self.obter_tile = obter_tile
+
+    def get(self, url, **kwargs):
+        z, x, y = (int(v) for v in url[len("tile:"):].split("/"))
+        dados = self.obter_tile(z, x, y)
+        return (200, dados) if dados else (404, None)
+
+
+def desenhar_mapa(lat, lon, largura, altura, zoom, obter_tile, destino):
+    """Desenha o mapa com marcador em (lat, lon) e grava o PNG em destino."""
+    m = StaticMapCache(largura, altura, obter_tile)
+    m.add_marker(CircleMarker((lon, lat), 'red', 12))
+    m.render(zoom=zoom).save(destino, "PNG")
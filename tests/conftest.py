@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+# o app lê a pasta de trabalho na importação: aponta para uma pasta própria
+# antes de qualquer teste importar app (processos filhos herdam o ambiente)
+os.environ.setdefault("LAUDOS_TMP_DIR", tempfile.mkdtemp(prefix="laudos-testes-"))
+os.environ.pop("GITHUB_TOKEN", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_modulo  # noqa: E402
+
+try:
+    import flask_sqlalchemy  # noqa: F401
+except ImportError:
+    pass
+else:
+    app_modulo._banco()  # o Flask só aceita init_app antes da primeira requisição de qualquer teste
+
+
+class GitHubFalso:
+    """Repositório em memória no lugar de ler_github_texto / envio em lote."""
+
+    def __init__(self):
+        self.arquivos = {}
+        self.fora_do_ar = False
+        self.commits = []
+
+    def ler(self, remote_path):
+        if self.fora_do_ar:
+            return None
+        texto = self.arquivos.get(remote_path, b"").decode("utf-8")
+        if not texto.strip() or texto.strip() == "[]":
+            app_modulo._remoto_vazio[remote_path] = time.monotonic()
+        return texto
+
+    def enviar(self, arquivos, message):
+        for remote_path, conteudo in arquivos:
+            if not isinstance(conteudo, (bytes, bytearray)):
+                with open(conteudo, "rb") as f:
+                    conteudo = f.read()
+            self.arquivos[remote_path] = bytes(conteudo)
+        self.commits.append(message)
+        return True
+
+    def json(self, remote_path):
+        return json.loads(self.arquivos.get(remote_path) or b"[]")
+
+    def journal(self, remote_path=app_modulo.GITHUB_JOURNAL_PATH):
+        return app_modulo._ler_journal(self.arquivos.get(remote_path, b"").decode("utf-8"))
+
+
+def limpar_pasta_de_trabalho():
+    """Apaga os stores do /tmp de testes e esquece o estado em memória."""
+    pasta = app_modulo.TMP_DIR
+    for nome in os.listdir(pasta):
+        caminho = os.path.join(pasta, nome)
+        if os.path.isfile(caminho):
+            os.remove(caminho)
+    app_modulo._remoto_vazio.clear()
+    app_modulo._indexar_atendimentos([], None, 0)
+    app_modulo._store["retentar_github"] = 0
+
+
+@pytest.fixture
+def github(monkeypatch):
+    limpar_pasta_de_trabalho()
+    falso = GitHubFalso()
+    monkeypatch.setattr(app_modulo, "ler_github_texto", falso.ler)
+    monkeypatch.setattr(app_modulo, "enviar_ou_enfileirar_github_lote", falso.enviar)
+    yield falso
+    limpar_pasta_de_trabalho()
+
+
+@pytest.fixture
+def app():
+    return app_modulo
@@ -0,0 +1,85 @@
+import json
+from collections import OrderedDict
+
+import pytest
+
+ATUAL = "data/alertas.jsonl"
+
+
+@pytest.fixture
+def alertas(app, github, monkeypatch):
+    monkeypatch.setattr(app, "ALERTAS_PARTE_MAX_KB", 1)
+    _reiniciar(app)
+    yield
+    _reiniciar(app)
+
+
+def _reiniciar(app):
+    from conftest import limpar_pasta_de_trabalho
+    limpar_pasta_de_trabalho()
+    app._alertas.update(carregado=False, arquivo=None, fim=0, retentar_github=0,
+                        indice=OrderedDict(), recentes=OrderedDict())
+
+
+def _remoto(github):
+    """Histórico completo no GitHub: partes seladas + trecho atual, sem cabeçalhos."""
+    linhas = []
+    for caminho in sorted(github.arquivos):
+        if caminho.startswith("data/alertas/"):
+            linhas += github.arquivos[caminho].decode("utf-8").splitlines()
+    linhas += github.arquivos[ATUAL].decode("utf-8").splitlines()[1:]
+    return linhas
+
+
+def test_envio_leva_so_o_trecho_atual_e_sela_partes(app, github, alertas):
+    ids = [app.salvar_alerta({"titulo": f"Alerta {i}", "mensagem": "x" * 300}) for i in range(12)]
+
+    assert "data/alertas/parte-0001.jsonl" in github.arquivos
+    assert len(github.arquivos[ATUAL]) <= 1024 + 400
+    with open(app.ALERTAS_FILE, encoding="utf-8") as f:
+        assert _remoto(github) == f.read().splitlines()
+
+    _reiniciar(app)
+    assert [a["id"] for a in app.carregar_alertas_enviados()] == ids
+    app.salvar_alerta({"titulo": "Depois do restart"})
+    assert len(_remoto(github)) == len(ids) + 1
+
+
+def test_historico_remoto_ilegivel_nao_e_sobrescrito(app, github, alertas):
+    github.arquivos[ATUAL] = b'{"registro": "alerta", "id": "antigo"}\n'
+    github.fora_do_ar = True
+    app.salvar_alerta({"titulo": "Novo"})
+    assert github.arquivos[ATUAL] == b'{"registro": "alerta", "id": "antigo"}\n'
+
+
+def test_historico_remoto_lido_depois_de_falhar_na_subida(app, github, alertas, monkeypatch):
+    monkeypatch.setattr(app, "GITHUB_RETENTAR_LEITURA", 0)
+    github.arquivos[ATUAL] = b'{"registro": "alerta", "id": "antigo"}\n'
+    github.fora_do_ar = True
+    app.carregar_alertas_enviados()  # aquecimento da subida: leitura falha
+    app.salvar_alerta({"id": "offline", "titulo": "Com o GitHub fora"})
+    assert github.arquivos[ATUAL] == b'{"registro": "alerta", "id": "antigo"}\n'
+
+    github.fora_do_ar = False
+    app.salvar_alerta({"id": "online", "titulo": "Com o GitHub de volta"})
+    assert [json.loads(linha)["id"] for linha in _remoto(github)] == ["antigo", "offline", "online"]
+    assert [a["id"] for a in app.carregar_alertas_enviados()] == ["antigo", "offline", "online"]
+
+
+def test_alerta_vai_para_os_grupos_das_regioes_citadas(app, tmp_path, monkeypatch):
+    arquivo = tmp_path / "telefones_alerta.json"
+    arquivo.write_text(json.dumps([
+        "6500",                                            # recebe todos os alertas
+        {"numero": "6501", "regioes": ["Centro", "CPA 2"]},
+        {"numero": "6502", "bairros": "Coxipó"},
+        {"numero": "6501", "regioes": ["Porto"]},           # repetido: uma mensagem só
+    ]), encoding="utf-8")
+    monkeypatch.setattr(app, "TELEFONES_ALERTA_FILE", str(arquivo))
+    monkeypatch.setattr(app, "_grupos_alerta", {"versao": None, "todos": [], "geral": [], "por_regiao": {}})
+
+    assert app.telefones_para_alerta({"regiao": "centro"}) == ["6500", "6501"]
+    assert sorted(app.telefones_para_alerta({"regiao": "Coxipo e CPA 2"})) == ["6500", "6501", "6502"]
+    assert app.telefones_para_alerta({"regiao": "PORTO"}) == ["6500", "6501"]
+    # região sem grupo cadastrado (ou sem região): todos
+    assert sorted(app.telefones_para_alerta({"regiao": "Planalto"})) == ["6500", "6501", "6502"]
+    assert sorted(app.telefones_para_alerta({})) == ["6500", "6501", "6502"]
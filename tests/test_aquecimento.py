@@ -0,0 +1,18 @@
+def test_pronto_responde_503_antes_do_aquecimento(app, github, monkeypatch):
+    monkeypatch.setattr(app, "_prontidao", {"pronto": False, "inicio": None, "duracao_ms": None, "etapas": {}})
+    monkeypatch.setattr(app, "ETAPAS_SEGUNDO_PLANO", {})
+    cliente = app.app.test_client()
+
+    assert cliente.get("/pronto").status_code == 503
+
+    app.aquecer()
+    resposta = cliente.get("/pronto")
+    assert resposta.status_code == 200
+    assert resposta.get_json()["etapas"]["atendimentos"]["ok"]
+
+
+def test_processo_do_pool_parseia_os_modelos_na_subida(app, monkeypatch):
+    monkeypatch.setattr(app, "_modelos", {})
+    app._iniciar_processo_render()
+    disponiveis = [m for m in app.MODELOS_LAUDO.values() if app.os.path.exists(app._caminho_modelo(m))]
+    assert sorted(app._modelos) == sorted(app._caminho_modelo(m) for m in disponiveis)
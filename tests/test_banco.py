@@ -0,0 +1,48 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("flask_sqlalchemy")
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def banco(app, github, monkeypatch):
+    # o laudos.db de um teste anterior foi apagado junto com o /tmp de testes
+    with app.app.app_context():
+        app._banco().db.engine.dispose()
+    monkeypatch.setattr(app, "_sql_pronto", False)
+    app._garantir_banco()
+    return app
+
+
+def test_importacao_mantem_numeros_repetidos_do_historico(banco):
+    with open(os.path.join(RAIZ, "data", "atendimentos.json"), encoding="utf-8") as f:
+        lista = json.load(f)
+    numeros = [a["numero_laudo"] for a in lista]
+    assert len(set(numeros)) < len(numeros)  # o histórico real tem repetidos
+
+    importados, ignorados = banco.importar_atendimentos(lista, substituir=True)
+
+    assert (importados, ignorados) == (len(lista), [])
+    assert [a["numero_laudo"] for a in banco.exportar_atendimentos_json()] == numeros
+
+
+def test_operacoes_no_banco_seguem_o_journal(banco):
+    lista = [{"numero_laudo": "1", "bairro": "a"}, {"numero_laudo": "1", "bairro": "b"},
+             {"numero_laudo": "2", "bairro": "c"}]
+    banco.importar_atendimentos(lista, substituir=True)
+    ops = [
+        {"op": "insert", "registro": {"numero_laudo": "1", "bairro": "x"}},
+        {"op": "update", "numero_laudo": "2", "registro": {"numero_laudo": "3", "bairro": "y"}},
+        {"op": "delete", "numero_laudo": "9"},
+    ]
+    for op in ops:
+        banco.sql_aplicar_operacao(op)
+
+    esperado = banco.reconstruir_atendimentos(lista, ops)
+    obtido = banco.exportar_atendimentos_json()
+    assert [(a["numero_laudo"], a["bairro"]) for a in obtido] == \
+        [(a["numero_laudo"], a["bairro"]) for a in esperado]
@@ -0,0 +1,38 @@
+import os
+
+import mapa_estatico
+
+
+def _tamanho_da_pasta(pasta):
+    return sum(os.path.getsize(os.path.join(raiz, nome))
+               for raiz, _, nomes in os.walk(pasta) for nome in nomes
+               if not nome.startswith(".") and not nome.endswith(".tmp"))
+
+
+def test_limite_vale_para_a_pasta_e_nao_por_processo(app, tmp_path):
+    # duas instâncias na mesma pasta = dois workers, cada um com a sua contagem
+    a = app.CacheDiscoLRU(str(tmp_path), 10 * 1024)
+    b = app.CacheDiscoLRU(str(tmp_path), 10 * 1024)
+    for i in range(6):
+        a.guardar(f"a/{i}", b"x" * 1024)
+        b.guardar(f"b/{i}", b"x" * 1024)
+
+    assert _tamanho_da_pasta(tmp_path) <= 10 * 1024
+    assert b.caminho_se_existir("b/5") is not None
+    assert a.caminho_se_existir("b/5") is not None  # gravado pelo "outro processo"
+
+
+def test_mapa_do_laudo_sobrevive_ao_descarte_do_cache(app, monkeypatch, tmp_path):
+    def desenhar(lat, lon, largura, altura, zoom, obter_tile, destino):
+        with open(destino, "wb") as f:
+            f.write(b"png")
+
+    monkeypatch.setattr(mapa_estatico, "desenhar_mapa", desenhar)
+    for tentativa in range(2):  # desenhando e vindo do cache
+        copia = str(tmp_path / f"mapa{tentativa}.png")
+        assert app.gerar_mapa("-15.6", "-56.1", copia) == copia
+        os.remove(app._cache_mapas.caminho(app._chave_mapa("-15.6", "-56.1")[0]))
+        with open(copia, "rb") as f:
+            assert f.read() == b"png"
+        if tentativa == 0:
+            app.gerar_mapa("-15.6", "-56.1")  # volta para o cache
@@ -0,0 +1,20 @@
+def test_contadores_incrementais_batem_com_a_recontagem(app, github):
+    app.carregar_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "1", "origem": "Chuvas", "grau_risco": "alto",
+                            "bairro": "Centro", "data_vistoria": "2025-01-10"})
+    app.registrar_inclusao({"numero_laudo": "2", "origem": "Incêndio", "grau_risco": "baixo",
+                            "bairro": "centro ", "data_vistoria": "05/02/2025"})
+    app.resumo_dashboard()  # monta os contadores
+    carga = app._store["carga"]
+
+    app.registrar_inclusao({"numero_laudo": "3", "origem": "Deslizamento", "bairro": "Porto"})
+    app.registrar_edicao("1", {"numero_laudo": "1", "origem": "Chuvas", "grau_risco": "médio",
+                               "bairro": "Jardim", "data_vistoria": "2025-03-01"})
+    app.registrar_exclusao("2")
+    incremental = app.resumo_dashboard()
+    assert app._store["carga"] == carga  # só deltas: o store não foi relido
+
+    app._dashboard["carga"] = None  # força a recontagem completa
+    assert app.resumo_dashboard() == incremental
+    assert incremental["total"] == 2
+    assert incremental["bairros"] == [["Jardim", 1], ["Porto", 1]]
@@ -0,0 +1,18 @@
+def test_download_exige_login(app, github, monkeypatch):
+    chamado = []
+    monkeypatch.setattr(app, "localizar_docx", lambda *a, **k: chamado.append(a))
+    resposta = app.app.test_client().get("/download/Chuvas_05.docx")
+
+    assert resposta.status_code == 302
+    assert "/login" in resposta.headers["Location"]
+    assert chamado == []
+
+
+def test_etags_de_download_ficam_limitados(app, github, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "ETAGS_DOWNLOADS_MAX", 3)
+    app._etags_downloads.clear()
+    for i in range(5):
+        caminho = tmp_path / f"{i}.docx"
+        caminho.write_bytes(b"x" * i)
+        app._etag_arquivo(str(caminho))
+    assert len(app._etags_downloads) == 3
@@ -0,0 +1,48 @@
+import csv
+import io
+import os
+import zipfile
+
+
+def _logado(app):
+    cliente = app.app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["logado"] = True
+    return cliente
+
+
+def test_exportar_filtra_e_monta_zip_com_manifesto(app, github, monkeypatch):
+    def sem_github(remote_path):
+        raise FileNotFoundError(remote_path)
+
+    monkeypatch.setattr(app, "_resposta_github_arquivo", sem_github)
+    arquivos = {"Chuvas_E1.docx": b"laudo E1", "Chuvas_E2.docx": b"laudo E2"}
+    for nome, conteudo in arquivos.items():
+        with open(os.path.join(app.UPLOAD_FOLDER, nome), "wb") as f:
+            f.write(conteudo)
+    app.carregar_atendimentos()
+    base = {"origem": "Chuvas", "bairro": "São José", "data_vistoria": "2025-03-10"}
+    app.registrar_inclusao(dict(base, numero_laudo="E1", arquivo="Chuvas_E1.docx"))
+    app.registrar_inclusao(dict(base, numero_laudo="E2", arquivo="Chuvas_E2.docx", data_vistoria="15/03/2025"))
+    app.registrar_inclusao(dict(base, numero_laudo="E3", arquivo="Chuvas_E3.docx"))  # DOCX sumiu
+    app.registrar_inclusao(dict(base, numero_laudo="E4", arquivo="Chuvas_E4.docx", bairro="Porto"))
+    app.registrar_inclusao(dict(base, numero_laudo="E5", arquivo="Chuvas_E5.docx", data_vistoria="2025-04-01"))
+    app.registrar_inclusao(dict(base, numero_laudo="E6", arquivo="Incendio_E6.docx", origem="Incêndio"))
+    app.registrar_inclusao(dict(base, numero_laudo="E7"))  # sem DOCX
+
+    try:
+        resposta = _logado(app).get("/exportar?bairro=sao  jose&origem=CHUVAS&de=2025-03-01&ate=2025-03-31")
+        assert resposta.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(resposta.data)) as z:
+            assert sorted(z.namelist()) == ["laudos/Chuvas_E1.docx", "laudos/Chuvas_E2.docx", "manifesto.csv"]
+            assert z.read("laudos/Chuvas_E2.docx") == b"laudo E2"
+            manifesto = list(csv.DictReader(io.StringIO(z.read("manifesto.csv").decode("utf-8-sig")), delimiter=";"))
+        situacoes = {linha["numero_laudo"]: linha["situacao_zip"] for linha in manifesto}
+        assert situacoes["E1"] == situacoes["E2"] == "incluido"
+        assert situacoes["E3"].startswith("ausente")
+        assert set(situacoes) == {"E1", "E2", "E3"}
+
+        assert _logado(app).get("/exportar?bairro=Planalto").status_code == 404
+    finally:
+        for nome in arquivos:
+            os.remove(os.path.join(app.UPLOAD_FOLDER, nome))
@@ -0,0 +1,60 @@
+import os
+
+
+def _upload(app, conteudo, dono):
+    destino = app.ArquivoUploadEmDisco(app.UPLOAD_PARTES_DIR, 1024 * 1024)
+    destino.write(conteudo)
+    return destino.guardar_deduplicado(app.FOTOS_DIR, ".upload", dono)
+
+
+def test_foto_deduplicada_so_sai_quando_o_ultimo_job_termina(app):
+    # B deduplica sobre a foto de A antes de ter o arquivo de job
+    a = _upload(app, b"foto", "a" * 32)
+    b = _upload(app, b"foto", "b" * 32)
+    assert a == b
+
+    app.limpar_fotos_laudo([(2, a, "")], "a" * 32)
+    assert os.path.exists(b)
+
+    app.limpar_fotos_laudo([(2, b, "")], "b" * 32)
+    assert not os.path.exists(b)
+    assert not [n for n in os.listdir(app.FOTOS_DIR) if n.endswith(".ref")]
+
+
+def test_job_orfao_solta_as_fotos(app):
+    job_id = "e" * 32
+    caminho = _upload(app, b"orfa", job_id)
+    app._gravar_job(job_id, status="running", dono="morto", fotos=[caminho])
+    try:
+        assert app.falhar_jobs_orfaos() == 1
+        assert not os.path.exists(caminho)
+    finally:
+        os.remove(app._caminho_job(job_id))
+
+
+def test_foto_grande_reduzida_para_a_largura_de_impressao(app, tmp_path):
+    from PIL import Image
+    original = str(tmp_path / "original.jpg")
+    Image.effect_noise((2000, 1500), 64).convert("RGB").save(original, "JPEG", quality=95)
+    destino = str(tmp_path / "foto.jpg")
+
+    antes, depois = app.otimizar_foto(original, destino)
+
+    assert depois < antes
+    with Image.open(destino) as img:
+        assert img.format == "JPEG"
+        assert img.size == (app._largura_foto_px(), round(1500 * app._largura_foto_px() / 2000))
+
+
+def test_jpeg_pequeno_fica_como_esta(app, tmp_path):
+    from PIL import Image
+    caminho = str(tmp_path / "leve.jpg")
+    # mesmos parâmetros da otimização: regravar não deixaria menor
+    Image.new("RGB", (200, 150), "white").save(caminho, "JPEG", quality=app.FOTO_QUALIDADE,
+                                                optimize=True, progressive=True)
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+
+    assert app.otimizar_foto(caminho) == (len(conteudo), len(conteudo))
+    with open(caminho, "rb") as f:
+        assert f.read() == conteudo
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+
+class RepoFalso:
+    """Só o que upload_or_update_github_file usa; o sha muda a cada gravação."""
+
+    def __init__(self, sha):
+        self.sha = sha
+        self.chamadas = []
+
+    def _gravar(self, path):
+        self.sha = f"sha-{len(self.chamadas)}"
+        return {"content": SimpleNamespace(sha=self.sha, path=path)}
+
+    def update_file(self, path, message, content, sha, branch):
+        self.chamadas.append(("update", sha))
+        if sha != self.sha:
+            raise RuntimeError("409 sha does not match")
+        return self._gravar(path)
+
+    def get_contents(self, path, ref=None):
+        self.chamadas.append(("get_contents", path))
+        return SimpleNamespace(path=path, sha=self.sha)
+
+    def create_file(self, path, message, content, branch):
+        raise AssertionError("o arquivo existe: não deveria criar")
+
+
+def test_sha_em_cache_desatualizado_cai_no_fluxo_completo(app, monkeypatch):
+    monkeypatch.setitem(app._shas_github, "data/x.json", "sha-velho")
+    repo = RepoFalso("sha-atual")  # alguém mexeu no arquivo fora do app
+
+    assert app.upload_or_update_github_file(repo, "data/x.json", b"novo", "teste")
+    assert repo.chamadas == [("update", "sha-velho"), ("get_contents", "data/x.json"), ("update", "sha-atual")]
+    assert app._shas_github["data/x.json"] == repo.sha
+
+    # com o sha certo em cache, a próxima gravação não busca o arquivo
+    repo.chamadas.clear()
+    assert app.upload_or_update_github_file(repo, "data/x.json", b"de novo", "teste")
+    assert [c[0] for c in repo.chamadas] == ["update"]
@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+
+SCRIPT = """
+import json, sys
+import app
+cliente = app.app.test_client()
+cliente.get("/login")
+print(json.dumps({"modulos": app.MODULOS_PESADOS, "carregados": [m for m in app.MODULOS_PESADOS if m in sys.modules]}))
+"""
+
+
+def test_import_do_app_nao_carrega_a_pilha_pesada(app):
+    # interpretador limpo: o processo do pytest já importou boa parte destes módulos
+    ambiente = {k: v for k, v in os.environ.items() if k != "ARMAZENAMENTO"}  # sqlite importa o banco na subida
+    resultado = subprocess.run([sys.executable, "-c", SCRIPT], cwd=os.path.dirname(app.__file__), env=ambiente,
+                               check=True, capture_output=True, text=True)
+    dados = json.loads(resultado.stdout.strip().splitlines()[-1])
+    assert "docxtpl" in dados["modulos"] and "github" in dados["modulos"]
+    assert dados["carregados"] == []
@@ -0,0 +1,40 @@
+import json
+import os
+
+
+def _gravar_job(app, job_id, **campos):
+    with open(app._caminho_job(job_id), "w", encoding="utf-8") as f:
+        json.dump(dict(id=job_id, **campos), f)
+
+
+def test_laudo_repetido_volta_400_com_a_mensagem(app, github):
+    app.carregar_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "R1"})
+    cliente = app.app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["logado"] = True
+
+    resposta = cliente.post("/chuvas", data={"numero_laudo": "R1"})
+    assert resposta.status_code == 400
+    assert "Já existe um laudo com o número R1" in resposta.get_data(as_text=True)
+
+    resposta = cliente.post("/chuvas", data={"numero_laudo": "R1"}, headers={"Accept": "application/json"})
+    assert resposta.status_code == 400
+    assert resposta.get_json() == {"erro": "Já existe um laudo com o número R1"}
+
+
+def test_jobs_de_processo_morto_viram_falha(app, github):
+    vivo = app.TravaProcesso(os.path.join(app.JOBS_DIR, "dono-vivo.lock"))
+    vivo.acquire()
+    try:
+        _gravar_job(app, "a" * 32, status="running", dono="morto")
+        _gravar_job(app, "b" * 32, status="queued")
+        _gravar_job(app, "c" * 32, status="running", dono="vivo")
+        _gravar_job(app, "d" * 32, status="done", dono="morto")
+
+        assert app.falhar_jobs_orfaos() == 2
+        assert [app.obter_job(c * 32)["status"] for c in "abcd"] == ["failed", "failed", "running", "done"]
+    finally:
+        vivo.release()
+        for c in "abcd":
+            os.remove(app._caminho_job(c * 32))
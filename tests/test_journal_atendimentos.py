@@ -0,0 +1,77 @@
+import json
+
+JOURNAL = "data/atendimentos.journal.jsonl"
+SNAPSHOT = "data/atendimentos.json"
+
+
+def _numeros(lista):
+    return sorted(a["numero_laudo"] for a in lista)
+
+
+def _reiniciar():
+    """Simula um restart: /tmp vazio, store esquecido, GitHub intacto."""
+    from conftest import limpar_pasta_de_trabalho
+    limpar_pasta_de_trabalho()
+
+
+def _publicar(github, snapshot, operacoes):
+    github.arquivos[SNAPSHOT] = json.dumps(snapshot).encode("utf-8")
+    github.arquivos[JOURNAL] = "".join(json.dumps(op) + "\n" for op in operacoes).encode("utf-8")
+
+
+def test_restart_escrita_e_recarga_nao_perdem_o_journal_remoto(app, github):
+    _publicar(github, [{"numero_laudo": "1"}, {"numero_laudo": "2"}], [
+        {"op": "insert", "registro": {"numero_laudo": "3"}},
+        {"op": "delete", "numero_laudo": "1"},
+    ])
+    assert _numeros(app.carregar_atendimentos()) == ["2", "3"]
+
+    app.registrar_inclusao({"numero_laudo": "4"})
+    assert len(github.journal()) == 3
+
+    _reiniciar()
+    assert _numeros(app.carregar_atendimentos()) == ["2", "3", "4"]
+
+
+def test_compactacao_depois_do_restart_leva_as_operacoes_remotas(app, github, monkeypatch):
+    monkeypatch.setattr(app, "JOURNAL_COMPACTAR_A_CADA", 3)
+    _publicar(github, [{"numero_laudo": "1"}], [
+        {"op": "insert", "registro": {"numero_laudo": "2"}},
+        {"op": "insert", "registro": {"numero_laudo": "3"}},
+    ])
+    app.carregar_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "4"})
+
+    assert github.journal() == []
+    assert _numeros(github.json(SNAPSHOT)) == ["1", "2", "3", "4"]
+    _reiniciar()
+    assert _numeros(app.carregar_atendimentos()) == ["1", "2", "3", "4"]
+
+
+def test_journal_nao_vai_ao_github_sem_conferir_o_remoto(app, github):
+    github.fora_do_ar = True
+    app.carregar_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "1"})
+    assert JOURNAL not in github.arquivos
+
+    github.fora_do_ar = False
+    app.registrar_inclusao({"numero_laudo": "2"})
+    assert [op["registro"]["numero_laudo"] for op in github.journal()] == ["1", "2"]
+
+
+def test_journal_menor_que_o_remoto_nao_e_enviado(app, github):
+    _publicar(github, [{"numero_laudo": "1"}], [
+        {"op": "insert", "registro": {"numero_laudo": str(n)}} for n in (2, 3, 4)
+    ])
+    # /tmp de antes da correção: snapshot sem o journal remoto
+    app.salvar_atendimentos_local([{"numero_laudo": "1"}])
+    app.registrar_inclusao({"numero_laudo": "5"})
+    assert len(github.journal()) == 3
+
+
+def test_journal_que_encolhe_o_estado_nao_e_enviado(app, github):
+    _publicar(github, [{"numero_laudo": str(n)} for n in range(10)], [])
+    app.salvar_atendimentos_local([{"numero_laudo": "0"}], registros_github=10)
+    app.registrar_inclusao({"numero_laudo": "10"})
+    assert github.journal() == []
+    assert _numeros(app.carregar_atendimentos()) == ["0", "10"]
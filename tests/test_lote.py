@@ -0,0 +1,64 @@
+import io
+import os
+import re
+from concurrent.futures import Future
+
+
+def _render_sincrono(funcao, *args):
+    futuro = Future()
+    futuro.set_result(funcao(*args))
+    return futuro
+
+
+def test_lote_nao_sobrescreve_laudo_cadastrado_durante_o_render(app, github, monkeypatch):
+    final = os.path.join(app.UPLOAD_FOLDER, "Chuvas_L1.docx")
+
+    def renderizar(contexto, tipo, modelo_docx, imagens):
+        # outro usuário cadastra o mesmo número enquanto o lote renderiza
+        with open(final, "wb") as f:
+            f.write(b"laudo cadastrado")
+        app.registrar_inclusao({"numero_laudo": "L1", "arquivo": "Chuvas_L1.docx"})
+        tmp = os.path.join(app.UPLOAD_FOLDER, ".Chuvas_L1.docx.teste.tmp")
+        with open(tmp, "wb") as f:
+            f.write(b"laudo do lote")
+        return "Chuvas_L1.docx", tmp
+
+    monkeypatch.setattr(app, "renderizar_laudo", renderizar)
+    monkeypatch.setattr(app, "_submeter_render", _render_sincrono)
+    app.carregar_atendimentos()
+
+    job = app.gerar_laudos_em_lote([{"_linha": 2, "numero_laudo": "L1"}], "chuvas")
+
+    with open(final, "rb") as f:
+        assert f.read() == b"laudo cadastrado"
+    assert job["gerados"] == []
+    assert [e["numero_laudo"] for e in job["erros"]] == ["L1"]
+    assert not os.path.exists(os.path.join(app.UPLOAD_FOLDER, ".Chuvas_L1.docx.teste.tmp"))
+    os.remove(final)
+
+
+def _logado(app):
+    cliente = app.app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["logado"] = True
+    return cliente
+
+
+def test_lote_tem_limite_proprio_e_recusa_modelo_ausente(app, github, monkeypatch):
+    monkeypatch.setitem(app.app.config, "MAX_CONTENT_LENGTH", 2048)  # limite dos formulários comuns
+    planilha = ("Nº do Laudo;Bairro\n" + "".join(f"L{i};Centro\n" for i in range(500))).encode()
+    assert len(planilha) > 2048
+    assert "regularizacao" not in app.tipos_lote_disponiveis()  # modelo_laudo_reg.docx não está no repo
+
+    resposta = _logado(app).post("/laudos/lote", data={
+        "tipo": "regularizacao", "planilha": (io.BytesIO(planilha), "lote.csv"),
+    }, content_type="multipart/form-data")
+
+    assert resposta.status_code == 400  # não 413: passou do limite comum, não do LOTE_MAX_REQUISICAO_MB
+    assert "modelo_laudo_reg.docx" in resposta.get_json()["erro"]
+
+
+def test_formulario_do_lote_so_oferece_modelos_disponiveis(app, github):
+    html = _logado(app).get("/regularizacao").get_data(as_text=True)
+    assert re.search(r'<option value="regularizacao"[^>]*\bdisabled', html)
+    assert re.search(r'<option value="chuvas"[^>]*\bselected', html)
@@ -0,0 +1,22 @@
+import os
+import shutil
+
+
+def test_modelo_relido_so_quando_o_arquivo_muda(app, tmp_path, monkeypatch):
+    import laudo_render
+    modelo = str(tmp_path / "modelo.docx")
+    shutil.copyfile(os.path.join(app.BASE_DIR, "modelo_laudo_chuvas.docx"), modelo)
+    monkeypatch.setattr(app, "_modelos", {})
+    parseados = []
+    parsear = laudo_render.parsear_modelo
+    monkeypatch.setattr(laudo_render, "parsear_modelo", lambda caminho: parseados.append(caminho) or parsear(caminho))
+
+    primeiro = app.carregar_modelo(modelo)
+    segundo = app.carregar_modelo(modelo)
+    assert parseados == [modelo]
+    assert primeiro is not segundo  # cada chamada recebe a sua cópia
+
+    st = os.stat(modelo)
+    os.utime(modelo, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))  # modelo trocado no servidor
+    app.carregar_modelo(modelo)
+    assert parseados == [modelo, modelo]
@@ -0,0 +1,80 @@
+"""Vários processos (workers gunicorn) gravando na mesma pasta de trabalho."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("fcntl")  # TravaProcesso só trava entre processos com flock
+
+PROCESSOS = 4
+
+INCREMENTAR = """
+import os, sys, app
+trava = app.TravaProcesso(sys.argv[1] + ".lock")
+for _ in range(50):
+    with trava:
+        with open(sys.argv[1]) as f:
+            valor = int(f.read() or 0)
+        app.gravar_atomico(sys.argv[1], str(valor + 1).encode())
+"""
+
+INCLUIR = """
+import sys, app
+for j in range(15):
+    app.registrar_inclusao({"numero_laudo": f"P{sys.argv[1]}-{j}"})
+"""
+
+
+def _rodar_em_paralelo(app, script, argumentos, **env):
+    ambiente = dict(os.environ, **env)
+    filhos = [subprocess.Popen([sys.executable, "-c", script, arg], cwd=os.path.dirname(app.__file__),
+                               env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+              for arg in argumentos]
+    for filho in filhos:
+        _, erro = filho.communicate(timeout=120)
+        assert filho.returncode == 0, erro.decode()
+
+
+def test_trava_processo_serializa_processos(app, tmp_path):
+    contador = tmp_path / "contador"
+    contador.write_text("0")
+    _rodar_em_paralelo(app, INCREMENTAR, [str(contador)] * PROCESSOS)
+    assert contador.read_text() == str(50 * PROCESSOS)
+
+
+def test_inclusoes_de_varios_processos_com_compactacao(app, github):
+    app.carregar_atendimentos()  # pasta local pronta, sem GitHub nos filhos
+    _rodar_em_paralelo(app, INCLUIR, [str(i) for i in range(PROCESSOS)], JOURNAL_COMPACTAR_A_CADA="7")
+
+    numeros = sorted(a["numero_laudo"] for a in app.carregar_atendimentos())
+    assert numeros == sorted(f"P{i}-{j}" for i in range(PROCESSOS) for j in range(15))
+    assert len(app.carregar_journal_local()) < 7
+
+
+SEGURAR = """
+import fcntl, sys, time
+with open(sys.argv[1], "a") as f:
+    fcntl.flock(f, fcntl.LOCK_EX)
+    print("travado", flush=True)
+    time.sleep(0.5)
+"""
+
+
+def test_trava_processo_espera_sem_bloquear_o_worker(app, tmp_path, monkeypatch):
+    caminho = str(tmp_path / "trava.lock")
+    outro = subprocess.Popen([sys.executable, "-c", SEGURAR, caminho], stdout=subprocess.PIPE, text=True)
+    try:
+        assert outro.stdout.readline().strip() == "travado"
+        trava = app.TravaProcesso(caminho)
+        assert trava.acquire(blocking=False) is False
+
+        # com gevent, time.sleep cede a vez às outras greenlets; flock bloqueante não cederia
+        esperas = []
+        dormir = app.time.sleep
+        monkeypatch.setattr(app.time, "sleep", lambda s: esperas.append(s) or dormir(s))
+        with trava:
+            pass
+        assert esperas and max(esperas) <= app.TRAVA_ESPERA_MAX
+    finally:
+        outro.wait(timeout=10)
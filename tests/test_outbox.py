@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def outbox(app, monkeypatch):
+    """Outbox vazia, com token (para enfileirar) e sem o worker em segundo plano."""
+    monkeypatch.setenv("GITHUB_TOKEN", "teste")
+    monkeypatch.setattr(app, "_garantir_worker_github", lambda: None)
+    monkeypatch.setattr(app, "_get_github", lambda: object())
+    app._remover_pendencias(app._pendencias_outbox())
+    yield app
+    app._remover_pendencias(app._pendencias_outbox())
+
+
+def test_outbox_junta_versoes_e_repete_depois_de_falha(outbox, monkeypatch):
+    import github_sync
+    commits = []
+
+    def commit_arquivos(repo, branch, arquivos, mensagem):
+        if not commits:
+            commits.append(None)
+            raise ConnectionError("GitHub fora do ar")
+        conteudos = {}
+        for remote_path, caminho in arquivos.items():
+            with open(caminho, "rb") as f:
+                conteudos[remote_path] = f.read()
+        commits.append((conteudos, mensagem))
+        return "abc1234", {remote_path: f"sha-{remote_path}" for remote_path in arquivos}
+
+    monkeypatch.setattr(github_sync, "commit_arquivos", commit_arquivos)
+    outbox.enfileirar_github_lote([("data/a.json", b"v1")], "Atualiza a")
+    outbox.enfileirar_github_lote([("data/a.json", b"v2"), ("data/b.json", b"b")], "Atualiza a e b")
+
+    assert outbox.sincronizar_outbox() is False
+    assert len(outbox._pendencias_outbox()) == 2  # nada se perde na falha
+
+    assert outbox.sincronizar_outbox() is True
+    conteudos, mensagem = commits[-1]
+    assert conteudos == {"data/a.json": b"v2", "data/b.json": b"b"}  # um commit, só a versão mais nova
+    assert mensagem == "Sincroniza 2 arquivo(s)\n\n- Atualiza a\n- Atualiza a e b"
+    assert outbox._pendencias_outbox() == []
+    assert not [n for n in os.listdir(outbox.OUTBOX_DIR) if n.endswith(".bin")]
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+
+
+def _logado(app):
+    cliente = app.app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["logado"] = True
+    return cliente
+
+
+def test_modo_grade_recebe_so_o_cursor(app, github):
+    app.carregar_atendimentos()
+    cursor = app.cursor_atual_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "G1", "latitude": "-15.6", "longitude": "-56.1"})
+
+    novo, evento = app._evento_sse(cursor, grade=True)
+    dados = json.loads(evento.split("data: ", 1)[1])
+    assert dados == {"cursor": novo, "grade": True}
+
+    _, evento = app._evento_sse(cursor)
+    assert [a["numero_laudo"] for a in json.loads(evento.split("data: ", 1)[1])["alterados"]] == ["G1"]
+
+    cliente = _logado(app)
+    resposta = cliente.get(f"/painel_dados?since={cursor}&grade=1")
+    assert resposta.get_json() == {"cursor": novo, "grade": True}
+
+
+def test_stream_acorda_com_escrita_de_outro_worker(app, github, monkeypatch):
+    monkeypatch.setattr(app, "SSE_VERIFICAR", 0.05)
+    app.carregar_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "W1"})
+    cursor = app.cursor_atual_atendimentos()
+    with app._hub_cond:
+        app._hub_assinantes += 1
+        app._garantir_vigia()
+    try:
+        # outro worker gunicorn = outro processo gravando nos mesmos arquivos
+        subprocess.run([sys.executable, "-c", "import app; app.registrar_inclusao({'numero_laudo': 'W2'})"],
+                       cwd=os.path.dirname(app.__file__), check=True, capture_output=True)
+        assert app.aguardar_alteracao(cursor, 10)
+
+        _, evento = app._evento_sse(cursor)
+        assert "W2" in evento
+    finally:
+        with app._hub_cond:
+            app._hub_assinantes -= 1
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+
+
+def _logado(app):
+    cliente = app.app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["logado"] = True
+    return cliente
+
+
+def test_cursor_estavel_com_github_fora_do_ar(app, github, monkeypatch):
+    leituras = []
+    ler = github.ler
+    monkeypatch.setattr(app, "ler_github_texto", lambda caminho: leituras.append(caminho) or ler(caminho))
+    github.fora_do_ar = True
+
+    cursor = app.cursor_atual_atendimentos()
+    tentativas = len(leituras)
+    assert app.cursor_atual_atendimentos() == cursor
+    assert len(leituras) == tentativas  # sem nova tentativa antes de GITHUB_RETENTAR_LEITURA
+
+    resposta = _logado(app).get("/painel_dados", headers={"If-None-Match": f'W/"{cursor}"'})
+    assert resposta.status_code == 304
+
+
+def _em_outro_worker(app, codigo):
+    resultado = subprocess.run([sys.executable, "-c", f"import app\n{codigo}"], cwd=os.path.dirname(app.__file__),
+                               check=True, capture_output=True, text=True)
+    return resultado.stdout.strip().splitlines()[-1] if resultado.stdout.strip() else None
+
+
+def test_cursor_vale_em_qualquer_worker(app, github):
+    app.carregar_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "C1"})
+    cursor = app.cursor_atual_atendimentos()
+    assert _em_outro_worker(app, "print(app.cursor_atual_atendimentos())") == cursor
+
+    # escrita do outro worker: aqui vira delta, não recarga completa
+    _em_outro_worker(app, "app.registrar_inclusao({'numero_laudo': 'C2'})")
+    novo = app.cursor_atual_atendimentos()
+    assert novo != cursor
+    alterados, removidos = app.alteracoes_desde(cursor)
+    assert [a["numero_laudo"] for a in alterados] == ["C2"] and removidos == []
+    assert _em_outro_worker(app, "print(app.cursor_atual_atendimentos())") == novo
+
+
+def test_since_devolve_so_o_delta_e_etag_atual_da_304(app, github):
+    app.carregar_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "D1", "bairro": "Centro"})
+    app.registrar_inclusao({"numero_laudo": "D2", "bairro": "Centro"})
+    cliente = _logado(app)
+    cursor = cliente.get("/painel_dados").headers["X-Cursor"]
+
+    app.registrar_edicao("D1", {"numero_laudo": "D1", "bairro": "Vila Nova"})
+    app.registrar_exclusao("D2")
+    app.registrar_inclusao({"numero_laudo": "D3"})
+    resposta = cliente.get(f"/painel_dados?since={cursor}")
+    dados = resposta.get_json()
+    assert dados["completo"] is False
+    assert sorted((a["numero_laudo"], a.get("bairro")) for a in dados["alterados"]) == [("D1", "Vila Nova"), ("D3", None)]
+    assert dados["removidos"] == ["D2"]
+    assert dados["cursor"] == resposta.headers["X-Cursor"] != cursor
+
+    assert cliente.get("/painel_dados", headers={"If-None-Match": resposta.headers["ETag"]}).status_code == 304
+    assert cliente.get("/painel_dados?since=outra.0").get_json()["completo"] is True
+
+
+def test_stream_retoma_do_last_event_id(app, github):
+    app.carregar_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "S1"})
+    cursor = app.cursor_atual_atendimentos()
+    app.registrar_inclusao({"numero_laudo": "S2"})  # chegou com o navegador desconectado
+
+    resposta = _logado(app).get("/painel_stream", headers={"Last-Event-ID": cursor}, buffered=False)
+    try:
+        partes = iter(resposta.response)
+        assert next(partes).startswith(b"retry:")
+        evento = next(partes).decode("utf-8")
+    finally:
+        resposta.close()
+
+    linhas = dict(linha.split(": ", 1) for linha in evento.strip().split("\n"))
+    assert linhas["id"] == app.cursor_atual_atendimentos()
+    dados = json.loads(linhas["data"])
+    assert dados["completo"] is False
+    assert [a["numero_laudo"] for a in dados["alterados"]] == ["S2"]
@@ -0,0 +1,20 @@
+import pytest
+
+
+def test_semear_recusa_os_servidores_do_osm(app, monkeypatch):
+    monkeypatch.delenv("TILE_SOURCE", raising=False)
+    with pytest.raises(ValueError):
+        app.semear_tiles()
+
+    monkeypatch.setenv("TILE_SOURCE", "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
+    monkeypatch.setattr(app, "TILE_SOURCE", "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
+    with pytest.raises(ValueError):
+        app.semear_tiles()
+
+
+def test_semear_com_origem_propria(app, monkeypatch, tmp_path):
+    monkeypatch.setenv("TILE_SOURCE", str(tmp_path))
+    monkeypatch.setattr(app, "TILE_SOURCE", str(tmp_path))
+    monkeypatch.setattr(app, "_fetcher_tiles", lambda z, x, y: None)
+    ja, baixados, falhas = app.semear_tiles(bbox=(-56.1, -15.61, -56.09, -15.6))
+    assert baixados == 0 and falhas > 0
@@ -0,0 +1,80 @@
+import pytest
+
+
+class RespostaFalsa:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = "" if status_code < 400 else f"erro {status_code}"
+
+    def json(self):
+        return {"messages": [{"id": "wamid.teste"}]}
+
+
+class SessaoFalsa:
+    """Responde com a sequência dada (a última se repete)."""
+
+    def __init__(self, *respostas):
+        self.respostas = list(respostas)
+        self.posts = 0
+
+    def post(self, url, json=None, timeout=None):
+        self.posts += 1
+        return self.respostas.pop(0) if len(self.respostas) > 1 else self.respostas[0]
+
+
+@pytest.fixture
+def envio(app, tmp_path, monkeypatch):
+    """Destinatário "5511" num envio em memória: (enviar(sessão) -> estado final, esperas)."""
+    esperas = []
+    monkeypatch.setattr(app, "_balde_whatsapp", app.BaldeTokens(1000, str(tmp_path / "balde")))
+    monkeypatch.setattr(app.time, "sleep", esperas.append)
+    monkeypatch.setattr(app, "registrar_entrega_alerta", lambda envio_id, numero: None)
+    monkeypatch.setitem(app._envios_whatsapp, "e1", {
+        "alerta": {}, "criado_em": "", "destinatarios": {"5511": {"status": "pendente", "tentativas": 0}},
+    })
+
+    def enviar(sessao):
+        monkeypatch.setattr(app, "_sessao_whatsapp", sessao)
+        app._enviar_whatsapp_destinatario("e1", "5511", "texto")
+        return app._envios_whatsapp["e1"]["destinatarios"]["5511"]
+
+    return enviar, esperas
+
+
+def test_429_espera_o_retry_after_e_repete(envio):
+    enviar, esperas = envio
+    sessao = SessaoFalsa(RespostaFalsa(429, {"Retry-After": "7"}), RespostaFalsa(200))
+    estado = enviar(sessao)
+    assert (estado["status"], estado["tentativas"], estado["message_id"]) == ("enviado", 2, "wamid.teste")
+    assert esperas == [7.0]
+
+
+def test_desiste_depois_do_maximo_de_tentativas(app, envio):
+    enviar, esperas = envio
+    sessao = SessaoFalsa(RespostaFalsa(503))
+    estado = enviar(sessao)
+    assert sessao.posts == app.WHATSAPP_TENTATIVAS
+    assert (estado["status"], estado["http_status"]) == ("falhou", 503)
+    assert len(esperas) == app.WHATSAPP_TENTATIVAS - 1
+
+
+def test_erro_4xx_falha_sem_repetir(envio):
+    enviar, esperas = envio
+    sessao = SessaoFalsa(RespostaFalsa(400), RespostaFalsa(200))
+    estado = enviar(sessao)
+    assert sessao.posts == 1
+    assert (estado["status"], estado["http_status"]) == ("falhou", 400)
+    assert esperas == []
+
+
+def test_balde_e_compartilhado_entre_processos(app, tmp_path, monkeypatch):
+    # duas instâncias no mesmo arquivo = dois workers: a rajada de 1 vale para os dois
+    caminho = str(tmp_path / "balde")
+    esperas = []
+    dormir = app.time.sleep
+    monkeypatch.setattr(app.time, "sleep", lambda s: esperas.append(s) or dormir(s))
+    app.BaldeTokens(20, caminho, capacidade=1).consumir()
+    assert esperas == []
+    app.BaldeTokens(20, caminho, capacidade=1).consumir()
+    assert esperas and sum(esperas) <= 0.1
@@ -0,0 +1,42 @@
+"""
+Cliente do WhatsApp Cloud API (requests). Importado pelo app só no
+primeiro disparo de alerta.
+"""
+import requests
+
+ErroRede = requests.RequestException
+
+
+def nova_sessao(token, conexoes):
+    """Sessão keep-alive com até 'conexoes' conexões simultâneas por host."""
+    sessao = requests.Session()
+    adaptador = requests.adapters.HTTPAdapter(pool_maxsize=conexoes)
+    sessao.mount("https://", adaptador)
+    sessao.mount("http://", adaptador)
+    sessao.headers.update({
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json",
+    })
+    return sessao
+
+
+def enviar_texto(sessao, url, numero, texto, timeout=10):
+    """POST de uma mensagem de texto. Devolve a resposta; falha de rede levanta ErroRede."""
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": numero,
+        "type": "text",
+        "text": {
+            "preview_url": False,
+            "body": texto
+        }
+    }
+    return sessao.post(url, json=payload, timeout=timeout)
+
+
+def id_mensagem(resp):
+    """id da mensagem aceita pela API (None se a resposta não trouxer)."""
+    try:
+        return resp.json()["messages"][0]["id"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None